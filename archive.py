@@ -0,0 +1,323 @@
+"""
+Single-file secrets storage: every recording is appended to one pack file
+and a compact index records where each one lives. Playback reads slices of
+the pack through mmap, so startup and per-play cost don't grow with the
+number of secrets the way thousands of small WAV files on an SD card do.
+
+    python archive.py list   secrets.pack
+    python archive.py import secrets.pack a.wav b.wav ...
+    python archive.py export secrets.pack out_dir [name ...]
+    python archive.py delete secrets.pack name ...
+    python archive.py compact secrets.pack     # with the installation stopped
+
+The pack is append-only: deleting a secret (retention, dedup, the CLI)
+only writes a tombstone to the index, and its audio keeps taking up space
+in the pack until compact rewrites the pack without it.
+"""
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import wave
+
+import catalog
+
+PACK_NAME = "secrets.pack"
+INDEX_SUFFIX = ".idx"
+COMPACT_SUFFIX = ".compact"   # pack and index being rewritten by compact()
+
+# Pack record: magic, name length, rate, channels, sample width, mtime,
+# PCM length; followed by the UTF-8 name and then the PCM bytes.
+_RECORD = struct.Struct("<4sHIHHdQ")
+_MAGIC = b"WWPK"
+# Index record: op ('A'dd / 'D'elete), data offset, PCM length, rate,
+# channels, sample width, mtime, name length; followed by the name.
+_INDEX = struct.Struct("<cQQIHHdH")
+
+
+class PackedEntry(catalog.SecretEntry):
+    mapped = True
+
+    def __init__(self, archive, name, offset, length, rate, channels, sampwidth, mtime):
+        super().__init__(name, f"{archive.pack_path}#{name}", length, mtime,
+                         rate, channels, sampwidth, length // (channels * sampwidth))
+        self.archive = archive
+        self.offset = offset
+
+    def read_pcm(self):
+        return self.archive.read(self)
+
+
+class SecretsArchive(catalog.SecretsCatalog):
+    """
+    A SecretsCatalog whose entries live in an append-only pack file instead
+    of one WAV per secret. add(path) moves a finished WAV into the pack;
+    delete(name) appends a tombstone, and compact() reclaims the space of
+    deleted secrets. Everything else (choice(), names(), listeners) behaves
+    like the directory catalog.
+    """
+
+    def __init__(self, pack_path, canonical=None):
+        # The pack index already is the snapshot.
+        super().__init__(os.path.dirname(pack_path) or ".", snapshot=False)
+        self.pack_path = pack_path
+        # (rate, channels, sampwidth) imports are converted to, if given
+        self.canonical = canonical
+        self.index_path = pack_path + INDEX_SUFFIX
+        self._write_lock = threading.Lock()
+        self._mm = None
+
+    # -- catalog API -------------------------------------------------------
+
+    def start(self):
+        if self._running:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.exists(self.pack_path):
+            open(self.pack_path, 'ab').close()
+        self._load_index()
+        self._remap()
+        self._running = True
+        print(f"[ARCHIVE] {len(self)} secrets in {self.pack_path}")
+
+    def stop(self):
+        self._running = False
+
+    def scan(self):
+        self._load_index()
+
+    def add(self, path, remove_source=True):
+        """
+        Append a WAV file to the pack (converted to the canonical format in
+        memory if needed; the file itself is left as it is) and, by
+        default, delete the loose file.
+        """
+        name = os.path.basename(path)
+        with self._write_lock:
+            if not os.path.exists(path):
+                return self.get(name)     # someone else already imported it
+            with wave.open(path, 'rb') as wf:
+                params = (wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+                pcm = wf.readframes(wf.getnframes())
+            if self.canonical is not None and params != tuple(self.canonical):
+                import ingest
+                pcm = ingest.convert_pcm(pcm, params, *self.canonical)
+                params = tuple(self.canonical)
+            entry = self._append(name, pcm, *params, os.path.getmtime(path))
+            if remove_source:
+                os.remove(path)
+        self._put(entry)
+        return entry
+
+    def refresh(self, name):
+        return self.get(name)
+
+    def delete(self, name):
+        entry = self.get(name)
+        if entry is None:
+            return False
+        with self._write_lock:
+            self._write_index(b'D', entry.offset, entry.size, entry.rate,
+                              entry.channels, entry.sampwidth, time.time(), name)
+        self.remove(name)
+        return True
+
+    def compact(self):
+        """
+        Rewrite the pack with only the live secrets and return the bytes
+        freed. Only run it while nothing else has the pack open: readers
+        of the old mapping would see the wrong audio.
+        """
+        pack_tmp = self.pack_path + COMPACT_SUFFIX
+        index_tmp = self.index_path + COMPACT_SUFFIX
+        with self._write_lock:
+            before = os.path.getsize(self.pack_path)
+            entries = sorted(self.entries(), key=lambda e: e.offset)
+            moved = []
+            with open(pack_tmp, 'wb') as pack, open(index_tmp, 'wb') as index:
+                for e in entries:
+                    raw_name = e.name.encode('utf-8')
+                    pack.write(_RECORD.pack(_MAGIC, len(raw_name), e.rate, e.channels,
+                                            e.sampwidth, e.mtime, e.size))
+                    pack.write(raw_name)
+                    offset = pack.tell()
+                    pack.write(self.read(e))
+                    index.write(_INDEX.pack(b'A', offset, e.size, e.rate, e.channels,
+                                            e.sampwidth, e.mtime, len(raw_name)))
+                    index.write(raw_name)
+                    moved.append(PackedEntry(self, e.name, offset, e.size, e.rate,
+                                             e.channels, e.sampwidth, e.mtime))
+                for f in (pack, index):
+                    f.flush()
+                    os.fsync(f.fileno())
+            # Pack first: a crash before the index follows is finished by
+            # _load_index(), which finds the new index with no new pack left.
+            self._mm = None
+            os.replace(pack_tmp, self.pack_path)
+            os.replace(index_tmp, self.index_path)
+            self._remap()
+        for entry in moved:
+            self._put(entry)
+        return before - os.path.getsize(self.pack_path)
+
+    def on_inbox_event(self, event, name, entry):
+        """Listener for a directory catalog: pull new loose WAVs into the pack."""
+        if event in ('added', 'changed') and entry is not None:
+            try:
+                self.add(entry.path)
+            except Exception as e:
+                print(f"[ARCHIVE] Could not import {entry.path}: {e}")
+
+    # -- reading -----------------------------------------------------------
+
+    def read(self, entry):
+        """Zero-copy view of an entry's PCM in the mapped pack file."""
+        mm = self._mm
+        if mm is None or entry.offset + entry.size > len(mm):
+            mm = self._remap()
+        return memoryview(mm)[entry.offset:entry.offset + entry.size]
+
+    def export(self, name, out_path):
+        entry = self.get(name)
+        if entry is None:
+            raise KeyError(name)
+        with wave.open(out_path, 'wb') as wf:
+            wf.setnchannels(entry.channels)
+            wf.setsampwidth(entry.sampwidth)
+            wf.setframerate(entry.rate)
+            wf.writeframes(self.read(entry))
+        os.utime(out_path, (entry.mtime, entry.mtime))
+        return out_path
+
+    # -- internals ---------------------------------------------------------
+
+    def _remap(self):
+        # Old maps stay alive until nothing references their views.
+        if os.path.getsize(self.pack_path) == 0:
+            self._mm = None
+            return None
+        with open(self.pack_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def _append(self, name, pcm, rate, channels, sampwidth, mtime):
+        raw_name = name.encode('utf-8')
+        with open(self.pack_path, 'ab') as f:
+            start = f.tell()
+            f.write(_RECORD.pack(_MAGIC, len(raw_name), rate, channels, sampwidth, mtime, len(pcm)))
+            f.write(raw_name)
+            f.write(pcm)
+            f.flush()
+            os.fsync(f.fileno())
+        offset = start + _RECORD.size + len(raw_name)
+        self._write_index(b'A', offset, len(pcm), rate, channels, sampwidth, mtime, name)
+        return PackedEntry(self, name, offset, len(pcm), rate, channels, sampwidth, mtime)
+
+    def _write_index(self, op, offset, length, rate, channels, sampwidth, mtime, name):
+        raw_name = name.encode('utf-8')
+        with open(self.index_path, 'ab') as f:
+            f.write(_INDEX.pack(op, offset, length, rate, channels, sampwidth, mtime, len(raw_name)))
+            f.write(raw_name)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _load_index(self):
+        pack_tmp = self.pack_path + COMPACT_SUFFIX
+        index_tmp = self.index_path + COMPACT_SUFFIX
+        if os.path.exists(index_tmp):
+            if os.path.exists(pack_tmp):
+                # compact() never got to swap anything in; the old pair stands.
+                os.remove(pack_tmp)
+                os.remove(index_tmp)
+            else:
+                os.replace(index_tmp, self.index_path)
+        elif os.path.exists(pack_tmp):
+            os.remove(pack_tmp)
+        entries = {}
+        indexed_end = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                buf = f.read()
+            pos = 0
+            while pos + _INDEX.size <= len(buf):
+                op, offset, length, rate, channels, sampwidth, mtime, name_len = _INDEX.unpack_from(buf, pos)
+                end = pos + _INDEX.size + name_len
+                if end > len(buf):
+                    break
+                name = buf[pos + _INDEX.size:end].decode('utf-8')
+                pos = end
+                if op == b'A':
+                    entries[name] = PackedEntry(self, name, offset, length, rate, channels, sampwidth, mtime)
+                    indexed_end = max(indexed_end, offset + length)
+                else:
+                    entries.pop(name, None)
+            if pos < len(buf):
+                # Torn last record; cut it so later appends stay parseable.
+                os.truncate(self.index_path, pos)
+
+        # Recover records appended after the last index write (crash between
+        # the pack fsync and the index fsync), and drop a torn tail.
+        pack_size = os.path.getsize(self.pack_path)
+        with open(self.pack_path, 'r+b') as f:
+            pos = indexed_end
+            while pos + _RECORD.size <= pack_size:
+                f.seek(pos)
+                magic, name_len, rate, channels, sampwidth, mtime, length = _RECORD.unpack(f.read(_RECORD.size))
+                offset = pos + _RECORD.size + name_len
+                if magic != _MAGIC or offset + length > pack_size:
+                    break
+                name = f.read(name_len).decode('utf-8')
+                self._write_index(b'A', offset, length, rate, channels, sampwidth, mtime, name)
+                entries[name] = PackedEntry(self, name, offset, length, rate, channels, sampwidth, mtime)
+                print(f"[ARCHIVE] Re-indexed {name}")
+                pos = offset + length
+            if pos < pack_size:
+                print(f"[ARCHIVE] Truncating {pack_size - pos} bytes of incomplete record")
+                f.truncate(pos)
+
+        entries = {n: e for n, e in entries.items() if e.offset + e.size <= pack_size}
+        with self._lock:
+            gone = [n for n in self._entries if n not in entries]
+        for name in gone:
+            self.remove(name)
+        for entry in entries.values():
+            if self.get(entry.name) is None:
+                self._put(entry)
+
+
+def _main(argv):
+    if len(argv) < 2:
+        print(__doc__)
+        return 1
+    import hal
+    import willow
+    cmd, pack_path, args = argv[0], argv[1], argv[2:]
+    arc = SecretsArchive(pack_path, (willow.RATE, willow.CHANNELS, hal.get_sample_size(willow.FORMAT)))
+    arc.start()
+    if cmd == "list":
+        for e in sorted(arc.entries(), key=lambda e: e.name):
+            print(f"{e.name}\t{e.duration:.1f}s\t{e.size} bytes")
+    elif cmd == "import":
+        for path in args:
+            arc.add(path, remove_source=False)
+            print(f"Imported {path}")
+    elif cmd == "export":
+        out_dir, names = args[0], args[1:] or arc.names()
+        os.makedirs(out_dir, exist_ok=True)
+        for name in names:
+            print(f"Exported {arc.export(name, os.path.join(out_dir, name))}")
+    elif cmd == "delete":
+        for name in args:
+            print(f"{'Deleted' if arc.delete(name) else 'Not found'}: {name}")
+    elif cmd == "compact":
+        print(f"Freed {arc.compact()} bytes")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
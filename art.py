@@ -1,86 +1,20 @@
-import threading
-import time
-import random
-import sys
-import RPi.GPIO as GPIO
-import willow
+import button
+import runtime
 
 MIN_SECRET_DELAY = 4
 MAX_SECRET_DELAY = 6
 
-GPIO_MODE = GPIO.BCM
-BUTTON_PIN = 4
-EDGE_BOUNCE_MS = 200
-
-GPIO.setwarnings(False)
-GPIO.setmode(GPIO_MODE)
-GPIO.setup(
-    BUTTON_PIN,
-    GPIO.IN,
-    pull_up_down=GPIO.PUD_DOWN
-)
-
-w = willow.Willow()
-can_record_event = threading.Event()
-can_record_event.set()
-
-def on_button(channel):
-    print("On button press: ", GPIO.input(channel))
-    if GPIO.input(channel):
-        on_button_down()
-    else:
-        on_button_up()
-
-def on_button_up():
-    w.stop_recording_secret()
-    can_record_event.set()
-
-def on_button_down():
-    print("button down")
-    can_record_event.wait()
-    print("recording")
-    can_record_event.clear()
-    t = threading.Thread(target=w.start_recording_secret, daemon=True)
-    t.start()
-
-# Try hardware interrupts
-try:
-    GPIO.remove_event_detect(BUTTON_PIN)
-except Exception:
-    pass
-
-try:
-    GPIO.add_event_detect(BUTTON_PIN, GPIO.BOTH, callback=on_button, bouncetime=EDGE_BOUNCE_MS)
-except Exception as e:
-    print(f"[GPIO] Failed to set edge detection on pin {BUTTON_PIN}: {e}")
-    print("[GPIO] If this is BCM10, disable SPI (raspi-config) or choose another GPIO pin.")
-    sys.exit(1)
-
-# -----------------------------
-# MAIN LOOP: continuous playback
-# -----------------------------
-try:
-    print("[MAIN] Starting playback loop. Press button to record.")
-    while True:
-        try:
-            w.play_random_secret()   # blocking until file finishes
-            time.sleep(random.randint(MIN_SECRET_DELAY, MAX_SECRET_DELAY))
-        except Exception as e:
-            print(f"[MAIN] Playback error: {e}")
-            time.sleep(1.0)
-
-except KeyboardInterrupt:
-    print("\n[MAIN] Interrupted. Cleaning up...")
-
-finally:
-    try:
-        GPIO.remove_event_detect(BUTTON_PIN)
-    except Exception:
-        pass
-    GPIO.cleanup()
-    try:
-        w.audio.terminate()
-    except Exception:
-        pass
-    print("[MAIN] Shutdown complete.")
-
+BUTTON_PIN = 4          # BCM numbering; button wired to 3.3V
+PRESS_DEBOUNCE_MS = 20
+RELEASE_DEBOUNCE_MS = 30
+
+if __name__ == "__main__":
+    runtime.main(
+        button.GpioButton(BUTTON_PIN, press_ms=PRESS_DEBOUNCE_MS,
+                          release_ms=RELEASE_DEBOUNCE_MS),
+        min_delay=MIN_SECRET_DELAY,
+        max_delay=MAX_SECRET_DELAY,
+        # Buttons of any extra stations (willow.STATIONS)
+        make_button=lambda pin: button.GpioButton(pin, press_ms=PRESS_DEBOUNCE_MS,
+                                                  release_ms=RELEASE_DEBOUNCE_MS),
+    )
@@ -0,0 +1,360 @@
+"""
+Benchmarks the engine on simulated hardware (see sim.py), so numbers can be
+taken on a laptop or on the Pi without a mic, speaker or button attached.
+
+    python bench.py [--speed 20] [--presses 50] [--plays 50]
+                    [--soak-hours 24] [--soak-speed 200] [--out FILE]
+    python bench.py compare before.json after.json
+    python bench.py check                     # short run for CI; exit 1 on a regression
+
+Reports press-to-capture latency, the gap between secrets and the time
+spent in each playback callback (p50/p99/max), then runs the full asyncio
+runtime through an accelerated soak and tracks RSS and CPU. Results are
+written as JSON (bench-<timestamp>.json by default). The run fails (exit
+status 1) if presses didn't turn into saved secrets or the soak's catalog
+didn't grow, since then the save/trim/loudness paths were never exercised.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+from datetime import datetime
+
+import numpy as np
+
+import sim
+
+BENCH_SECRETS = 40            # synthetic secrets in the benchmark catalog
+SECRET_SECONDS = (1.0, 12.0)  # their length range
+HOLD_SECONDS = 3.0            # how long each benchmark press is held
+PRESS_EVERY_SECONDS = 600     # soak: someone records a secret every 10 minutes
+RSS_SAMPLE_SECONDS = 3600     # soak: RSS sampled once per simulated hour
+# `check`: real time for the engine run so gaps and underruns mean something,
+# and an hour of soak at the usual speed (about a minute all told).
+CHECK_ARGS = ["--speed", "1", "--presses", "2", "--plays", "2",
+              "--soak-hours", "1", "--soak-speed", "200"]
+
+
+def _summary(values, scale=1.0):
+    if not values:
+        return {"n": 0}
+    a = np.asarray(values, dtype=np.float64) * scale
+    return {
+        "n": len(a),
+        "p50": float(np.percentile(a, 50)),
+        "p99": float(np.percentile(a, 99)),
+        "max": float(a.max()),
+        "mean": float(a.mean()),
+    }
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is the peak, in KiB on Linux; better than nothing.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _speechy_mic(rate):
+    """Looping mic input: a second of room tone, two of 'speech'."""
+    rng = np.random.default_rng(1)
+    quiet = (rng.standard_normal(rate) * 30).astype('<i2')
+    return sim.ArrayMic(np.concatenate([quiet, sim.tone(2.0, 220, rate), quiet]), loop=True)
+
+
+def _make_secrets(directory, count, rate):
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        seconds = rng.uniform(*SECRET_SECONDS)
+        level = rng.uniform(0.05, 0.6)
+        with wave.open(os.path.join(directory, f"bench_{i:03d}.wav"), 'wb') as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(rate)
+            wf.writeframes(sim.tone(seconds, rng.uniform(150, 600), rate, level).tobytes())
+
+
+@contextlib.contextmanager
+def _quiet(verbose):
+    """Silence the engine's per-play logging unless asked for it."""
+    if verbose:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _outcomes(w):
+    """Finished recordings so far, by outcome (see Willow.record_outcome)."""
+    return {outcome: w.metrics.counter("willow_recordings_total", "Recordings by outcome",
+                                       outcome=outcome).value
+            for outcome in ("saved", "empty", "no_speech", "too_short", "error")}
+
+
+def _timed(fn, samples):
+    def wrapper(*args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            samples.append(time.perf_counter() - t0)
+    return wrapper
+
+
+def _new_willow(directory, speed, keep_output=True):
+    import willow
+    willow.SECRETS_DIR = directory
+    audio = sim.SimAudio(mic=_speechy_mic(willow.RATE),
+                         sink=sim.RecordingSink(keep=keep_output), speed=speed)
+    return willow, willow.Willow(audio=audio)
+
+
+def bench_engine(directory, speed, presses, plays, verbose=False):
+    """Press latency, secret-to-secret gap and playback callback cost."""
+    with _quiet(verbose):
+        return _bench_engine(directory, speed, presses, plays)
+
+
+def _bench_engine(directory, speed, presses, plays):
+    willow, w = _new_willow(directory, speed)
+    callback_times = []
+    w.player._callback = _timed(w.player._callback, callback_times)
+    try:
+        latencies = []
+        for _ in range(presses):
+            stop = threading.Event()
+            timer = threading.Timer(HOLD_SECONDS / speed, stop.set)
+            timer.start()
+            w.start_recording_secret(time.monotonic(), stop)
+            timer.cancel()
+            latencies.append(w.capture.latency_last)
+
+        outcomes = _outcomes(w)
+
+        gaps = []
+        for _ in range(plays):
+            w.play_random_secret(silence_before=0)
+            gaps.append(w.player.gap_last)
+        play_stats = w.player.stats()
+    finally:
+        w.close()
+
+    budget = willow.CHUNK / willow.RATE
+    callback = _summary(callback_times, 1e6)
+    if callback_times:
+        callback["p99_budget_pct"] = callback["p99"] / 1e6 / budget * 100.0
+    return {
+        "presses": presses,
+        "recordings_saved": outcomes["saved"],
+        "recording_outcomes": outcomes,
+        "press_latency_ms": _summary(latencies, 1e3),
+        "gap_ms": _summary(gaps, 1e3),
+        "callback_us": callback,
+        "underruns": play_stats["underruns"],
+        "xruns": play_stats["xruns"],
+    }
+
+
+def bench_soak(directory, hours, speed, verbose=False):
+    """
+    Run the full runtime for `hours` of simulated time. At high speeds the
+    host, not the engine, limits how fast the feeder can keep up, so soak
+    underruns are only meaningful at modest speeds.
+    """
+    with _quiet(verbose):
+        return _bench_soak(directory, hours, speed)
+
+
+def _bench_soak(directory, hours, speed):
+    import runtime
+    willow, w = _new_willow(directory, speed, keep_output=False)
+    duration = hours * 3600.0
+    script = []
+    for at in np.arange(PRESS_EVERY_SECONDS, duration, PRESS_EVERY_SECONDS):
+        script += sim.ScriptedButton.hold(float(at), HOLD_SECONDS)
+    btn = sim.ScriptedButton(script, speed=speed)
+    rt = runtime.WillowRuntime(w, btn)
+
+    samples = []
+    done = threading.Event()
+
+    def sample():
+        t0 = time.monotonic()
+        while not done.wait(RSS_SAMPLE_SECONDS / speed):
+            samples.append({"sim_hours": (time.monotonic() - t0) * speed / 3600.0,
+                            "rss_mb": _rss_bytes() / 2**20})
+
+    secrets_start = len(w.catalog)
+    rss_start = _rss_bytes()
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    threading.Thread(target=sample, daemon=True).start()
+    threading.Timer(duration / speed, rt.stop).start()
+    asyncio.run(rt.run())
+    done.set()
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+    rss_end = _rss_bytes()
+
+    play = w.player.stats()
+    outcomes = _outcomes(w)
+    return {
+        "sim_hours": hours,
+        "speed": speed,
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "cpu_s_per_sim_hour": cpu / hours if hours else 0.0,
+        "rss_start_mb": rss_start / 2**20,
+        "rss_end_mb": rss_end / 2**20,
+        "rss_growth_mb": (rss_end - rss_start) / 2**20,
+        "rss_samples": samples,
+        "plays": play["gaps"],
+        "presses": w.capture.stats()["presses"],
+        "recordings_saved": outcomes["saved"],
+        "recording_outcomes": outcomes,
+        "secrets_at_start": secrets_start,
+        "secrets_at_end": len(w.catalog),
+        "underruns": play["underruns"],
+        "xruns": play["xruns"],
+        "gap_max_ms": play["gap_max_ms"],
+        "loop_lag_max_ms": rt.loop_lag_max * 1000.0,
+    }
+
+
+def run(args):
+    import willow
+    directory = tempfile.mkdtemp(prefix="willow_bench_")
+    try:
+        _make_secrets(directory, BENCH_SECRETS, willow.RATE)
+        results = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "host": platform.node(),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "config": {"chunk": willow.CHUNK, "rate": willow.RATE, "voices": willow.VOICES,
+                       "storage": willow.STORAGE, "scheduler": willow.SCHEDULER},
+            "speed": args.speed,
+        }
+        print(f"[BENCH] engine: {args.presses} presses, {args.plays} plays at {args.speed:g}x")
+        results.update(bench_engine(directory, args.speed, args.presses, args.plays, args.verbose))
+        if args.soak_hours > 0:
+            print(f"[BENCH] soak: {args.soak_hours:g} simulated hours at {args.soak_speed:g}x "
+                  f"(~{args.soak_hours * 3600 / args.soak_speed:.0f}s)")
+            results["soak"] = bench_soak(directory, args.soak_hours, args.soak_speed, args.verbose)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results["failures"] = failures(results)
+    out = args.out or f"bench-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    _print(results)
+    print(f"[BENCH] Saved {out}")
+    for problem in results["failures"]:
+        print(f"[BENCH] FAIL: {problem}")
+    return results
+
+
+def failures(results):
+    """What in a run's results says the engine misbehaved; empty if nothing."""
+    problems = []
+    if results.get("presses") and results.get("recordings_saved", 0) < results["presses"]:
+        problems.append(f"engine: {results['presses']} presses, {results.get('recordings_saved', 0)} "
+                        f"recordings saved {results.get('recording_outcomes')}")
+    if results.get("speed") == 1:
+        # At real time the host keeps up easily; any gap or underrun is ours.
+        if _get(results, ("gap_ms", "max")):
+            problems.append(f"engine: {results['gap_ms']['max']:.1f} ms gap between secrets at 1x")
+        if results.get("underruns"):
+            problems.append(f"engine: {results['underruns']} underruns at 1x")
+    soak = results.get("soak")
+    if soak is not None:
+        if soak["presses"] and not soak["recordings_saved"]:
+            problems.append(f"soak: {soak['presses']} presses, no recording saved "
+                            f"{soak['recording_outcomes']}")
+        if soak["presses"] and soak["secrets_at_end"] <= soak["secrets_at_start"]:
+            problems.append(f"soak: catalog didn't grow ({soak['secrets_at_start']} -> "
+                            f"{soak['secrets_at_end']} secrets)")
+    return problems
+
+
+# Metrics shown by the summary and by `compare`, as (label, path).
+_HEADLINE = [
+    ("press latency p50 ms", ("press_latency_ms", "p50")),
+    ("press latency p99 ms", ("press_latency_ms", "p99")),
+    ("gap p50 ms", ("gap_ms", "p50")),
+    ("gap p99 ms", ("gap_ms", "p99")),
+    ("callback p50 us", ("callback_us", "p50")),
+    ("callback p99 us", ("callback_us", "p99")),
+    ("callback p99 % budget", ("callback_us", "p99_budget_pct")),
+    ("underruns", ("underruns",)),
+    ("soak cpu s/sim hour", ("soak", "cpu_s_per_sim_hour")),
+    ("soak rss growth MB", ("soak", "rss_growth_mb")),
+    ("soak rss end MB", ("soak", "rss_end_mb")),
+    ("soak underruns", ("soak", "underruns")),
+]
+
+
+def _get(results, path):
+    for key in path:
+        if not isinstance(results, dict) or key not in results:
+            return None
+        results = results[key]
+    return results
+
+
+def _print(results):
+    for label, path in _HEADLINE:
+        value = _get(results, path)
+        if value is not None:
+            print(f"  {label:24s} {value:10.2f}")
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"  {'':24s} {'before':>10s} {'after':>10s} {'change':>9s}")
+    for label, path in _HEADLINE:
+        a, b = _get(before, path), _get(after, path)
+        if a is None or b is None:
+            continue
+        change = f"{(b - a) / a * 100.0:+8.1f}%" if a else ""
+        print(f"  {label:24s} {a:10.2f} {b:10.2f} {change:>9s}")
+
+
+def _main(argv):
+    if argv[:1] == ["check"]:
+        argv = CHECK_ARGS + ["--out", os.path.join(tempfile.gettempdir(), "bench-check.json")] + argv[1:]
+    elif argv[:1] == ["compare"]:
+        if len(argv) != 3:
+            print(__doc__)
+            return 1
+        compare(argv[1], argv[2])
+        return 0
+    parser = argparse.ArgumentParser(description="Whispering willow benchmarks")
+    parser.add_argument("--speed", type=float, default=20.0, help="simulated clock for the engine runs")
+    parser.add_argument("--presses", type=int, default=50)
+    parser.add_argument("--plays", type=int, default=50)
+    parser.add_argument("--soak-hours", type=float, default=24.0, help="0 skips the soak")
+    parser.add_argument("--soak-speed", type=float, default=200.0)
+    parser.add_argument("--out", help="JSON file for the results")
+    parser.add_argument("--verbose", action="store_true", help="show the engine's log")
+    results = run(parser.parse_args(argv))
+    return 1 if results["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,269 @@
+"""
+Button input: raw edges are timestamped in the GPIO callback and handed to
+a debounce state machine on its own thread, so the RPi.GPIO callback thread
+never blocks and never sleeps through a bounce window.
+
+    released --edge--> press pending --stable press_ms--> pressed ('press')
+    pressed --hold_ms--> held ('hold')
+    pressed/held --edge--> release pending --stable release_ms--> released ('release')
+
+Events are delivered as on_edge(kind, t) where t is the time.monotonic() of
+the first raw edge of that transition, so debounce never adds to the
+measured press-to-capture latency.
+"""
+import queue
+import sys
+import threading
+import time
+
+PRESS_DEBOUNCE_MS = 20      # contact must settle this long to count as a press
+RELEASE_DEBOUNCE_MS = 30    # ...and this long to count as a release
+HOLD_MS = 500               # pressed this long also emits 'hold'
+RECHECK_SECONDS = 0.05      # while pressed, re-read the pin in case a release edge was lost
+POLL_SECONDS = 0.005        # sampling period when edge detection is unavailable
+
+
+class Debouncer:
+    """
+    Press/hold/release state machine fed with raw (level, t) edges from any
+    thread. edge() only enqueues; timing and callbacks run on a worker
+    thread. read_level, if given, is used to catch edges the driver missed.
+    """
+
+    def __init__(self, on_edge, press_ms=PRESS_DEBOUNCE_MS, release_ms=RELEASE_DEBOUNCE_MS,
+                 hold_ms=HOLD_MS, read_level=None):
+        self.on_edge = on_edge
+        self.press_s = press_ms / 1000.0
+        self.release_s = release_ms / 1000.0
+        self.hold_s = hold_ms / 1000.0 if hold_ms else None
+        self.read_level = read_level
+
+        self._edges = queue.SimpleQueue()
+        self._thread = None
+        self._running = False
+
+        self.pressed = False       # debounced state
+        self._level = False        # latest raw level
+        self._first_t = None       # first raw edge of a pending transition
+        self._last_t = None        # latest raw edge
+        self._press_t = None
+        self._held = False
+
+        self.presses = 0
+        self.releases = 0
+        self.holds = 0
+        self.glitches = 0          # transitions that bounced back before settling
+        self.missed_edges = 0      # level changes only seen by re-reading the pin
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_last = 0.0
+
+    def start(self):
+        if self._running:
+            return
+        if self.read_level is not None:
+            self.pressed = self._level = bool(self.read_level())
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._edges.put(None)
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def edge(self, level, t=None):
+        """Record a raw edge. Safe to call from the GPIO callback thread."""
+        self._edges.put((bool(level), time.monotonic() if t is None else t))
+
+    def stats(self):
+        return {
+            "presses": self.presses,
+            "releases": self.releases,
+            "holds": self.holds,
+            "glitches": self.glitches,
+            "missed_edges": self.missed_edges,
+            "latency_last_ms": self.latency_last * 1000.0,
+            "latency_max_ms": self.latency_max * 1000.0,
+            "latency_avg_ms": (self.latency_total / self.latency_count * 1000.0)
+                              if self.latency_count else 0.0,
+        }
+
+    # -- worker thread -----------------------------------------------------
+
+    def _run(self):
+        while self._running:
+            try:
+                item = self._edges.get(timeout=self._timeout())
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                self._raw(*item)
+            self._tick(time.monotonic())
+
+    def _raw(self, level, t):
+        if level == self._level:
+            return
+        self._level = level
+        self._last_t = t
+        if self._first_t is None:
+            self._first_t = t
+
+    def _timeout(self):
+        now = time.monotonic()
+        deadlines = []
+        if self._first_t is not None:
+            deadlines.append(self._last_t + (self.release_s if self.pressed else self.press_s))
+        if self.pressed and not self._held and self.hold_s is not None:
+            deadlines.append(self._press_t + self.hold_s)
+        if self.pressed and self.read_level is not None:
+            deadlines.append(now + RECHECK_SECONDS)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - now)
+
+    def _tick(self, now):
+        if self._first_t is not None:
+            window = self.release_s if self.pressed else self.press_s
+            if now - self._last_t >= window:
+                first, self._first_t = self._first_t, None
+                if self._level != self.pressed:
+                    self._settle(self._level, first)
+                else:
+                    self.glitches += 1
+        elif self.pressed and self.read_level is not None:
+            level = bool(self.read_level())
+            if level != self._level:
+                self.missed_edges += 1
+                self._raw(level, now)
+        if (self.pressed and not self._held and self.hold_s is not None
+                and now - self._press_t >= self.hold_s):
+            self._held = True
+            self.holds += 1
+            self._emit('hold', self._press_t + self.hold_s)
+
+    def _settle(self, pressed, t):
+        self.pressed = pressed
+        if pressed:
+            self.presses += 1
+            self._press_t = t
+            self._held = False
+            self._emit('press', t)
+        else:
+            self.releases += 1
+            self._emit('release', t)
+
+    def _emit(self, kind, t):
+        latency = time.monotonic() - t
+        if kind != 'hold':
+            self.latency_last = latency
+            self.latency_total += latency
+            self.latency_count += 1
+            if latency > self.latency_max:
+                self.latency_max = latency
+        try:
+            self.on_edge(kind, t)
+        except Exception as e:
+            print(f"[BUTTON] Handler error on {kind}: {e}")
+
+
+class GpioButton:
+    """
+    A push button on an RPi.GPIO pin (BCM numbering). Uses both-edge
+    interrupts without driver debounce; if edge detection can't be enabled
+    it samples the pin from a thread instead. Either way edges go through
+    the same Debouncer.
+    """
+
+    def __init__(self, pin, pull_up=False, press_ms=PRESS_DEBOUNCE_MS,
+                 release_ms=RELEASE_DEBOUNCE_MS, hold_ms=HOLD_MS):
+        self.pin = pin
+        self.pull_up = pull_up
+        self.press_ms = press_ms
+        self.release_ms = release_ms
+        self.hold_ms = hold_ms
+        self.debouncer = None
+        self.polling = False
+        self._poll_thread = None
+
+    def start(self, on_edge):
+        import RPi.GPIO as GPIO
+        GPIO.setwarnings(False)
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(self.pin, GPIO.IN,
+                   pull_up_down=GPIO.PUD_UP if self.pull_up else GPIO.PUD_DOWN)
+        self.debouncer = Debouncer(on_edge, self.press_ms, self.release_ms, self.hold_ms,
+                                   read_level=self._read)
+        self.debouncer.start()
+        try:
+            GPIO.remove_event_detect(self.pin)
+        except Exception:
+            pass
+        try:
+            GPIO.add_event_detect(self.pin, GPIO.BOTH, callback=self._edge)
+        except Exception as e:
+            print(f"[GPIO] Edge detection unavailable on pin {self.pin} ({e}); polling instead")
+            self.polling = True
+            self._poll_thread = threading.Thread(target=self._poll, daemon=True)
+            self._poll_thread.start()
+
+    def stop(self):
+        import RPi.GPIO as GPIO
+        self.polling = False
+        try:
+            GPIO.remove_event_detect(self.pin)
+        except Exception:
+            pass
+        if self.debouncer is not None:
+            self.debouncer.stop()
+        GPIO.cleanup()
+
+    def stats(self):
+        return self.debouncer.stats() if self.debouncer else {}
+
+    def _read(self):
+        import RPi.GPIO as GPIO
+        return bool(GPIO.input(self.pin)) != self.pull_up
+
+    def _edge(self, channel):
+        # Runs on the RPi.GPIO thread: timestamp, read, enqueue, return.
+        t = time.monotonic()
+        self.debouncer.edge(self._read(), t)
+
+    def _poll(self):
+        last = self._read()
+        while self.polling:
+            level = self._read()
+            if level != last:
+                self.debouncer.edge(level)
+                last = level
+            time.sleep(POLL_SECONDS)
+
+
+class KeyboardButton:
+    """Enter toggles press/release; for running without GPIO."""
+
+    def __init__(self):
+        self._on_edge = None
+        self._down = False
+
+    def start(self, on_edge):
+        self._on_edge = on_edge
+        print("[MAIN] Press Enter to start recording, Enter again to stop.")
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def stop(self):
+        pass
+
+    def stats(self):
+        return {}
+
+    def _read(self):
+        for _ in sys.stdin:
+            self._down = not self._down
+            self._on_edge('press' if self._down else 'release', time.monotonic())
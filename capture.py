@@ -0,0 +1,286 @@
+import collections
+import itertools
+import os
+import queue
+import threading
+import time
+
+import hal
+
+PREROLL_SECONDS = 1.5   # audio kept from before the button press
+QUEUE_CHUNKS = 32       # live chunks buffered between the callback and the recorder (~4 s)
+RT_PRIORITY = 20        # SCHED_FIFO priority for the callback thread; 0 leaves it alone
+NICE = -10              # fallback when real-time scheduling isn't allowed
+EVENT_LOG = 256         # recent overflow/drop events kept for stats and recordings
+STALL_SECONDS = 2.0     # no callback for this long means the mic is gone (devices.py)
+
+
+class CaptureService:
+    """
+    Keeps a callback-mode microphone stream open for the life of the
+    process. The PortAudio callback only appends to a fixed-size ring (the
+    pre-roll) and, while a recording is running, to a bounded queue; it
+    never blocks. record() drains the pre-roll and then the live queue into
+    a sink on the caller's thread, so nothing is lost to stream-open
+    latency and disk writes never run on the audio thread.
+
+    The first callback raises its own thread to SCHED_FIFO (or at least a
+    lower nice value). Input overflows and queue drops are counted and
+    logged with their time and chunk sequence number; record() returns
+    where in the recording they landed. A chunk the queue dropped is
+    taken from the pre-roll ring when it is still there, so only audio
+    that never reached the ring is actually lost.
+    """
+
+    def __init__(self, audio, format, channels, rate, chunk,
+                 input_device=None, preroll_seconds=PREROLL_SECONDS,
+                 queue_chunks=QUEUE_CHUNKS, rt_priority=RT_PRIORITY, cpus=None):
+        self.audio = audio
+        self.format = format
+        self.channels = channels
+        self.rate = rate
+        self.chunk = chunk
+        self.input_device = input_device
+        self.preroll_chunks = max(1, int(preroll_seconds * rate / chunk))
+        self.queue_chunks = queue_chunks
+        self.rt_priority = rt_priority
+        self.cpus = cpus       # CPU numbers the callback thread is pinned to, if any
+        self.priority = None   # what _raise_priority() managed, for stats
+
+        # (seq, data) pairs. Only the callback appends; readers take a
+        # list() snapshot, which is atomic, and never iterate it directly.
+        self._ring = collections.deque(maxlen=self.preroll_chunks)
+        self._seq = itertools.count()
+        self._live = None
+        self._stream = None
+        self._last_callback = 0.0
+
+        self.overflows = 0   # PortAudio reported an input overflow
+        self.dropped = 0     # live queue was full, chunk thrown away
+        self.recovered = 0   # ...but record() found it in the ring
+        self.lost = 0        # ...and it was gone from the ring too
+        # (time.time(), kind, seq) with kind 'overflow' or 'dropped'
+        self.events = collections.deque(maxlen=EVENT_LOG)
+        self._overflow_seqs = collections.deque(maxlen=EVENT_LOG)
+        self.open_seconds = 0.0
+
+        # Press-to-first-sample latency, in seconds
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+        self.latency_total = 0.0
+        self.latency_count = 0
+
+    def start(self):
+        if self._stream is not None:
+            return
+        self.priority = None   # a new stream gets a new callback thread
+        t0 = time.monotonic()
+        self._stream = self.audio.open(
+            format=self.format,
+            channels=self.channels,
+            rate=self.rate,
+            input=True,
+            input_device_index=self.input_device,
+            frames_per_buffer=self.chunk,
+            stream_callback=self._callback,
+        )
+        self.open_seconds = time.monotonic() - t0
+        self._last_callback = time.monotonic()
+
+    def stop(self):
+        try:
+            if self._stream:
+                self._stream.stop_stream()
+                self._stream.close()
+        except Exception:
+            pass
+        self._stream = None
+
+    @property
+    def recording(self):
+        return self._live is not None
+
+    def detach(self):
+        """Let go of the device; a recording in progress just waits."""
+        self.stop()
+
+    def reattach(self, audio, input_device):
+        """Reopen on (possibly) another audio object and device index."""
+        self.stop()
+        self.audio = audio
+        self.input_device = input_device
+        self._ring.clear()   # pre-roll from before the dropout is stale
+        self.start()
+
+    def healthy(self):
+        stream = self._stream
+        if stream is None:
+            return True
+        if not stream.is_active():
+            return False
+        return time.monotonic() - self._last_callback < STALL_SECONDS
+
+    def record(self, sink, stop_event, pressed_at=None, timeout=None):
+        """
+        Feed sink(data) with the pre-roll and then live audio until
+        stop_event is set (or timeout seconds pass). pressed_at is the
+        time.monotonic() of the button press, used for the latency stat.
+        Runs on the calling thread.
+
+        Returns a summary for the recording's metadata: chunk counts and
+        the offsets (seconds into the recording) of input overflows and of
+        chunks that were lost. Lost chunks are skipped, not padded.
+        """
+        self.start()
+        if pressed_at is None:
+            pressed_at = time.monotonic()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        chunk_seconds = self.chunk / self.rate
+
+        live = queue.Queue(maxsize=self.queue_chunks)
+        self._live = live                # callback feeds it from here on
+        preroll = list(self._ring)       # may overlap live; dedup by seq
+        last_seq = -1
+        first_seq = None
+        written = 0
+        overflow_at = []
+        lost_at = []
+        recovered = 0
+        preroll_written = 0
+
+        def write(seq, data):
+            nonlocal written
+            if self._overflow_seqs and seq in list(self._overflow_seqs):
+                overflow_at.append(round(written * chunk_seconds, 3))
+            sink(data)
+            written += 1
+
+        def emit(seq, data):
+            nonlocal last_seq, first_seq, recovered
+            if seq <= last_seq:
+                return
+            if first_seq is None:
+                first_seq = seq
+            elif seq > last_seq + 1:
+                # The queue was full for a while; whatever is still in the
+                # ring goes in, the rest is noted where it would have been.
+                ring = {s: d for s, d in list(self._ring) if last_seq < s < seq}
+                for missing in range(last_seq + 1, seq):
+                    if missing in ring:
+                        write(missing, ring[missing])
+                        recovered += 1
+                    else:
+                        lost_at.append(round(written * chunk_seconds, 3))
+            write(seq, data)
+            last_seq = seq
+            if written == 1:
+                self._record_latency(time.monotonic() - pressed_at)
+
+        try:
+            for seq, data in preroll:
+                emit(seq, data)
+            preroll_written = written
+            while not stop_event.is_set():
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                try:
+                    seq, data = live.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                emit(seq, data)
+        finally:
+            self._live = None
+            # Whatever the callback queued before we detached still belongs
+            # to this recording.
+            while True:
+                try:
+                    seq, data = live.get_nowait()
+                except queue.Empty:
+                    break
+                emit(seq, data)
+            self.recovered += recovered
+            self.lost += len(lost_at)
+
+        if overflow_at or lost_at:
+            print(f"[CAPTURE] {len(overflow_at)} overflow(s), {len(lost_at)} chunk(s) lost, "
+                  f"{recovered} recovered from the pre-roll")
+        return {
+            "chunks": written,
+            "preroll_chunks": preroll_written,
+            "chunk_frames": self.chunk,
+            "overflows": overflow_at,
+            "lost_chunks": lost_at,
+            "recovered_chunks": recovered,
+            "lost_seconds": round(len(lost_at) * chunk_seconds, 3),
+        }
+
+    def stats(self):
+        return {
+            "latency_last_ms": self.latency_last * 1000.0,
+            "latency_max_ms": self.latency_max * 1000.0,
+            "latency_avg_ms": (self.latency_total / self.latency_count * 1000.0) if self.latency_count else 0.0,
+            "presses": self.latency_count,
+            "overflows": self.overflows,
+            "dropped": self.dropped,
+            "recovered": self.recovered,
+            "lost": self.lost,
+            "last_overflow_at": self._last_event_time('overflow'),
+            "priority": self.priority,
+            "queued_chunks": self._live.qsize() if self._live is not None else 0,
+            "open_ms": self.open_seconds * 1000.0,
+        }
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        self._last_callback = time.monotonic()
+        if self.priority is None:
+            self.priority = self._raise_priority()
+            hal.pin_thread(self.cpus)
+        seq = next(self._seq)
+        if status & hal.paInputOverflow:
+            self.overflows += 1
+            self.events.append((time.time(), 'overflow', seq))
+            self._overflow_seqs.append(seq)
+        item = (seq, in_data)
+        self._ring.append(item)
+        live = self._live
+        if live is not None:
+            try:
+                live.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                self.events.append((time.time(), 'dropped', seq))
+        return (None, hal.paContinue)
+
+    def _last_event_time(self, kind):
+        for t, k, _ in reversed(list(self.events)):
+            if k == kind:
+                return t
+        return 0.0
+
+    def _raise_priority(self):
+        """
+        Runs once, on the callback thread. PortAudio's ALSA host API may
+        already have made it real-time; otherwise ask for SCHED_FIFO, and
+        without CAP_SYS_NICE settle for a better nice value.
+        """
+        if not self.rt_priority:
+            return "default"
+        try:
+            if os.sched_getscheduler(0) == os.SCHED_FIFO:
+                return "fifo"
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.rt_priority))
+            return "fifo"
+        except (AttributeError, OSError):
+            pass
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), NICE)
+            return "nice"
+        except (AttributeError, OSError):
+            return "default"
+
+    def _record_latency(self, seconds):
+        self.latency_last = seconds
+        self.latency_total += seconds
+        self.latency_count += 1
+        if seconds > self.latency_max:
+            self.latency_max = seconds
@@ -0,0 +1,309 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import random
+import select
+import struct
+import threading
+import wave
+
+POLL_INTERVAL = 5.0   # seconds between rescans when inotify isn't available
+SNAPSHOT_NAME = ".catalog.json"   # entries as of the last run, for a warm start
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class SecretEntry:
+    mapped = False   # True when read_pcm() returns a view into a memory map
+    loudness = None  # (rms_db, peak_db) once loudness.LoudnessStore has measured it
+
+    def __init__(self, name, path, size, mtime, rate, channels, sampwidth, nframes):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.rate = rate
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.nframes = nframes
+
+    @property
+    def duration(self):
+        return self.nframes / self.rate if self.rate else 0.0
+
+    def read_pcm(self):
+        with wave.open(self.path, 'rb') as wf:
+            return wf.readframes(wf.getnframes())
+
+    def __repr__(self):
+        return f"SecretEntry({self.name!r}, {self.duration:.2f}s, {self.rate}Hz x{self.channels})"
+
+
+def read_entry(path):
+    """Stat and read the WAV header of path. Returns None if it isn't a usable WAV."""
+    try:
+        st = os.stat(path)
+        with wave.open(path, 'rb') as wf:
+            return SecretEntry(
+                os.path.basename(path), path, st.st_size, st.st_mtime,
+                wf.getframerate(), wf.getnchannels(), wf.getsampwidth(), wf.getnframes(),
+            )
+    except (OSError, EOFError, wave.Error):
+        return None
+
+
+class SecretsCatalog:
+    """
+    In-memory index of the secrets directory. The directory is scanned once
+    on start() and then kept current by inotify (or periodic rescans when
+    inotify is unavailable). choice() and names() only look at memory.
+
+    Listeners are called as fn(event, name, entry) with event one of
+    'added', 'changed' or 'removed' (entry is None for 'removed').
+
+    With snapshot set, the entries are saved to SNAPSHOT_NAME on stop()
+    (and save_snapshot()). The next start() serves them straight away and
+    runs the reconciling scan on the watcher thread, where a file whose
+    size and mtime still match costs a stat instead of a header read.
+    """
+
+    def __init__(self, directory, suffix='.wav', poll_interval=POLL_INTERVAL, snapshot=True):
+        self.directory = directory
+        self.suffix = suffix
+        self.poll_interval = poll_interval
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_NAME) if snapshot else None
+        self._dirty = False
+
+        self._lock = threading.Lock()
+        self._entries = {}
+        # Parallel list + position map so random picks and removals are O(1).
+        self._names = []
+        self._positions = {}
+        self._listeners = []
+
+        self._running = False
+        self._stop_evt = threading.Event()
+        self._thread = None
+
+    # -- public API --------------------------------------------------------
+
+    def start(self):
+        if self._running:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        warm = self._load_snapshot()
+        if not warm:
+            self.scan()
+        self._running = True
+        self._stop_evt.clear()
+        fd = self._inotify_open()
+        if fd is None:
+            print(f"[CATALOG] inotify unavailable, polling every {self.poll_interval}s")
+        self._thread = threading.Thread(target=self._run, args=(fd, warm), daemon=True)
+        self._thread.start()
+        print(f"[CATALOG] {len(self)} secrets in {self.directory}"
+              + (" (from snapshot, verifying)" if warm else ""))
+
+    def stop(self):
+        self._running = False
+        self._stop_evt.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.save_snapshot()
+
+    def save_snapshot(self):
+        """Write the entries to the snapshot file if anything changed since the last save."""
+        if self.snapshot_path is None or not self._dirty:
+            return
+        with self._lock:
+            rows = [[e.name, e.size, e.mtime, e.rate, e.channels, e.sampwidth, e.nframes]
+                    for e in self._entries.values()]
+            self._dirty = False
+        tmp_path = self.snapshot_path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({"entries": rows}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"[CATALOG] Could not write {self.snapshot_path}: {e}")
+
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def scan(self):
+        """Full rescan of the directory; reconciles additions and removals."""
+        seen = set()
+        for de in os.scandir(self.directory):
+            if not self._wanted(de.name):
+                continue
+            seen.add(de.name)
+            self.refresh(de.name)
+        with self._lock:
+            gone = [n for n in self._entries if n not in seen]
+        for name in gone:
+            self.remove(name)
+
+    def add(self, path):
+        """Register a file the caller just wrote (e.g. a finished recording)."""
+        return self.refresh(os.path.basename(path))
+
+    def refresh(self, name):
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            old = self._entries.get(name)
+        if old is not None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.remove(name)
+                return None
+            if st.st_size == old.size and st.st_mtime == old.mtime:
+                return old
+        entry = read_entry(path)
+        if entry is None:
+            if old is not None:
+                self.remove(name)
+            return None
+        self._put(entry)
+        return entry
+
+    def remove(self, name):
+        with self._lock:
+            if self._entries.pop(name, None) is None:
+                return
+            self._dirty = True
+            pos = self._positions.pop(name)
+            last = self._names.pop()
+            if last != name:
+                self._names[pos] = last
+                self._positions[last] = pos
+        self._notify('removed', name, None)
+
+    def get(self, name):
+        with self._lock:
+            return self._entries.get(name)
+
+    def choice(self):
+        """A uniformly random entry. Raises IndexError when the catalog is empty."""
+        with self._lock:
+            return self._entries[random.choice(self._names)]
+
+    def names(self):
+        with self._lock:
+            return list(self._names)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries.values())
+
+    def __len__(self):
+        return len(self._names)
+
+    # -- internals ---------------------------------------------------------
+
+    def _wanted(self, name):
+        # Hidden files include the recorder's in-progress .rec_* temp files.
+        return name.endswith(self.suffix) and not name.startswith('.')
+
+    def _put(self, entry):
+        name = entry.name
+        with self._lock:
+            old = self._entries.get(name)
+            self._entries[name] = entry
+            self._dirty = True
+            if name not in self._positions:
+                self._positions[name] = len(self._names)
+                self._names.append(name)
+        self._notify('changed' if old is not None else 'added', name, entry)
+
+    def _notify(self, event, name, entry):
+        for fn in self._listeners:
+            try:
+                fn(event, name, entry)
+            except Exception as e:
+                print(f"[CATALOG] Listener error: {e}")
+
+    def _load_snapshot(self):
+        if self.snapshot_path is None:
+            return False
+        try:
+            with open(self.snapshot_path) as f:
+                rows = json.load(f)["entries"]
+            entries = [SecretEntry(name, os.path.join(self.directory, name), *fields)
+                       for name, *fields in rows if self._wanted(name)]
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[CATALOG] Ignoring unreadable snapshot: {e}")
+            return False
+        for entry in entries:
+            self._put(entry)
+        self._dirty = False
+        return True
+
+    def _run(self, fd, rescan):
+        if rescan:
+            # Catch up on whatever changed while we weren't running.
+            try:
+                self.scan()
+                self.save_snapshot()
+            except Exception as e:
+                print(f"[CATALOG] Rescan failed: {e}")
+        if fd is None:
+            self._poll_loop()
+        else:
+            self._inotify_loop(fd)
+
+    def _inotify_open(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(self.directory), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _inotify_loop(self, fd):
+        try:
+            while self._running:
+                ready, _, _ = select.select([fd], [], [], 1.0)
+                if not ready:
+                    continue
+                buf = os.read(fd, 64 * 1024)
+                offset = 0
+                while offset < len(buf):
+                    _wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+                    offset += _EVENT_HEADER.size
+                    name = os.fsdecode(buf[offset:offset + length].rstrip(b'\0'))
+                    offset += length
+                    if not self._wanted(name):
+                        continue
+                    if mask & (IN_DELETE | IN_MOVED_FROM):
+                        self.remove(name)
+                    else:
+                        self.refresh(name)
+        except Exception as e:
+            print(f"[CATALOG] inotify watcher failed ({e}), falling back to polling")
+            if self._running:
+                self._poll_loop()
+        finally:
+            os.close(fd)
+
+    def _poll_loop(self):
+        while not self._stop_evt.wait(self.poll_interval):
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"[CATALOG] Rescan failed: {e}")
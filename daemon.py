@@ -0,0 +1,158 @@
+"""
+Runs the installation as a systemd service (see willow.service):
+
+    python daemon.py [--config /etc/whispering-willow.json]
+
+Startup is ordered for getting the first secret out quickly: only the
+standard library is loaded before systemd hears we're starting, the
+catalog comes from the snapshot the last run left behind (catalog.py) and
+is verified in the background, and the first secret plays after
+FIRST_SECRET_DELAY instead of the usual pause. READY=1 is sent once the
+output stream (and the mic, if it is plugged in) is actually open.
+
+SIGTERM lets an in-flight recording finish and be saved before exiting.
+SIGHUP re-reads the config file, applies what can change live and
+rescans the secrets directory; anything else is reported as needing a
+restart.
+
+The config file is optional JSON overriding constants in willow.py and
+art.py, e.g. {"MIN_SECRET_DELAY": 8, "TRIM_SILENCE": false}.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+
+import runtime   # standard library only; the engine is imported in main()
+
+_T0 = time.monotonic()
+
+CONFIG_PATH = os.environ.get("WILLOW_CONFIG", "/etc/whispering-willow.json")
+FIRST_SECRET_DELAY = 0.5  # seconds of silence before the first secret after start
+
+# Settings SIGHUP can change without a restart. Delays live on the runtime,
+# the rest are read from willow.py each time they're used.
+LIVE_RUNTIME = {"MIN_SECRET_DELAY": "min_delay", "MAX_SECRET_DELAY": "max_delay"}
+LIVE_WILLOW = {"TRIM_SILENCE", "NORMALIZE_LOUDNESS", "MAX_RECORD_SECONDS", "MIN_RECORD_SECONDS"}
+
+
+def notify(state):
+    """sd_notify(3) without libsystemd: one datagram to $NOTIFY_SOCKET, if set."""
+    path = os.environ.get("NOTIFY_SOCKET")
+    if not path:
+        return False
+    if path.startswith("@"):
+        path = "\0" + path[1:]   # abstract socket
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+            sock.connect(path)
+            sock.sendall(state.encode())
+        return True
+    except OSError as e:
+        print(f"[DAEMON] sd_notify failed: {e}")
+        return False
+
+
+def load_config(path):
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"[DAEMON] Ignoring config {path}: {e}")
+        return {}
+    if not isinstance(config, dict):
+        print(f"[DAEMON] Ignoring config {path}: not a JSON object")
+        return {}
+    return config
+
+
+def apply_config(config, modules):
+    """Set module constants named in config; unknown keys are reported."""
+    for key, value in config.items():
+        targets = [m for m in modules if hasattr(m, key)]
+        if not targets:
+            print(f"[DAEMON] Unknown setting {key}")
+        for module in targets:
+            setattr(module, key, value)
+
+
+def _ms_since_start():
+    return (time.monotonic() - _T0) * 1000.0
+
+
+class WillowDaemon(runtime.WillowRuntime):
+    def __init__(self, willow, button, config_path, config, **kwargs):
+        super().__init__(willow, button, **kwargs)
+        self.config_path = config_path
+        self.config = config
+
+    def _ready(self):
+        w = self.willow
+        open_mics = sum(1 for st in w.stations if st.capture._stream is not None)
+        if len(w.stations) > 1:
+            mic = f"{open_mics}/{len(w.stations)} mics open"
+        else:
+            mic = "mic open" if open_mics else "mic waiting for microphone"
+        status = f"{len(w.catalog)} secrets, {mic}"
+        print(f"[DAEMON] Ready in {_ms_since_start():.0f} ms ({status})")
+        notify(f"READY=1\nSTATUS={status}")
+
+    def _shutting_down(self):
+        notify("STOPPING=1\nSTATUS=Finishing any recording in progress")
+
+    def _reload(self):
+        notify(f"RELOADING=1\nMONOTONIC_USEC={time.monotonic_ns() // 1000}")
+        import willow
+        config = load_config(self.config_path)
+        for key, value in config.items():
+            if key in LIVE_RUNTIME:
+                setattr(self, LIVE_RUNTIME[key], value)
+            elif key in LIVE_WILLOW:
+                setattr(willow, key, value)
+            elif self.config.get(key) != value:
+                print(f"[DAEMON] {key} changed; takes effect after a restart")
+                continue
+            self.config[key] = value
+        super()._reload()
+        print(f"[DAEMON] Reloaded {self.config_path}")
+        notify(f"READY=1\nSTATUS={len(self.willow.catalog)} secrets")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Whispering willow service")
+    parser.add_argument("--config", default=CONFIG_PATH)
+    args = parser.parse_args(argv)
+    notify("STATUS=Starting")
+
+    # Everything heavy (NumPy, PortAudio, GPIO) loads from here on.
+    import art
+    import button
+    import willow
+    config = load_config(args.config)
+    apply_config(config, (willow, art))
+
+    w = willow.Willow()
+    # Open the speaker now rather than on the first secret, so READY means
+    # the output stream is really there.
+    for st in w.stations:
+        st.player.start()
+    def make_button(pin):
+        return button.GpioButton(pin, press_ms=art.PRESS_DEBOUNCE_MS,
+                                 release_ms=art.RELEASE_DEBOUNCE_MS)
+
+    daemon = WillowDaemon(
+        w, make_button(art.BUTTON_PIN), args.config, config, make_button=make_button,
+        min_delay=config.get("MIN_SECRET_DELAY", art.MIN_SECRET_DELAY),
+        max_delay=config.get("MAX_SECRET_DELAY", art.MAX_SECRET_DELAY),
+        first_delay=FIRST_SECRET_DELAY)
+    asyncio.run(daemon.run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,304 @@
+"""
+Content-addressed secrets: every secret is identified by a hash of its
+audio (sample format + PCM, so a re-exported copy with different header
+chunks still matches), and when two secrets share a hash only one is
+kept: the one with the most plays in the play history, and between
+copies played equally often (e.g. never) the name that sorts first.
+mtime doesn't decide, since scp -p can give a fresh copy an older one.
+Batches scp'd onto the Pi twice therefore cost nothing.
+
+Hashes are computed once on a low-priority background thread and kept in
+a small JSON file next to the secrets, keyed by name and checked against
+size/mtime like loudness.py. Hashes of secrets that were removed on
+purpose (retention, a manual rm) are remembered too, so sync.py doesn't
+fetch them straight back from another tree.
+
+    python dedup.py [/home/ivyblossom/secrets]   # hash a directory, report duplicates
+"""
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import wave
+
+STORE_NAME = ".hashes.json"   # hidden, so the catalog never mistakes it for a secret
+BLOCK_FRAMES = 64 * 1024      # frames read per hashing step
+SAVE_DELAY = 2.0              # batch writes of the store during bulk hashing
+NICE = 10                     # hashing reads every secret once; stay out of playback's way
+
+
+def new_hash(rate, channels, sampwidth):
+    """A SHA-256 primed with the sample format; feed it the PCM."""
+    return hashlib.sha256(f"{rate}/{channels}/{sampwidth}\n".encode())
+
+
+def content_hash(entry):
+    """Hex SHA-256 of an entry's sample format and PCM."""
+    h = new_hash(entry.rate, entry.channels, entry.sampwidth)
+    if entry.mapped:
+        h.update(entry.read_pcm())
+        return h.hexdigest()
+    with wave.open(entry.path, 'rb') as wf:
+        data = wf.readframes(BLOCK_FRAMES)
+        while data:
+            h.update(data)
+            data = wf.readframes(BLOCK_FRAMES)
+    return h.hexdigest()
+
+
+class ContentIndex:
+    """
+    Hash -> secret index over a catalog. Hook it up with start(); lookup(),
+    hashes() and knows() are what sync.py serves and compares against.
+    Listeners are called as fn(name, digest) once a secret's hash is known.
+    With canonical = (rate, channels, sampwidth) set, other entries are
+    left alone until the ingestor has converted them (and a duplicate
+    only shows up in the canonical format anyway). history (a PlayHistory)
+    decides which of two copies is kept; without it the first name wins.
+    """
+
+    def __init__(self, secrets, directory, canonical=None, remove_duplicates=True, history=None):
+        self.catalog = secrets
+        self.history = history
+        self.path = os.path.join(directory, STORE_NAME)
+        self.canonical = canonical
+        self.remove_duplicates = remove_duplicates
+        self._lock = threading.Lock()
+        self._names = {}          # name -> (size, mtime, hash)
+        self._by_hash = {}        # hash -> set of names
+        self._gone = set()        # hashes deleted here on purpose
+        self._dropping = set()    # names being removed as duplicates
+        self._listeners = []
+        self._queue = queue.Queue()
+        self._thread = None
+        self._dirty = False
+
+        self.hashed = 0
+        self.duplicates = 0
+        self.duplicate_bytes = 0
+        self.failed = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._load()
+        self.catalog.add_listener(self.on_catalog_event)
+        for entry in self.catalog.entries():
+            self.on_catalog_event('added', entry.name, entry)
+        # Secrets deleted while we weren't running.
+        present = set(self.catalog.names())
+        with self._lock:
+            stale = [n for n in self._names if n not in present]
+        for name in stale:
+            self._unindex(name, deleted=True)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def on_catalog_event(self, event, name, entry):
+        with self._lock:
+            old = self._names.get(name)
+        if entry is not None and old is not None and old[:2] == (entry.size, entry.mtime):
+            self._index(entry, old[2])
+            return
+        self._unindex(name, deleted=entry is None)
+        if entry is None:
+            return
+        if self.canonical is None or (entry.rate, entry.channels, entry.sampwidth) == self.canonical:
+            self._queue.put(entry)
+
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def digest(self, name):
+        """The content hash of the secret called name, if it's known yet."""
+        with self._lock:
+            known = self._names.get(name)
+            if known is None or name not in self._by_hash.get(known[2], ()):
+                return None
+            return known[2]
+
+    def lookup(self, digest):
+        """The catalog entry with this content hash, or None."""
+        with self._lock:
+            names = sorted(self._by_hash.get(digest, ()))
+        for name in names:
+            entry = self.catalog.get(name)
+            if entry is not None:
+                return entry
+        return None
+
+    def hashes(self):
+        with self._lock:
+            return list(self._by_hash)
+
+    def knows(self, digest):
+        """True if this content is here, or was deliberately removed."""
+        with self._lock:
+            return digest in self._by_hash or digest in self._gone
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "hashed": self.hashed,
+            "unique": len(self._by_hash),
+            "duplicates": self.duplicates,
+            "duplicate_bytes": self.duplicate_bytes,
+            "failed": self.failed,
+            "pending": self.pending,
+        }
+
+    # -- internals ---------------------------------------------------------
+
+    def _run(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), NICE)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            try:
+                entry = self._queue.get(timeout=SAVE_DELAY)
+            except queue.Empty:
+                self._save()
+                continue
+            if entry is None:
+                break
+            if self.catalog.get(entry.name) is not entry:
+                continue   # changed or removed since it was queued
+            try:
+                digest = content_hash(entry)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                self.failed += 1
+                print(f"[DEDUP] Could not hash {entry.name}: {e}")
+                continue
+            self.hashed += 1
+            self._index(entry, digest)
+        self._save()
+
+    def _index(self, entry, digest):
+        with self._lock:
+            self._names[entry.name] = (entry.size, entry.mtime, digest)
+            holders = self._by_hash.setdefault(digest, set())
+            holders.add(entry.name)
+            self._gone.discard(digest)
+            self._dirty = True
+            present = []
+            if len(holders) > 1 and self.remove_duplicates:
+                present = [e.name for e in map(self.catalog.get, holders) if e is not None]
+        if len(present) > 1:
+            kept, *extra = sorted(present, key=self._keep_order)
+            for name in extra:
+                self._drop(name, kept)
+        if self.catalog.get(entry.name) is not None:
+            for fn in self._listeners:
+                try:
+                    fn(entry.name, digest)
+                except Exception as e:
+                    print(f"[DEDUP] Listener error: {e}")
+
+    def _keep_order(self, name):
+        # Most played first, then by name: the same copy wins on every run.
+        plays = self.history.plays.get(name, 0) if self.history is not None else 0
+        return -plays, name
+
+    def _unindex(self, name, deleted):
+        with self._lock:
+            old = self._names.pop(name, None)
+            dropping = name in self._dropping
+            self._dropping.discard(name)
+            if old is None:
+                return
+            self._dirty = True
+            digest = old[2]
+            holders = self._by_hash.get(digest, set())
+            holders.discard(name)
+            if holders:
+                return
+            self._by_hash.pop(digest, None)
+            if deleted and not dropping:
+                self._gone.add(digest)
+
+    def _drop(self, name, kept):
+        entry = self.catalog.get(name)
+        if entry is None:
+            return
+        with self._lock:
+            self._dropping.add(name)
+        try:
+            if hasattr(self.catalog, "delete"):
+                self.catalog.delete(name)
+            else:
+                os.remove(entry.path)
+                self.catalog.remove(name)
+        except FileNotFoundError:
+            self.catalog.remove(name)
+            return
+        except Exception as e:
+            with self._lock:
+                self._dropping.discard(name)
+            self.failed += 1
+            print(f"[DEDUP] Could not remove duplicate {name}: {e}")
+            return
+        self.duplicates += 1
+        self.duplicate_bytes += entry.size
+        print(f"[DEDUP] Removed {name}: same audio as {kept}")
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            names = {name: (size, mtime, digest) for name, (size, mtime, digest) in data["names"].items()}
+            gone = set(data["gone"])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[DEDUP] Ignoring unreadable {self.path}: {e}")
+            return
+        with self._lock:
+            # Only the name -> hash cache; _by_hash fills in as the catalog
+            # reports its entries.
+            self._names = names
+            self._gone = gone
+
+    def _save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({"names": {n: list(v) for n, v in self._names.items()},
+                               "gone": sorted(self._gone)})
+            self._dirty = False
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[DEDUP] Could not save {self.path}: {e}")
+
+
+if __name__ == "__main__":
+    import catalog
+    import willow
+    directory = sys.argv[1] if len(sys.argv) > 1 else willow.SECRETS_DIR
+    secrets = catalog.SecretsCatalog(directory, snapshot=False)
+    secrets.scan()
+    groups = {}
+    for entry in secrets.entries():
+        groups.setdefault(content_hash(entry), []).append(entry.name)
+    for digest, names in sorted(groups.items()):
+        if len(names) > 1:
+            print(f"{digest[:12]}  {'  '.join(sorted(names))}")
+    print(f"[DEDUP] {len(secrets)} secrets, {len(groups)} unique")
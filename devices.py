@@ -1,6 +1,257 @@
-import pyaudio
-audio = pyaudio.PyAudio()
+"""
+Audio device discovery that survives hot-plugging. Devices are looked up
+by (part of) their name, never by a hardcoded index, and the name->index
+mapping is cached so lookups don't re-enumerate PortAudio.
 
-for i in range(audio.get_device_count()):
-    info = audio.get_device_info_by_index(i)
-    print(f"  {i}: {info['name']} - In:{info['maxInputChannels']} Out:{info['maxOutputChannels']}")
+A monitor thread watches the attached streams. When one dies (the
+stream stops or its callback stalls, which is how a pulled USB mic or a
+dropped Bluetooth speaker shows up) the stream is closed, the devices
+are enumerated again in the background and the stream is reopened on
+the device with the same name, wherever its index ended up. Playback
+just pauses with its queue intact while the speaker is gone.
+
+PortAudio only sees new devices after a full terminate/initialize, so
+with a factory (e.g. hal.open_audio) a rescan briefly closes every
+attached stream and reopens them on a fresh audio object. It does that
+when a stream fails and when /proc/asound/cards changes. A device that
+was never there (say, no mic is plugged in) is only looked for again when
+the card list changes, so healthy streams aren't torn down for it. One
+that dropped out without the card list changing (a Bluetooth speaker) is
+looked for after RESCAN_SECONDS, doubling each time up to
+RESCAN_MAX_SECONDS. Without a factory the same audio object is just
+enumerated again (enough for sim.SimAudio).
+
+An attached owner (capture.CaptureService, playback.PlaybackEngine)
+provides detach(), reattach(audio, index) and healthy().
+
+    python devices.py        # list the devices PortAudio sees
+"""
+import threading
+import time
+
+CHECK_SECONDS = 1.0        # how often streams are checked and the card list polled
+RESCAN_SECONDS = 30.0      # first re-enumeration after a device dropped out...
+RESCAN_MAX_SECONDS = 1800.0  # ...backing off to this while it stays away
+CARDS_PATH = "/proc/asound/cards"   # changes when ALSA cards come and go
+
+
+class _Role:
+    def __init__(self, kind, name, owner):
+        self.kind = kind        # 'input' or 'output'
+        self.name = name        # substring of the device name; None = default device
+        self.owner = owner
+        self.index = None
+        self.missing = False
+
+
+class DeviceManager:
+    def __init__(self, audio, factory=None):
+        self.audio = audio
+        self.factory = factory
+        self.devices = []       # device info dicts from the last scan
+        self._cache = {}        # (name, kind) -> index
+        self._roles = []
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+        self._cards = _read_cards()
+        self._last_rescan = time.monotonic()
+        self._rescan_interval = RESCAN_SECONDS
+
+        self.scans = 0
+        self.reinits = 0
+        self.losses = 0
+        self.reattaches = 0
+        self.reattach_last = 0.0   # seconds from loss to stream reopened
+        self._lost_at = {}
+
+        self.scan()
+
+    def scan(self):
+        """Enumerate the current audio object's devices and reset the cache."""
+        devices = []
+        for i in range(self.audio.get_device_count()):
+            try:
+                devices.append(self.audio.get_device_info_by_index(i))
+            except Exception:
+                continue
+        with self._lock:
+            self.devices = devices
+            self._cache = {}
+        self.scans += 1
+        return devices
+
+    def find(self, name, kind='input'):
+        """Index of the first device whose name contains name, or None."""
+        if name is None:
+            return None
+        key = (name, kind)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+            channels = 'maxInputChannels' if kind == 'input' else 'maxOutputChannels'
+            index = None
+            for info in self.devices:
+                if name in info['name'] and info.get(channels, 0) > 0:
+                    index = info['index']
+                    break
+            self._cache[key] = index
+            return index
+
+    def attach(self, kind, name, owner):
+        """Keep owner's stream on the device called name across reconnects."""
+        role = _Role(kind, name, owner)
+        role.index = self.find(name, kind)
+        role.missing = name is not None and role.index is None
+        with self._lock:
+            self._roles.append(role)
+        if role.missing:
+            print(f"[DEVICES] No {kind} device matching {name!r}; waiting for it")
+        return role.index
+
+    def add_listener(self, fn):
+        """fn(audio) is called after a rescan replaced the audio object."""
+        self._listeners.append(fn)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def lost(self, owner, error=None):
+        """Report a stream error from outside the monitor (e.g. a failed open)."""
+        for role in self._roles:
+            if role.owner is owner and not role.missing:
+                self._mark_lost(role, error)
+        self._wake.set()
+
+    def stats(self):
+        return {
+            "scans": self.scans,
+            "reinits": self.reinits,
+            "losses": self.losses,
+            "reattaches": self.reattaches,
+            "reattach_last_ms": self.reattach_last * 1000.0,
+            "missing": sum(1 for r in self._roles if r.missing),
+        }
+
+    # -- monitor thread ----------------------------------------------------
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(CHECK_SECONDS)
+            self._wake.clear()
+            if not self._running:
+                break
+            try:
+                self._check()
+            except Exception as e:
+                print(f"[DEVICES] Check failed: {e}")
+
+    def _check(self):
+        failed = False
+        for role in self._roles:
+            if not role.missing and not role.owner.healthy():
+                self._mark_lost(role, None)
+                failed = True
+        cards = _read_cards()
+        changed = cards != self._cards
+        self._cards = cards
+        missing = [r for r in self._roles if r.missing]
+        if not missing:
+            return
+
+        if self.factory is None:
+            self._rescan(reinit=False)
+        elif failed or changed:
+            self._rescan_interval = RESCAN_SECONDS
+            self._rescan(reinit=True)
+        elif (any(id(r) in self._lost_at for r in missing)
+              and time.monotonic() - self._last_rescan >= self._rescan_interval):
+            # Lost without the card list changing; look again, less often each time.
+            if self._rescan(reinit=True):
+                self._rescan_interval = RESCAN_SECONDS
+            else:
+                self._rescan_interval = min(self._rescan_interval * 2, RESCAN_MAX_SECONDS)
+
+    def _mark_lost(self, role, error):
+        reason = f": {error}" if error else ""
+        print(f"[DEVICES] Lost {role.kind} device {role.name or 'default'!r}{reason}")
+        self.losses += 1
+        self._lost_at[id(role)] = time.monotonic()
+        role.missing = True
+        try:
+            role.owner.detach()
+        except Exception:
+            pass
+
+    def _rescan(self, reinit):
+        """Enumerate again (reinit: on a fresh audio object); returns how many roles came back."""
+        self._last_rescan = time.monotonic()
+        found = 0
+        if reinit:
+            # Every stream has to let go of PortAudio before it re-enumerates.
+            for role in self._roles:
+                if not role.missing:
+                    role.owner.detach()
+            try:
+                self.audio.terminate()
+            except Exception:
+                pass
+            self.audio = self.factory()
+            self.reinits += 1
+            for fn in self._listeners:
+                fn(self.audio)
+        self.scan()
+
+        for role in self._roles:
+            if not (reinit or role.missing):
+                continue
+            index = self.find(role.name, role.kind)
+            if role.name is not None and index is None:
+                role.missing = True
+                continue
+            try:
+                role.owner.reattach(self.audio, index)
+            except Exception as e:
+                print(f"[DEVICES] Could not reopen {role.kind} on {role.name or 'default'!r}: {e}")
+                role.missing = True
+                continue
+            if role.missing:
+                lost_at = self._lost_at.pop(id(role), None)
+                if lost_at is not None:
+                    self.reattach_last = time.monotonic() - lost_at
+                self.reattaches += 1
+                found += 1
+                print(f"[DEVICES] Reattached {role.kind} {role.name or 'default'!r} at index {index}")
+            role.missing = False
+            role.index = index
+        return found
+
+
+def _read_cards():
+    try:
+        with open(CARDS_PATH) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    # List what PortAudio sees, e.g. to pick names for willow.INPUT_DEVICE.
+    import hal
+    audio = hal.open_audio()
+    for info in DeviceManager(audio).devices:
+        print(f"  {info['index']}: {info['name']} - In:{info['maxInputChannels']} Out:{info['maxOutputChannels']}")
+    audio.terminate()
@@ -0,0 +1,360 @@
+"""
+Makes secrets sound like they come from inside the tree. Each secret is
+rendered through an effects preset once, in the background on a process
+pool, and the result is kept on disk; playback just picks up the
+rendered file (and plays the dry secret until it exists), so none of the
+DSP ever runs on the audio path.
+
+A preset chains, in order:
+
+    pitch_semitones   varispeed pitch shift (slightly slower when lowered)
+    whisper           0..1 blend of a whisperized copy: STFT magnitudes
+                      kept, phases randomized, so the voice loses its pitch
+    band              (low_hz, high_hz) windowed-sinc FIR band-pass
+    reverb            0..1 wet level of a synthetic hollow-trunk reverb:
+                      decaying noise impulse response, darker as it fades,
+                      applied by FFT overlap-add convolution
+    reverb_seconds    decay time (to -60 dB) of that impulse response
+
+Renders live in SECRETS_DIR/.effects as <content hash>.<preset key>.wav,
+so a secret renders once per preset however often it is copied or
+renamed, and editing a preset (or EFFECTS_VERSION) re-renders everything.
+
+    python effects.py tree in.wav out.wav    # try a preset on one file
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import wave
+
+import numpy as np
+
+import catalog
+import ingest
+
+EFFECTS_VERSION = 1        # bump when the DSP changes so old renders are redone
+CACHE_DIR = ".effects"     # hidden, inside the secrets directory
+FIR_TAPS = 255             # band-pass length
+STFT_FRAME = 512           # whisper analysis frame (32 ms at 16 kHz)
+STFT_BATCH = 1024          # frames transformed at once, bounds memory on long secrets
+CONV_BLOCK = 1 << 16       # samples per FFT convolution block
+SEED = 7                   # noise for reverb/whisper is fixed, so renders are reproducible
+
+PRESETS = {
+    "tree": {"pitch_semitones": -1.0, "whisper": 0.4, "band": (200.0, 5000.0),
+             "reverb": 0.35, "reverb_seconds": 1.6},
+    "whisper": {"pitch_semitones": 0.0, "whisper": 1.0, "band": (300.0, 6500.0),
+                "reverb": 0.15, "reverb_seconds": 0.6},
+    "hollow": {"pitch_semitones": -2.5, "whisper": 0.0, "band": (150.0, 3200.0),
+               "reverb": 0.55, "reverb_seconds": 2.8},
+}
+
+
+def preset_key(preset):
+    """Short hash naming a preset's renders."""
+    text = json.dumps([EFFECTS_VERSION, preset], sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:12]
+
+
+# -- DSP (float32 mono, one channel at a time) -------------------------------
+
+def _pitch(x, semitones):
+    if not semitones or len(x) < 2:
+        return x
+    step = 2.0 ** (semitones / 12.0)
+    t = np.arange(0.0, len(x) - 1, step)
+    return np.interp(t, np.arange(len(x)), x).astype(np.float32)
+
+
+def _fft_convolve(x, h):
+    """Full linear convolution by FFT overlap-add, CONV_BLOCK samples at a time."""
+    out = np.zeros(len(x) + len(h) - 1, dtype=np.float32)
+    n = 1 << int(np.ceil(np.log2(CONV_BLOCK + len(h) - 1)))
+    H = np.fft.rfft(h, n)
+    for start in range(0, len(x), CONV_BLOCK):
+        block = x[start:start + CONV_BLOCK]
+        y = np.fft.irfft(np.fft.rfft(block, n) * H, n)[:len(block) + len(h) - 1]
+        out[start:start + len(y)] += y
+    return out
+
+
+def _bandpass(x, rate, low, high):
+    n = np.arange(FIR_TAPS) - (FIR_TAPS - 1) / 2
+
+    def lowpass(fc):
+        return 2 * fc / rate * np.sinc(2 * fc / rate * n)
+
+    taps = (lowpass(min(high, rate / 2 * 0.98)) - lowpass(low)) * np.hamming(FIR_TAPS)
+    y = _fft_convolve(x, taps.astype(np.float32))
+    delay = (FIR_TAPS - 1) // 2
+    return y[delay:delay + len(x)]
+
+
+def _whisper(x, amount, rng):
+    if amount <= 0 or len(x) < STFT_FRAME:
+        return x
+    hop = STFT_FRAME // 2
+    # sqrt-Hann for analysis and synthesis: the product overlap-adds to 1.
+    window = np.sqrt(np.hanning(STFT_FRAME + 1)[:-1]).astype(np.float32)
+    padded = np.concatenate([np.zeros(hop, np.float32), x,
+                             np.zeros(STFT_FRAME, np.float32)])
+    frames = np.lib.stride_tricks.sliding_window_view(padded, STFT_FRAME)[::hop]
+    out = np.zeros(len(frames) * hop + hop, dtype=np.float32)
+    for start in range(0, len(frames), STFT_BATCH):
+        batch = frames[start:start + STFT_BATCH] * window
+        mag = np.abs(np.fft.rfft(batch, axis=1))
+        phase = rng.uniform(0.0, 2 * np.pi, mag.shape)
+        y = np.fft.irfft(mag * np.exp(1j * phase), STFT_FRAME, axis=1).astype(np.float32) * window
+        # 50% overlap: each frame's first half lands on the previous one's second.
+        halves = np.zeros((len(y) + 1, hop), dtype=np.float32)
+        halves[:-1] += y[:, :hop]
+        halves[1:] += y[:, hop:]
+        out[start * hop:start * hop + halves.size] += halves.reshape(-1)
+    whispered = out[hop:hop + len(x)]
+    return (1.0 - amount) * x + amount * whispered
+
+
+def _reverb_ir(rate, seconds, rng):
+    length = max(1, int(rate * seconds))
+    t = np.arange(length, dtype=np.float32) / rate
+    noise = rng.standard_normal(length).astype(np.float32)
+    # The tail gets darker: cross-fade into a smoothed copy of the noise.
+    smooth = np.convolve(noise, np.ones(8, np.float32) / 8, mode='same')
+    fade = t / seconds
+    ir = ((1.0 - fade) * noise + fade * smooth) * np.exp(-6.91 * t / seconds)
+    return ir / np.sqrt(np.sum(ir * ir))
+
+
+def process(x, rate, preset):
+    """Run one channel of float32 samples through a preset."""
+    rng = np.random.default_rng(SEED)
+    rms_in = float(np.sqrt(np.mean(x * x))) if len(x) else 0.0
+    y = _pitch(x, preset.get("pitch_semitones", 0.0))
+    y = _whisper(y, preset.get("whisper", 0.0), rng)
+    if preset.get("band"):
+        y = _bandpass(y, rate, *preset["band"])
+    wet = preset.get("reverb", 0.0)
+    if wet > 0:
+        tail = _fft_convolve(y, _reverb_ir(rate, preset.get("reverb_seconds", 1.0), rng))
+        y = np.concatenate([y, np.zeros(len(tail) - len(y), np.float32)]) + wet * tail
+    # Same loudness as the dry secret (so loudness.py's gain still fits), no clipping.
+    rms_out = float(np.sqrt(np.mean(y * y))) if len(y) else 0.0
+    if rms_out > 0:
+        y *= rms_in / rms_out
+    peak = float(np.max(np.abs(y))) if len(y) else 0.0
+    if peak > 0.98:
+        y *= 0.98 / peak
+    return y.astype(np.float32)
+
+
+def render_file(source, dst_path, rate, channels, sampwidth, preset):
+    """
+    Render source (a WAV path, or raw PCM bytes for packed secrets) through
+    preset into dst_path, atomically. Runs in a pool worker.
+    """
+    if sampwidth != 2:
+        raise ValueError(f"unsupported sample width {sampwidth}")
+    if isinstance(source, str):
+        with wave.open(source, 'rb') as wf:
+            source = wf.readframes(wf.getnframes())
+    samples = ingest._decode(source, sampwidth).reshape(-1, channels)
+    out = np.stack([process(np.ascontiguousarray(samples[:, c]), rate, preset)
+                    for c in range(channels)], axis=1)
+    tmp_path = dst_path + ".tmp"
+    try:
+        with wave.open(tmp_path, 'wb') as wf:
+            wf.setnchannels(channels)
+            wf.setsampwidth(sampwidth)
+            wf.setframerate(rate)
+            wf.writeframes(ingest._encode(out.reshape(-1), sampwidth))
+        os.replace(tmp_path, dst_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return dst_path
+
+
+class EffectsRenderer:
+    """
+    Keeps a rendered variant of every secret for one preset. Secrets are
+    rendered once their content hash is known (dedup.ContentIndex), on
+    their own process pool; variant(entry) returns the catalog
+    entry of the rendered file, or None if it isn't there (yet).
+    """
+
+    def __init__(self, secrets, contents, directory, preset_name, workers=None):
+        if preset_name not in PRESETS:
+            raise ValueError(f"unknown effects preset {preset_name!r}; choose from {', '.join(PRESETS)}")
+        self.catalog = secrets
+        self.contents = contents
+        self.directory = os.path.join(directory, CACHE_DIR)
+        self.preset_name = preset_name
+        self.preset = PRESETS[preset_name]
+        self.key = preset_key(self.preset)
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._variants = {}       # digest -> rendered SecretEntry
+        self._digests = {}        # name -> digest
+
+        self.rendered = 0
+        self.failed = 0
+        self.hits = 0             # plays that used a rendered variant
+        self.misses = 0           # plays that fell back to the dry secret
+
+    def start(self):
+        if self._pool is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._prune()
+        self._pool = ingest.make_pool(self.workers)
+        self.contents.add_listener(self._on_hashed)
+        self.catalog.add_listener(self._on_catalog_event)
+        for entry in self.catalog.entries():
+            digest = self.contents.digest(entry.name)
+            if digest is not None:
+                self._on_hashed(entry.name, digest)
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def pending(self):
+        return len(self._in_flight)
+
+    @property
+    def bytes(self):
+        """Disk space the renders take up (retention.py counts it)."""
+        with self._lock:
+            return sum(v.size for v in self._variants.values())
+
+    def freed_by(self, name):
+        """Bytes of render that go away with the secret called name."""
+        with self._lock:
+            digest = self._digests.get(name)
+            rendered = self._variants.get(digest)
+            if rendered is None or sum(1 for d in self._digests.values() if d == digest) > 1:
+                return 0
+            return rendered.size
+
+    def variant(self, entry):
+        """The rendered variant of entry, or None to play it dry."""
+        with self._lock:
+            digest = self._digests.get(entry.name)
+            rendered = self._variants.get(digest)
+        if rendered is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return rendered
+
+    def stats(self):
+        return {
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "pending": self.pending,
+            "variants": len(self._variants),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    # -- internals ---------------------------------------------------------
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.{self.key}.wav")
+
+    def _on_hashed(self, name, digest):
+        with self._lock:
+            self._digests[name] = digest
+            if digest in self._variants or digest in self._in_flight:
+                return
+        path = self._path(digest)
+        rendered = catalog.read_entry(path)
+        if rendered is not None:
+            with self._lock:
+                self._variants[digest] = rendered
+            return
+        entry = self.catalog.get(name)
+        if entry is None or self._pool is None:
+            return
+        with self._lock:
+            self._in_flight.add(digest)
+        source = bytes(entry.read_pcm()) if entry.mapped else entry.path
+        try:
+            future = self._pool.submit(render_file, source, path, entry.rate,
+                                       entry.channels, entry.sampwidth, self.preset)
+        except RuntimeError:   # pool shut down
+            with self._lock:
+                self._in_flight.discard(digest)
+            return
+        future.add_done_callback(lambda f, name=name, digest=digest: self._done(name, digest, f))
+
+    def _done(self, name, digest, future):
+        with self._lock:
+            self._in_flight.discard(digest)
+        if future.cancelled():
+            return
+        try:
+            path = future.result()
+        except Exception as e:
+            self.failed += 1
+            print(f"[EFFECTS] Could not render {name}: {e}")
+            return
+        rendered = catalog.read_entry(path)
+        if rendered is None:
+            self.failed += 1
+            return
+        with self._lock:
+            self._variants[digest] = rendered
+        self.rendered += 1
+        print(f"[EFFECTS] Rendered {name} ({self.preset_name})")
+
+    def _on_catalog_event(self, event, name, entry):
+        if event == 'added':
+            return
+        # Changed or removed: stop serving the old render. A changed secret
+        # is rendered again once it has been hashed again.
+        with self._lock:
+            digest = self._digests.get(name)
+        if digest is None or self.contents.digest(name) == digest:
+            return
+        with self._lock:
+            self._digests.pop(name, None)
+            if digest in self._digests.values():
+                return
+            self._variants.pop(digest, None)
+        if entry is None and self.contents.lookup(digest) is None:
+            try:
+                os.remove(self._path(digest))
+            except OSError:
+                pass
+
+    def _prune(self):
+        """
+        Drop renders of other presets or older DSP versions, and of secrets
+        that were deleted while we weren't running.
+        """
+        suffix = f".{self.key}.wav"
+        for de in os.scandir(self.directory):
+            if not de.name.endswith(suffix) or self.contents.lookup(de.name[:-len(suffix)]) is None:
+                try:
+                    os.remove(de.path)
+                except OSError:
+                    pass
+
+
+if __name__ == "__main__":
+    # Audition a preset: python effects.py tree in.wav out.wav
+    if len(sys.argv) != 4 or sys.argv[1] not in PRESETS:
+        print(__doc__)
+        sys.exit(1)
+    with wave.open(sys.argv[2], 'rb') as wf:
+        params = (wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+    render_file(sys.argv[2], sys.argv[3], *params, PRESETS[sys.argv[1]])
+    print(f"[EFFECTS] Wrote {sys.argv[3]}")
@@ -0,0 +1,66 @@
+"""
+Audio backend selection. Everything that touches sound goes through a
+PyAudio-compatible object from open_audio(): the real PyAudio on the Pi, or
+sim.SimAudio (array/file-backed mic, recording sink, adjustable clock) for
+running headless. Pick with WILLOW_AUDIO=pyaudio|sim or open_audio(backend).
+
+The PortAudio constants the engine needs are mirrored here so that nothing
+imports pyaudio just for a flag value.
+"""
+import os
+
+try:
+    import pyaudio
+except ImportError:   # plain Linux box without PortAudio
+    pyaudio = None
+
+BACKEND = os.environ.get("WILLOW_AUDIO", "pyaudio")
+
+# Same values as portaudio.h / pyaudio
+paFloat32 = 1
+paInt32 = 2
+paInt24 = 4
+paInt16 = 8
+paInt8 = 16
+paUInt8 = 32
+paContinue = 0
+paComplete = 1
+paInputUnderflow = 1
+paInputOverflow = 2
+paOutputUnderflow = 4
+paOutputOverflow = 8
+
+_SAMPLE_SIZES = {paFloat32: 4, paInt32: 4, paInt24: 3, paInt16: 2, paInt8: 1, paUInt8: 1}
+_WIDTH_FORMATS = {1: paUInt8, 2: paInt16, 3: paInt24, 4: paFloat32}
+
+
+def get_sample_size(format):
+    return _SAMPLE_SIZES[format]
+
+
+def get_format_from_width(width):
+    return _WIDTH_FORMATS[width]
+
+
+def pin_thread(cpus):
+    """Restrict the calling thread to the given CPU numbers; a no-op if unsupported or cpus is empty."""
+    if not cpus:
+        return False
+    try:
+        os.sched_setaffinity(0, cpus)
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+def open_audio(backend=None, **kwargs):
+    """A PyAudio-like object for the chosen backend; kwargs go to sim.SimAudio."""
+    backend = backend or BACKEND
+    if backend == "sim":
+        import sim
+        return sim.SimAudio(**kwargs)
+    if backend != "pyaudio":
+        raise ValueError(f"unknown audio backend {backend!r}")
+    if pyaudio is None:
+        raise RuntimeError("PyAudio is not installed; set WILLOW_AUDIO=sim to run without audio hardware")
+    return pyaudio.PyAudio()
@@ -0,0 +1,196 @@
+import concurrent.futures
+import multiprocessing
+import os
+import sys
+import threading
+import wave
+
+import numpy as np
+
+TEMP_PREFIX = ".ingest_"
+WORKER_NICE = 10          # keep conversions from competing with playback
+RESAMPLE_TAPS = 63        # anti-aliasing FIR length when downsampling
+
+
+def _decode(raw, sampwidth):
+    """Interleaved PCM bytes -> float32 in [-1, 1)."""
+    if sampwidth == 1:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if sampwidth == 2:
+        return np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    if sampwidth == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        v = np.where(v & 0x800000, v - 0x1000000, v)
+        return v.astype(np.float32) / 8388608.0
+    if sampwidth == 4:
+        return np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+    raise ValueError(f"unsupported sample width {sampwidth}")
+
+
+def _encode(samples, sampwidth):
+    if sampwidth != 2:
+        raise ValueError(f"unsupported output sample width {sampwidth}")
+    return (np.clip(samples, -1.0, 32767 / 32768) * 32768.0).astype('<i2').tobytes()
+
+
+def _resample(samples, src_rate, dst_rate):
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    if dst_rate < src_rate:
+        # Windowed-sinc low-pass at the new Nyquist before decimating.
+        cutoff = dst_rate / src_rate / 2
+        n = np.arange(RESAMPLE_TAPS) - (RESAMPLE_TAPS - 1) / 2
+        taps = np.sinc(2 * cutoff * n) * np.hamming(RESAMPLE_TAPS)
+        samples = np.convolve(samples, (taps / taps.sum()).astype(np.float32), mode='same')
+    n_out = int(round(len(samples) * dst_rate / src_rate))
+    t = np.arange(n_out, dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(t, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def convert_file(path, rate, channels, sampwidth):
+    """
+    Rewrite path in place as rate/channels/sampwidth PCM. The converted file
+    is written next to it under a hidden temp name and moved over the
+    original, so readers only ever see the old or the new file.
+    Returns (path, old_params, new_nframes), or None if already canonical.
+    """
+    with wave.open(path, 'rb') as wf:
+        src = (wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+        if src == (rate, channels, sampwidth):
+            return None
+        raw = wf.readframes(wf.getnframes())
+
+    pcm = convert_pcm(raw, src, rate, channels, sampwidth)
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, TEMP_PREFIX + name)
+    try:
+        with wave.open(tmp_path, 'wb') as wf:
+            wf.setnchannels(channels)
+            wf.setsampwidth(sampwidth)
+            wf.setframerate(rate)
+            wf.writeframes(pcm)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path, src, len(pcm) // (channels * sampwidth)
+
+
+def convert_pcm(raw, src, rate, channels, sampwidth):
+    """raw PCM in src = (rate, channels, sampwidth), as rate/channels/sampwidth PCM bytes."""
+    samples = _decode(raw, src[2]).reshape(-1, src[1])
+    if src[1] != channels:
+        mono = samples.mean(axis=1)
+        samples = np.repeat(mono[:, None], channels, axis=1) if channels > 1 else mono[:, None]
+    out = np.stack([_resample(samples[:, c], src[0], rate) for c in range(channels)], axis=1)
+    return _encode(out.reshape(-1), sampwidth)
+
+
+def _worker_init():
+    try:
+        os.nice(WORKER_NICE)
+    except OSError:
+        pass
+
+
+def make_pool(workers=None):
+    # forkserver: don't fork a process that has PortAudio threads running.
+    ctx = multiprocessing.get_context("forkserver")
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(), mp_context=ctx, initializer=_worker_init)
+
+
+class Ingestor:
+    """
+    Watches the catalog and converts any secret that isn't in the canonical
+    rate/channels/sample width, on a process pool so bulk imports use every
+    core and playback never waits on the conversion.
+    """
+
+    def __init__(self, secrets, rate, channels, sampwidth, workers=None):
+        self.catalog = secrets
+        self.rate = rate
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._in_flight = set()
+
+        self.converted = 0
+        self.failed = 0
+
+    def start(self):
+        if self._pool is not None:
+            return
+        self._pool = make_pool(self.workers)
+        self.catalog.add_listener(self._on_catalog_event)
+        for entry in self.catalog.entries():
+            self.submit(entry)
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def is_canonical(self, entry):
+        return (entry.rate, entry.channels, entry.sampwidth) == (self.rate, self.channels, self.sampwidth)
+
+    @property
+    def pending(self):
+        return len(self._in_flight)
+
+    def submit(self, entry):
+        if self._pool is None or self.is_canonical(entry):
+            return None
+        with self._lock:
+            if entry.path in self._in_flight:
+                return None
+            self._in_flight.add(entry.path)
+        future = self._pool.submit(convert_file, entry.path, self.rate, self.channels, self.sampwidth)
+        future.add_done_callback(lambda f, path=entry.path: self._done(path, f))
+        return future
+
+    def _on_catalog_event(self, event, name, entry):
+        if entry is not None:
+            self.submit(entry)
+
+    def _done(self, path, future):
+        with self._lock:
+            self._in_flight.discard(path)
+        if future.cancelled():
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            self.failed += 1
+            print(f"[INGEST] Could not convert {path}: {e}")
+            return
+        if result is not None:
+            self.converted += 1
+            _, (rate, channels, sampwidth), _ = result
+            print(f"[INGEST] Normalized {path} ({rate}Hz x{channels}, {sampwidth * 8}-bit)")
+            self.catalog.add(path)
+
+
+if __name__ == "__main__":
+    # Bulk-normalize a directory, e.g. after scp'ing a batch of WAVs in:
+    #   python ingest.py [/home/ivyblossom/secrets]
+    import hal
+    import willow
+    directory = sys.argv[1] if len(sys.argv) > 1 else willow.SECRETS_DIR
+    paths = [os.path.join(directory, f) for f in sorted(os.listdir(directory))
+             if f.endswith('.wav') and not f.startswith('.')]
+    with make_pool() as pool:
+        futures = {pool.submit(convert_file, p, willow.RATE, willow.CHANNELS,
+                               hal.get_sample_size(willow.FORMAT)): p for p in paths}
+        done = 0
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                if future.result() is not None:
+                    done += 1
+                    print(f"[INGEST] Normalized {futures[future]}")
+            except Exception as e:
+                print(f"[INGEST] Could not convert {futures[future]}: {e}")
+    print(f"[INGEST] {done} of {len(paths)} files converted")
@@ -0,0 +1,170 @@
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+STORE_NAME = ".loudness.json"   # hidden, so the catalog never mistakes it for a secret
+TARGET_DBFS = -20.0             # RMS level every secret is brought to
+MAX_BOOST_DB = 18.0             # don't turn near-silent recordings into hiss
+PEAK_CEILING_DBFS = -1.0        # never push a secret's peak above this
+BLOCK_SAMPLES = 1 << 20         # analysis block, keeps the float copy small
+SAVE_DELAY = 2.0                # batch writes of the store during bulk analysis
+
+
+def analyze(pcm, sampwidth=2):
+    """
+    RMS and peak level of int16 PCM in dBFS, as (rms_db, peak_db). Returns
+    None for other sample widths (the ingestor converts those first).
+    """
+    if sampwidth != 2:
+        return None
+    samples = np.frombuffer(pcm, dtype='<i2')
+    if len(samples) == 0:
+        return None
+    total = 0.0
+    peak = 0
+    for i in range(0, len(samples), BLOCK_SAMPLES):
+        block = samples[i:i + BLOCK_SAMPLES].astype(np.float32)
+        total += float(np.dot(block, block))
+        peak = max(peak, int(block.max()), -int(block.min()))
+    rms = (total / len(samples)) ** 0.5
+    return (float(20.0 * np.log10(max(rms, 1.0) / 32768.0)),
+            float(20.0 * np.log10(max(peak, 1) / 32768.0)))
+
+
+def gain_for(levels):
+    """Linear gain that brings a secret to TARGET_DBFS without clipping."""
+    if levels is None:
+        return 1.0
+    rms_db, peak_db = levels
+    gain_db = min(TARGET_DBFS - rms_db, MAX_BOOST_DB, PEAK_CEILING_DBFS - peak_db)
+    return float(10.0 ** (gain_db / 20.0))
+
+
+def apply_gain(chunk, gain):
+    """Scale a chunk of int16 PCM bytes; a no-op at unity gain."""
+    if gain == 1.0:
+        return chunk
+    samples = np.frombuffer(chunk, dtype='<i2').astype(np.float32)
+    samples *= np.float32(gain)
+    np.clip(samples, -32768, 32767, out=samples)
+    return samples.astype('<i2').tobytes()
+
+
+class LoudnessStore:
+    """
+    Measures every secret once and remembers the result in a JSON file next
+    to the secrets, keyed by name and checked against size/mtime. Hook
+    on_catalog_event() up as a catalog listener: new and changed secrets are
+    measured on a background thread and the result is attached to the
+    catalog entry as entry.loudness, so playback only has to multiply.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, STORE_NAME)
+        self._lock = threading.Lock()
+        self._levels = {}    # name -> {"size", "mtime", "rms_db", "peak_db"}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._dirty = False
+
+        self.analyzed = 0
+        self.failed = 0
+
+    def start(self, secrets):
+        if self._thread is not None:
+            return
+        self._load()
+        secrets.add_listener(self.on_catalog_event)
+        for entry in secrets.entries():
+            self.on_catalog_event('added', entry.name, entry)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def on_catalog_event(self, event, name, entry):
+        if entry is None:
+            with self._lock:
+                self._dirty |= self._levels.pop(name, None) is not None
+            return
+        levels = self.lookup(entry)
+        if levels is not None:
+            entry.loudness = levels
+        else:
+            self._queue.put(entry)
+
+    def lookup(self, entry):
+        with self._lock:
+            rec = self._levels.get(entry.name)
+        if rec is None or rec["size"] != entry.size or rec["mtime"] != entry.mtime:
+            return None
+        return rec["rms_db"], rec["peak_db"]
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    # -- internals ---------------------------------------------------------
+
+    def _run(self):
+        while True:
+            try:
+                entry = self._queue.get(timeout=SAVE_DELAY)
+            except queue.Empty:
+                self._save()
+                continue
+            if entry is None:
+                break
+            try:
+                levels = analyze(entry.read_pcm(), entry.sampwidth)
+            except FileNotFoundError:
+                continue   # deleted (e.g. by retention.py) before we got to it
+            except Exception as e:
+                self.failed += 1
+                print(f"[LOUDNESS] Could not analyze {entry.name}: {e}")
+                continue
+            if levels is None:
+                continue
+            entry.loudness = levels
+            with self._lock:
+                self._levels[entry.name] = {
+                    "size": entry.size, "mtime": entry.mtime,
+                    "rms_db": round(levels[0], 2), "peak_db": round(levels[1], 2),
+                }
+                self._dirty = True
+            self.analyzed += 1
+        self._save()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[LOUDNESS] Ignoring unreadable {self.path}: {e}")
+            return
+        with self._lock:
+            self._levels = data
+
+    def _save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._levels)
+            self._dirty = False
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[LOUDNESS] Could not save {self.path}: {e}")
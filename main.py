@@ -6,10 +6,11 @@ Simplified Whispering Willow Test - Just Audio, No GPIO
 import pyaudio
 import wave
 import os
-import random
 import time
 from datetime import datetime
-import asyncio
+import catalog
+import devices
+import wavstream
 
 # Audio settings that worked in test_audio.py
 CHUNK = 2048
@@ -17,6 +18,8 @@ FORMAT = pyaudio.paInt16
 CHANNELS = 1
 RATE = 16000
 RECORD_SECONDS = 5  # Shorter for testing
+INPUT_DEVICE = "Samson Go Mic"
+OUTPUT_DEVICE = "bcm2835 Headphones"
 
 # Directories
 SECRETS_DIR = "/home/pi/whispering_willow/secrets"
@@ -34,17 +37,19 @@ class SimpleWillow:
         if not os.path.exists(SECRETS_DIR):
             os.makedirs(SECRETS_DIR)
             print(f"📁 Created directory: {SECRETS_DIR}")
+
+        self.catalog = catalog.SecretsCatalog(SECRETS_DIR)
+        self.catalog.start()
         
         # List audio devices
         print("\n📊 Audio devices:")
-        for i in range(self.audio.get_device_count()):
-            info = self.audio.get_device_info_by_index(i)
-            print(f"  {i}: {info['name']} - In:{info['maxInputChannels']} Out:{info['maxOutputChannels']}")
+        self.devices = devices.DeviceManager(self.audio)
+        for info in self.devices.devices:
+            print(f"  {info['index']}: {info['name']} - In:{info['maxInputChannels']} Out:{info['maxOutputChannels']}")
         
-        # Use device 0 for input (Samson Go Mic)
-        self.input_device = 1
-        # Use device 1 for output (bcm2835 Headphones)
-        self.output_device = 11
+        # Look devices up by name; their indices move when USB devices are re-plugged
+        self.input_device = self.devices.find(INPUT_DEVICE, 'input')
+        self.output_device = self.devices.find(OUTPUT_DEVICE, 'output')
         
         print(f"\n✅ Using input device: {self.input_device}")
         print(f"✅ Using output device: {self.output_device}")
@@ -69,6 +74,7 @@ class SimpleWillow:
             
             print("Recording for 5 seconds... Speak now!")
             frames = []
+            overflows = []  # seconds into the recording where input overflowed
             
             # Record
             for i in range(int(RATE / CHUNK * RECORD_SECONDS)):
@@ -80,11 +86,13 @@ class SimpleWillow:
                     if i % 10 == 0:
                         print(".", end="", flush=True)
                 except IOError as e:
+                    # The chunk is gone; note where instead of padding with silence
+                    overflows.append(round(len(frames) * CHUNK / RATE, 3))
                     print(f"\nIOError: {e}")
-                    # Continue anyway
-                    frames.append(b'\x00' * CHUNK * 2)
             
             print("\n✅ Recording complete!")
+            if overflows:
+                print(f"⚠️  {len(overflows)} overflow(s) at {overflows} s")
             
             # Close stream
             stream.stop_stream()
@@ -103,6 +111,9 @@ class SimpleWillow:
                 if os.path.exists(filename):
                     size = os.path.getsize(filename)
                     print(f"📝 Saved: {filename} ({size} bytes)")
+                    wavstream.RecordingLog(SECRETS_DIR).add(
+                        filename, chunks=len(frames), chunk_frames=CHUNK, overflows=overflows)
+                    self.catalog.add(filename)
                     return filename
                 else:
                     print("❌ File not saved!")
@@ -115,12 +126,10 @@ class SimpleWillow:
             return None
 
     def get_secrets(self):
-        return [f for f in os.listdir(SECRETS_DIR) if f.endswith('.wav')]
+        return self.catalog.names()
 
     def play_random_secret(self):
-        files = self.get_secrets()
-        filepath = os.path.join(SECRETS_DIR, random.choice(files))
-        self.play_secret(filepath)
+        self.play_secret(self.catalog.choice().path)
         
     def play_secret(self, filepath):
         """Simple playback function"""
@@ -158,6 +167,7 @@ class SimpleWillow:
 
     def cleanup(self):
         """Clean up"""
+        self.catalog.stop()
         self.audio.terminate()
         print("👋 Cleanup complete")
 
@@ -185,11 +195,10 @@ def interactive_main():
         elif choice == '2':
             willow.play_random_secret()
         elif choice == '3':
-            files = willow.get_secrets()
-            print(f"\n📚 Found {len(files)} secrets:")
-            for f in files:
-                size = os.path.getsize(os.path.join(SECRETS_DIR, f))
-                print(f"  - {f} ({size} bytes)")
+            entries = willow.catalog.entries()
+            print(f"\n📚 Found {len(entries)} secrets:")
+            for e in entries:
+                print(f"  - {e.name} ({e.size} bytes, {e.duration:.1f}s)")
         elif choice == 'q':
             break
         else:
@@ -199,28 +208,10 @@ def interactive_main():
     print("Goodbye!")
 
 def art_main():
-    willow = SimpleWillow()
-    loop = asyncio.get_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.create_task(play_secrets_continuously(willow))
-    loop.create_task(record_secrets_on_button(willow))
-    loop.run_forever()
-
-async def play_secrets_continuously(willow):
-    while True:
-        willow.play_random_secret()
-        await asyncio.sleep(3)
-
-async def record_secrets_on_button(willow):
-    while True:
-        print("Press space to play make a recording.")
-        choice = input("...").strip().lower()
-        if choice == ' ':
-            print("Recording secret")
-            willow.record_secret()
-        else:
-            print("Wrong key, dumb ass.")
-        await asyncio.sleep(1)
+    """Continuous playback with Enter-to-record, on the shared asyncio runtime."""
+    import button
+    import runtime
+    runtime.main(button.KeyboardButton())
 
 if __name__ == "__main__":
     art_main()
@@ -0,0 +1,192 @@
+"""
+Counters and gauges for the running installation, readable over HTTP in
+the Prometheus text format and flushed to a JSON stats file.
+
+Nothing here runs on the audio path: the engine keeps its own plain
+integer counters (underruns, overflows, ...) and the registry only reads
+their stats() dicts when someone scrapes or the stats file is written.
+Event counters that are bumped directly (secrets played, recordings
+saved) live off the callback threads.
+
+    curl -s localhost:9108/metrics
+    curl -s localhost:9108/stats.json
+"""
+import json
+import os
+import threading
+import time
+
+PORT = 9108                 # 0 disables the HTTP endpoint
+HOST = "127.0.0.1"          # local only; reach it over SSH
+
+
+class Counter:
+    def __init__(self, name, help, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+
+class Gauge:
+    def __init__(self, name, help, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+
+class Registry:
+    """
+    Holds counters/gauges and collectors. A collector is a stats() function
+    whose numeric values become <prefix>_<key> metrics at read time; keys
+    listed in counters are exported as monotonically increasing counters.
+    Labels given to add_stats() (e.g. station="oak") go on each of them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}     # (name, labels) -> Counter | Gauge
+        self._collectors = []  # (prefix, fn, counters, help, labels)
+        self.started = time.time()
+
+    def counter(self, name, help="", **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help="", **labels):
+        return self._get(Gauge, name, help, labels)
+
+    def add_stats(self, prefix, fn, counters=(), help="", **labels):
+        with self._lock:
+            self._collectors.append((prefix, fn, frozenset(counters), help, labels))
+
+    def samples(self):
+        """(name, kind, help, labels, value) for every metric, collectors included."""
+        out = [("willow_uptime_seconds", "gauge", "Seconds since start", {},
+                time.time() - self.started)]
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for m in metrics:
+            kind = "counter" if isinstance(m, Counter) else "gauge"
+            out.append((m.name, kind, m.help, m.labels, m.value))
+        for prefix, fn, counters, help, labels in collectors:
+            try:
+                stats = fn()
+            except Exception as e:
+                print(f"[METRICS] Collector {prefix} failed: {e}")
+                continue
+            for key, value in (stats or {}).items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                if key in counters:
+                    out.append((f"{prefix}_{key}_total", "counter", help, labels, value))
+                else:
+                    out.append((f"{prefix}_{key}", "gauge", help, labels, value))
+        return out
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        seen = set()
+        for name, kind, help, labels, value in sorted(self.samples(), key=lambda s: s[0]):
+            if name not in seen:
+                seen.add(name)
+                if help:
+                    lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+            if labels:
+                label_text = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+                lines.append(f"{name}{{{label_text}}} {_format(value)}")
+            else:
+                lines.append(f"{name} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Flat {name or name{labels}: value} dict, for the stats file."""
+        snap = {"timestamp": time.time()}
+        for name, _kind, _help, labels, value in self.samples():
+            if labels:
+                name += "{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}"
+            snap[name] = value
+        return snap
+
+    def write_file(self, path):
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f, indent=1, sort_keys=True)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[METRICS] Could not write {path}: {e}")
+
+    def _get(self, cls, name, help, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = cls(name, help, labels)
+            return metric
+
+
+def _format(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class MetricsServer:
+    """GET /metrics (Prometheus text) and /stats.json on a daemon thread."""
+
+    def __init__(self, registry, port=PORT, host=HOST):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self._server = None
+
+    def start(self):
+        if self._server is not None or not self.port:
+            return
+        import http.server  # only when serving; keeps startup light
+        registry = self.registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = registry.render().encode()
+                    ctype = "text/plain; version=0.0.4"
+                elif self.path == "/stats.json":
+                    body = json.dumps(registry.snapshot(), sort_keys=True).encode()
+                    ctype = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            print(f"[METRICS] Could not listen on {self.host}:{self.port}: {e}")
+            return
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"[METRICS] Serving http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,140 @@
+import collections
+import time
+
+import numpy as np
+
+LIMIT = 0.98 * 32767      # limiter ceiling, in int16 units
+RELEASE_PER_BLOCK = 0.05  # how fast limiter gain recovers toward 1.0
+
+
+class _Voice:
+    def __init__(self, samples, gain):
+        self.samples = samples
+        self.gain = gain
+        self.pos = 0
+
+
+class Mixer:
+    """
+    Sums up to max_voices overlapping secrets on top of the main playback
+    stream. Everything is int16 mono in the engine's format; mixing is done
+    in float32 with NumPy, followed by a block-level peak limiter so several
+    loud voices can't clip.
+
+    add_voice() may be called from any thread; voices are handed to the
+    audio callback through a deque and only the callback touches the
+    active list.
+    """
+
+    def __init__(self, max_voices):
+        self.max_voices = max_voices
+        self._pending = collections.deque()
+        self._voices = []
+        self._limiter_gain = 1.0
+
+        self.blocks = 0
+        self.limited_blocks = 0
+        self.render_total = 0.0
+        self.render_max = 0.0
+
+    @property
+    def active_voices(self):
+        return len(self._voices) + len(self._pending)
+
+    def add_voice(self, pcm, gain=0.5):
+        """Overlay a secret's int16 PCM at the given gain. False if all voices are busy."""
+        if self.active_voices >= self.max_voices:
+            return False
+        self._pending.append(_Voice(np.frombuffer(pcm, dtype=np.int16), gain))
+        return True
+
+    def mix(self, base):
+        """Mix active voices into base (int16 bytes) and return the result as bytes."""
+        while self._pending:
+            self._voices.append(self._pending.popleft())
+        if not self._voices and self._limiter_gain == 1.0:
+            return base
+
+        t0 = time.perf_counter()
+        out = self.render(np.frombuffer(base, dtype=np.int16))
+        elapsed = time.perf_counter() - t0
+        self.render_total += elapsed
+        if elapsed > self.render_max:
+            self.render_max = elapsed
+        return out.tobytes()
+
+    def render(self, base):
+        acc = base.astype(np.float32)
+        n = len(acc)
+        still_playing = []
+        for v in self._voices:
+            seg = v.samples[v.pos:v.pos + n]
+            acc[:len(seg)] += seg * np.float32(v.gain)
+            v.pos += len(seg)
+            if v.pos < len(v.samples):
+                still_playing.append(v)
+        self._voices = still_playing
+
+        # Peak limiter: drop instantly to the gain that keeps this block
+        # under the ceiling, for the whole block (a ramp down would let the
+        # early peaks through); recover slowly, ramping across the block so
+        # the release doesn't click. A release ramp never exceeds target.
+        peak = float(np.max(np.abs(acc))) if n else 0.0
+        target = min(1.0, LIMIT / peak) if peak > 0 else 1.0
+        start = self._limiter_gain
+        if target < start:
+            end = target
+            self.limited_blocks += 1
+            acc *= np.float32(end)
+        else:
+            end = min(target, start + RELEASE_PER_BLOCK)
+            if start != 1.0 or end != 1.0:
+                acc *= np.linspace(start, end, n, dtype=np.float32)
+        self._limiter_gain = end
+        self.blocks += 1
+
+        np.clip(acc, -32768, 32767, out=acc)
+        return acc.astype(np.int16)
+
+    def stats(self):
+        return {
+            "voices": self.active_voices,
+            "blocks": self.blocks,
+            "limited_blocks": self.limited_blocks,
+            "render_avg_us": (self.render_total / self.blocks * 1e6) if self.blocks else 0.0,
+            "render_max_us": self.render_max * 1e6,
+        }
+
+
+def bench(voice_counts=(1, 2, 4, 8, 16, 32), block=2048, rate=16000, blocks=2000):
+    """
+    Per-block CPU cost of mixing N voices. Run this on the Pi itself to see
+    how many voices fit in the real-time budget (block / rate seconds).
+    """
+    rng = np.random.default_rng(0)
+    budget = block / rate
+    secret = (rng.standard_normal(rate * 30) * 6000).astype(np.int16).tobytes()
+    base = (rng.standard_normal(block) * 6000).astype(np.int16).tobytes()
+    results = []
+    for n in voice_counts:
+        m = Mixer(n)
+        for _ in range(n):
+            m.add_voice(secret, gain=0.5)
+        t0 = time.process_time()
+        for _ in range(blocks):
+            m.mix(base)
+            if m.active_voices < n:
+                m.add_voice(secret, gain=0.5)
+        per_block = (time.process_time() - t0) / blocks
+        results.append({
+            "voices": n,
+            "us_per_block": per_block * 1e6,
+            "budget_pct": per_block / budget * 100.0,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    print("Mixing 2048 frames/block @ 16000 Hz (budget 128 ms/block)")
+    for r in bench():
+        print(f"  {r['voices']:3d} voices: {r['us_per_block']:8.1f} us/block  ({r['budget_pct']:.2f}% of budget)")
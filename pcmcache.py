@@ -0,0 +1,79 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class PCMCache:
+    """
+    Bounded LRU cache of decoded PCM keyed by file path. An entry is only
+    served while the file's size and mtime still match the catalog entry it
+    was loaded from; hook invalidate() up as a catalog listener so changed
+    or deleted files are dropped as soon as the watcher sees them.
+
+    Files bigger than max_item_bytes are never cached (get() returns None)
+    so one long recording can't flush every hot secret.
+    """
+
+    def __init__(self, max_bytes, max_item_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes if max_item_bytes is not None else max_bytes // 8
+        self._lock = threading.Lock()
+        self._items = OrderedDict()   # path -> (size, mtime, pcm)
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, entry):
+        """Decoded frames for a catalog entry, loading them on a miss."""
+        with self._lock:
+            item = self._items.get(entry.path)
+            if item is not None and item[0] == entry.size and item[1] == entry.mtime:
+                self._items.move_to_end(entry.path)
+                self.hits += 1
+                return item[2]
+            self.misses += 1
+        if entry.size > self.max_item_bytes:
+            return None
+
+        pcm = entry.read_pcm()
+
+        with self._lock:
+            self._drop(entry.path)
+            self._items[entry.path] = (entry.size, entry.mtime, pcm)
+            self.bytes += len(pcm)
+            while self.bytes > self.max_bytes and self._items:
+                _, (_, _, old) = self._items.popitem(last=False)
+                self.bytes -= len(old)
+                self.evictions += 1
+        return pcm
+
+    def invalidate(self, event, name, entry):
+        """Catalog listener: forget anything that changed or disappeared."""
+        if event == 'added':
+            return
+        with self._lock:
+            for path in [p for p in self._items if os.path.basename(p) == name]:
+                self._drop(path)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._items),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _drop(self, path):
+        item = self._items.pop(path, None)
+        if item is not None:
+            self.bytes -= len(item[2])
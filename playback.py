@@ -0,0 +1,254 @@
+import queue
+import threading
+import time
+
+import hal
+
+QUEUE_CHUNKS = 8   # chunks buffered ahead of the output callback (~1 s at 2048/16 kHz)
+STALL_SECONDS = 2.0  # no callback for this long means the speaker is gone (devices.py)
+
+
+class _Job:
+    def __init__(self, chunks, silence_before):
+        self.chunks = chunks
+        self.silence_before = silence_before
+        self.done = threading.Event()
+        self.error = None
+        self.started = False
+        # Frames of unscheduled silence the callback had to insert before
+        # the first frame of this secret (i.e. the audible gap).
+        self.gap_frames = 0
+
+
+class PlaybackEngine:
+    """
+    Owns a single callback-mode output stream opened once at the canonical
+    format. A feeder thread turns queued secrets (and the silence before
+    them) into chunks on a bounded queue; PortAudio's callback pulls from
+    that queue and outputs silence whenever it is empty, so the device
+    (e.g. a Bluetooth speaker) never has to resync.
+    """
+
+    def __init__(self, audio, format, channels, rate, chunk, output_device=None,
+                 queue_chunks=QUEUE_CHUNKS, cpus=None):
+        self.audio = audio
+        self.format = format
+        self.channels = channels
+        self.rate = rate
+        self.chunk = chunk
+        self.output_device = output_device
+        self.cpus = cpus   # CPU numbers the callback and feeder threads are pinned to, if any
+        self.frame_bytes = audio.get_sample_size(format) * channels
+
+        self._stream = None
+        self._last_callback = 0.0
+        self._pinned = False
+        self._thread = None
+        self._running = False
+        self._jobs = queue.Queue()
+        self._chunks = queue.Queue(maxsize=queue_chunks)
+        self._leftover = b''
+        self._current = None
+        # Silence output since the last secret ended; counts toward the next
+        # secret's requested gap.
+        self._silent_frames = 0
+        # Optional mixer.Mixer whose voices are overlaid on the output.
+        self.mixer = None
+
+        self.underruns = 0   # callback found the queue empty mid-secret
+        self.xruns = 0       # PortAudio reported an output underflow
+        self.gap_count = 0
+        self.gap_total = 0.0
+        self.gap_max = 0.0
+        self.gap_last = 0.0
+        self.open_seconds = 0.0  # how long the last stream open took
+
+    def start(self):
+        if self._running:
+            return
+        self._open_stream()
+        self._running = True
+        self._thread = threading.Thread(target=self._feed, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        self._close_stream()
+
+    def play(self, chunks, silence_before=0.0, wait=True):
+        """
+        Queue an iterable of PCM chunks (already in the engine's format) to
+        be played after silence_before seconds of silence. Blocks until the
+        secret has been handed to the device unless wait is False.
+        """
+        self.start()
+        job = _Job(chunks, silence_before)
+        self._jobs.put(job)
+        if wait:
+            job.done.wait()
+            if job.error:
+                raise job.error
+        return job
+
+    def detach(self):
+        """Close the stream; queued audio waits until reattach()."""
+        self._close_stream()
+
+    def reattach(self, audio, output_device):
+        self._close_stream()
+        self.audio = audio
+        self.output_device = output_device
+        if self._running:
+            self._open_stream()
+
+    def healthy(self):
+        stream = self._stream
+        if stream is None:
+            return True
+        if not stream.is_active():
+            return False
+        return time.monotonic() - self._last_callback < STALL_SECONDS
+
+    def stats(self):
+        return {
+            "gaps": self.gap_count,
+            "gap_last_ms": self.gap_last * 1000.0,
+            "gap_max_ms": self.gap_max * 1000.0,
+            "gap_avg_ms": (self.gap_total / self.gap_count * 1000.0) if self.gap_count else 0.0,
+            "underruns": self.underruns,
+            "xruns": self.xruns,
+            "queued_chunks": self._chunks.qsize(),
+            "open_ms": self.open_seconds * 1000.0,
+        }
+
+    def _open_stream(self):
+        self._pinned = False   # a new stream gets a new callback thread
+        t0 = time.monotonic()
+        self._stream = self.audio.open(
+            format=self.format,
+            channels=self.channels,
+            rate=self.rate,
+            output=True,
+            output_device_index=self.output_device,
+            frames_per_buffer=self.chunk,
+            stream_callback=self._callback,
+        )
+        self.open_seconds = time.monotonic() - t0
+        self._last_callback = time.monotonic()
+
+    def _close_stream(self):
+        try:
+            if self._stream:
+                self._stream.stop_stream()
+                self._stream.close()
+        except Exception:
+            pass
+        self._stream = None
+
+    # -- feeder thread -----------------------------------------------------
+
+    def _put(self, item):
+        while self._running:
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed(self):
+        hal.pin_thread(self.cpus)
+        while self._running:
+            try:
+                job = self._jobs.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self._current = job
+            try:
+                wanted = int(job.silence_before * self.rate) - self._silent_frames
+                while wanted > 0:
+                    n = min(wanted, self.chunk)
+                    if not self._put((b'\x00' * (n * self.frame_bytes), None)):
+                        break
+                    wanted -= n
+                for data in job.chunks:
+                    if not self._put((data, job)):
+                        break
+            except Exception as e:
+                print(f"[PLAY] Could not read secret: {e}")
+                job.error = e
+            # End-of-secret marker; the callback completes the job when it
+            # gets this far, i.e. once every frame has reached the device.
+            if not self._put((None, job)):
+                job.done.set()
+
+        # Don't leave callers blocked on secrets that will never play.
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            job.error = RuntimeError("playback engine stopped")
+            job.done.set()
+
+    # -- PortAudio callback ------------------------------------------------
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        self._last_callback = time.monotonic()
+        if not self._pinned:
+            self._pinned = True
+            hal.pin_thread(self.cpus)
+        if status & hal.paOutputUnderflow:
+            self.xruns += 1
+        need = frame_count * self.frame_bytes
+        out = self._leftover
+        self._leftover = b''
+        while len(out) < need:
+            try:
+                data, job = self._chunks.get_nowait()
+            except queue.Empty:
+                break
+            if data is None:
+                self._finish(job)
+                continue
+            if job is not None:
+                if not job.started:
+                    job.started = True
+                    self._record_gap(job.gap_frames / self.rate)
+                self._silent_frames = 0
+            else:
+                self._silent_frames += len(data) // self.frame_bytes
+            out += data
+
+        if len(out) < need:
+            missing = need - len(out)
+            job = self._current
+            if job is not None and not job.done.is_set():
+                self.underruns += 1
+                if not job.started:
+                    job.gap_frames += missing // self.frame_bytes
+            else:
+                self._silent_frames += missing // self.frame_bytes
+            out += b'\x00' * missing
+        elif len(out) > need:
+            self._leftover = out[need:]
+            out = out[:need]
+        if self.mixer is not None:
+            out = self.mixer.mix(out)
+        return (out, hal.paContinue)
+
+    def _finish(self, job):
+        if self._current is job:
+            self._current = None
+        job.done.set()
+
+    def _record_gap(self, seconds):
+        self.gap_last = seconds
+        self.gap_total += seconds
+        self.gap_count += 1
+        if seconds > self.gap_max:
+            self.gap_max = seconds
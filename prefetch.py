@@ -0,0 +1,120 @@
+"""
+Gets the next secret ready while the current one is playing: a worker
+thread picks it and reads it (or, for one too big to hold, its first
+seconds) into memory, so when its turn comes playback starts from RAM and
+a slow SD card read never lands in the gap between secrets.
+
+stats() counts hits (ready in time), misses (nothing ready: picked and
+read on the spot) and, among the misses, late ones (still loading when
+needed) and stale ones (changed or deleted after loading). Lead time is
+how long a hit sat ready before it was needed.
+"""
+import concurrent.futures
+import threading
+import time
+
+
+class Prefetcher:
+    def __init__(self, pick, load, valid=None, name="prefetch", unpick=None):
+        self.pick = pick          # () -> entry; raises IndexError when there's nothing to play
+        self.load = load          # entry -> what playback needs (e.g. PCM chunks)
+        self.valid = valid        # entry -> False once it changed since loading
+        self.unpick = unpick      # entry -> None: a pick that won't be played after all
+        self._executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._future = None
+
+        self.hits = 0
+        self.misses = 0
+        self.late = 0
+        self.stale = 0
+        self.lead_last = 0.0
+        self.lead_min = None
+        self.lead_total = 0.0
+        self.load_last = 0.0      # seconds the last load took
+
+    def schedule(self):
+        """Start getting the next secret ready, unless that's already under way."""
+        with self._lock:
+            if self._future is not None or self._executor is None:
+                return
+            try:
+                self._future = self._executor.submit(self._fetch)
+            except RuntimeError:   # shut down
+                pass
+
+    def take(self):
+        """(entry, loaded) for the next secret: the prefetched one if it's usable."""
+        now = time.monotonic()
+        with self._lock:
+            future, self._future = self._future, None
+        if future is not None:
+            late = not future.done()
+            try:
+                entry, loaded, ready_at = future.result()
+            except Exception:
+                entry = None   # e.g. the catalog was empty; try again below
+            if entry is not None and (self.valid is None or self.valid(entry)):
+                if not late:
+                    self._hit(now - ready_at)
+                    return entry, loaded
+                self.late += 1
+                self.misses += 1
+                return entry, loaded
+            if entry is not None:
+                self.stale += 1
+                self._give_back(entry)
+        self.misses += 1
+        entry = self.pick()
+        return entry, self.load(entry)
+
+    def stop(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            future, self._future = self._future, None
+        if future is not None:
+            # Still pending at shutdown: not played, so not really picked.
+            future.add_done_callback(self._give_back_result)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        taken = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "late": self.late,
+            "stale": self.stale,
+            "hit_rate": self.hits / taken if taken else 0.0,
+            "lead_last_ms": self.lead_last * 1000.0,
+            "lead_min_ms": (self.lead_min or 0.0) * 1000.0,
+            "lead_avg_ms": self.lead_total / self.hits * 1000.0 if self.hits else 0.0,
+            "load_last_ms": self.load_last * 1000.0,
+        }
+
+    def _fetch(self):
+        t0 = time.monotonic()
+        entry = self.pick()
+        loaded = self.load(entry)
+        ready_at = time.monotonic()
+        self.load_last = ready_at - t0
+        return entry, loaded, ready_at
+
+    def _give_back(self, entry):
+        if self.unpick is not None:
+            try:
+                self.unpick(entry)
+            except Exception as e:
+                print(f"[PREFETCH] Could not return {entry.name}: {e}")
+
+    def _give_back_result(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._give_back(future.result()[0])
+
+    def _hit(self, lead):
+        self.hits += 1
+        self.lead_last = lead
+        self.lead_total += lead
+        if self.lead_min is None or lead < self.lead_min:
+            self.lead_min = lead
@@ -1,10 +1,11 @@
 import pygame
-import random
-import os
+import catalog
 
 SECRETS_DIR = "/home/ivyblossom/secrets"
 
 pygame.mixer.init()
+secrets = catalog.SecretsCatalog(SECRETS_DIR)
+secrets.start()
 
 def play_audio_file(filepath):
     sound = pygame.mixer.Sound(filepath)
@@ -12,11 +13,10 @@ def play_audio_file(filepath):
     pygame.time.wait(int(sound.get_length() * 1000))
 
 def get_secrets():
-    return [f for f in os.listdir(SECRETS_DIR) if f.endswith('.wav')]
+    return secrets.names()
 
 def play_random_secret():
-    files = get_secrets()
-    filepath = os.path.join(SECRETS_DIR, random.choice(files))
+    filepath = secrets.choice().path
     print("Playing secret: ", filepath)
     play_audio_file(filepath)
 
@@ -0,0 +1,294 @@
+"""
+Keeps the secrets directory inside a budget so a long event can't fill
+the SD card. Limits (any can be off):
+
+    max_bytes      total size of all secrets, plus their effects renders
+                   (renders, an effects.EffectsRenderer) when there are any
+    max_count      number of secrets
+    max_age        seconds since a secret was recorded
+    min_free       free space to leave on the card
+
+When a limit is exceeded, secrets are evicted according to keep:
+
+    "recent"        oldest go first
+    "least_played"  most-played go first (oldest first among equals)
+
+Everything runs on one low-priority thread working from the catalog's
+in-memory entries (no directory listings). Eviction happens a few files at
+a time with a pause in between, and waits while a recording is running,
+so it never competes with capture or playback for the card. With
+cold_dir set, evicted secrets are gzipped there instead of being deleted
+(gunzip gives back a playable WAV); put it on another disk, such as a USB
+stick, if min_free is what's being enforced: on the same card, archiving
+frees too little to count on, so min_free is not enforced then. Nor is it
+while the card is short by more than all the secrets together take up,
+since deleting every one of them wouldn't close the gap. A secret that
+can't be evicted (e.g. EACCES) is skipped for RETRY_FAILED seconds instead
+of being retried every step.
+
+stats() includes a forecast: how many hours the headroom left before
+eviction kicks in lasts at the recent recording rate.
+"""
+import collections
+import gzip
+import heapq
+import io
+import os
+import shutil
+import threading
+import time
+import wave
+
+CHECK_SECONDS = 60.0      # how often limits are checked (also woken by new secrets)
+BATCH = 4                 # secrets evicted per step...
+BATCH_PAUSE = 2.0         # ...with this many seconds between steps
+RATE_WINDOW = 86400.0     # recording rate is measured over the last day
+NICE = 10                 # the eviction thread yields CPU and I/O to everything else
+RETRY_FAILED = 3600.0     # seconds before a secret that failed to evict is tried again
+
+KEEP_POLICIES = ("recent", "least_played")
+
+
+class RetentionManager:
+    def __init__(self, secrets, directory, max_bytes=0, max_count=0, max_age=0,
+                 min_free=0, keep="recent", cold_dir=None, history=None, busy=None,
+                 renders=None):
+        if keep not in KEEP_POLICIES:
+            raise ValueError(f"unknown retention policy {keep!r}; choose from {', '.join(KEEP_POLICIES)}")
+        self.catalog = secrets
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.max_age = max_age
+        self.keep = keep
+        self.cold_dir = cold_dir
+        self.history = history    # scheduler.PlayHistory, for "least_played"
+        self.busy = busy          # returns True while eviction should wait
+        self.renders = renders    # effects.EffectsRenderer; its cache is freed with the secrets
+        # A packed archive only tombstones deletions, so evicting from it
+        # never frees space; only the other limits apply there.
+        self.reclaims = not hasattr(secrets, "delete")
+        self.min_free = min_free if self.reclaims else 0
+        if self.min_free and cold_dir and _same_disk(cold_dir, directory):
+            print(f"[RETAIN] {cold_dir} is on the same disk as the secrets; not enforcing min_free")
+            self.min_free = 0
+
+        self._lock = threading.Lock()
+        self._sizes = {}          # name -> size, kept by the catalog listener
+        self.total_bytes = 0
+        self._added = collections.deque()   # (time.time(), size) of recent secrets
+        self._failed = {}         # name -> time.monotonic() its eviction failed
+        self._short_warned = False
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self.archived = 0
+        self.failed = 0
+
+    def start(self):
+        if self._running:
+            return
+        cutoff = time.time() - RATE_WINDOW
+        for entry in self.catalog.entries():
+            self.on_catalog_event('added', entry.name, entry)
+        # Seed the rate from what was recorded in the last day, so the
+        # forecast makes sense right after a restart.
+        with self._lock:
+            self._added = collections.deque(sorted(
+                (e.mtime, e.size) for e in self.catalog.entries() if e.mtime >= cutoff))
+        self.catalog.add_listener(self.on_catalog_event)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def on_catalog_event(self, event, name, entry):
+        with self._lock:
+            self.total_bytes -= self._sizes.pop(name, 0)
+            self._failed.pop(name, None)
+            if entry is None:
+                return
+            self._sizes[name] = entry.size
+            self.total_bytes += entry.size
+            if event == 'added' and self._running:
+                self._added.append((time.time(), entry.size))
+        if event == 'added':
+            self._wake.set()
+
+    def rate(self):
+        """Bytes recorded per second over RATE_WINDOW."""
+        now = time.time()
+        with self._lock:
+            while self._added and self._added[0][0] < now - RATE_WINDOW:
+                self._added.popleft()
+            recorded = sum(size for _, size in self._added)
+        return recorded / RATE_WINDOW
+
+    def forecast(self):
+        """Seconds until a byte limit is reached at the current rate, or None."""
+        rate = self.rate()
+        if rate <= 0:
+            return None
+        headroom = []
+        if self.max_bytes:
+            headroom.append(self.max_bytes - self.used_bytes())
+        if self.reclaims:
+            headroom.append(shutil.disk_usage(self.directory).free - self.min_free)
+        if not headroom:
+            return None
+        return max(0.0, min(headroom)) / rate
+
+    def used_bytes(self):
+        """Secrets plus their renders."""
+        return self.total_bytes + (self.renders.bytes if self.renders is not None else 0)
+
+    def stats(self):
+        forecast = self.forecast()
+        return {
+            "secrets": len(self._sizes),
+            "total_bytes": self.total_bytes,
+            "render_bytes": self.renders.bytes if self.renders is not None else 0,
+            "evicted": self.evicted,
+            "evicted_bytes": self.evicted_bytes,
+            "archived": self.archived,
+            "failed": self.failed,
+            "rate_bytes_per_hour": self.rate() * 3600.0,
+            "forecast_hours": forecast / 3600.0 if forecast is not None else None,
+        }
+
+    # -- eviction thread ---------------------------------------------------
+
+    def _run(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), NICE)
+        except (AttributeError, OSError):
+            pass
+        while self._running:
+            self._wake.wait(CHECK_SECONDS)
+            self._wake.clear()
+            try:
+                while self._running and self._step():
+                    self._wake.wait(BATCH_PAUSE)
+            except Exception as e:
+                print(f"[RETAIN] Eviction failed: {e}")
+
+    def _step(self):
+        """Evict one batch. Returns True if limits may still be exceeded."""
+        if self.busy is not None and self.busy():
+            return True
+        victims = self._victims(BATCH)
+        for entry, reason in victims:
+            self._evict(entry, reason)
+        return len(victims) == BATCH
+
+    def _victims(self, limit):
+        entries = self.catalog.entries()
+        if self._failed:
+            now = time.monotonic()
+            with self._lock:
+                for name, failed_at in list(self._failed.items()):
+                    if now - failed_at >= RETRY_FAILED:
+                        del self._failed[name]
+                skip = set(self._failed)
+            entries = [e for e in entries if e.name not in skip]
+        if self.max_age:
+            cutoff = time.time() - self.max_age
+            expired = heapq.nsmallest(limit, (e for e in entries if e.mtime < cutoff),
+                                      key=lambda e: e.mtime)
+            if expired:
+                return [(e, "age") for e in expired]
+
+        over_count = len(entries) - self.max_count if self.max_count else 0
+        used = self.used_bytes()
+        over_bytes = used - self.max_bytes if self.max_bytes else 0
+        short_free = 0
+        if self.min_free:
+            short_free = self.min_free - shutil.disk_usage(self.directory).free
+            if short_free > used:
+                # Something else filled the card; evicting can't get us there.
+                if not self._short_warned:
+                    print(f"[RETAIN] Card is {short_free // (1024 * 1024)}MB short of min_free, more "
+                          f"than all secrets take up; not evicting for free space")
+                    self._short_warned = True
+                short_free = 0
+            else:
+                self._short_warned = False
+        need_bytes = max(over_bytes, short_free)
+        if over_count <= 0 and need_bytes <= 0:
+            return []
+
+        reason = "count" if over_count > 0 else ("bytes" if over_bytes >= short_free else "free")
+        victims = []
+        for entry in heapq.nsmallest(limit, entries, key=self._evict_order):
+            if over_count <= 0 and need_bytes <= 0:
+                break
+            victims.append((entry, reason))
+            over_count -= 1
+            need_bytes -= entry.size
+            if self.renders is not None:
+                need_bytes -= self.renders.freed_by(entry.name)
+        return victims
+
+    def _evict_order(self, entry):
+        if self.keep == "least_played" and self.history is not None:
+            return (-self.history.plays.get(entry.name, 0), entry.mtime)
+        return (entry.mtime,)
+
+    def _evict(self, entry, reason):
+        try:
+            if self.cold_dir:
+                self._archive(entry)
+                self.archived += 1
+            if self.reclaims:
+                os.remove(entry.path)
+                self.catalog.remove(entry.name)
+            else:
+                self.catalog.delete(entry.name)
+        except FileNotFoundError:
+            self.catalog.remove(entry.name)
+            return
+        except Exception as e:
+            self.failed += 1
+            with self._lock:
+                self._failed[entry.name] = time.monotonic()
+            print(f"[RETAIN] Could not evict {entry.name}: {e}; skipping it for {RETRY_FAILED:.0f}s")
+            return
+        self.evicted += 1
+        self.evicted_bytes += entry.size
+        where = f" -> {self.cold_dir}" if self.cold_dir else ""
+        print(f"[RETAIN] Evicted {entry.name} ({reason}, {entry.size} bytes){where}")
+
+    def _archive(self, entry):
+        """Write entry as a gzipped WAV into cold_dir (atomically)."""
+        os.makedirs(self.cold_dir, exist_ok=True)
+        path = os.path.join(self.cold_dir, entry.name + ".gz")
+        tmp_path = path + ".tmp"
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as wf:
+            wf.setnchannels(entry.channels)
+            wf.setsampwidth(entry.sampwidth)
+            wf.setframerate(entry.rate)
+            wf.writeframes(bytes(entry.read_pcm()))
+        with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+            f.write(buf.getvalue())
+        os.replace(tmp_path, path)
+
+
+def _same_disk(a, b):
+    # cold_dir may not exist yet; its nearest existing parent decides.
+    a = os.path.abspath(a)
+    while not os.path.exists(a):
+        a = os.path.dirname(a)
+    try:
+        return os.stat(a).st_dev == os.stat(b).st_dev
+    except OSError:
+        return False
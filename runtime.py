@@ -0,0 +1,303 @@
+"""
+asyncio runtime for the installation: one process, one event loop.
+
+Blocking PyAudio and file work runs in executors; debounced button events
+arrive from the button's own thread (see button.py) through
+loop.call_soon_threadsafe. Playback,
+recording, catalog updates and housekeeping are cooperative tasks that are
+cancelled cleanly on SIGINT/SIGTERM. SIGHUP rescans the secrets directory;
+daemon.py extends that (and the ready/stopping hooks) for systemd.
+
+art.py, momentary.py, record.py, main.py and daemon.py are all thin
+wrappers over this runtime; record.py runs it without playback and with
+fixed-length takes.
+
+Every listening station (station.py) gets its own playback task, its own
+play and record workers and its own button, so one station holding a
+recording never delays another's secrets.
+"""
+import asyncio
+import concurrent.futures
+import os
+import random
+import shutil
+import signal
+import threading
+import time
+
+MIN_SECRET_DELAY = 4
+MAX_SECRET_DELAY = 6
+HOUSEKEEPING_SECONDS = 60
+SHUTDOWN_GRACE_SECONDS = 3.0
+
+
+class WillowRuntime:
+    def __init__(self, willow, button, min_delay=MIN_SECRET_DELAY, max_delay=MAX_SECRET_DELAY,
+                 first_delay=None, make_button=None, playback=True, record_seconds=None):
+        self.willow = willow
+        self.button = button          # the main station's
+        # make_button(pin) builds the buttons of extra stations that have a pin
+        self.make_button = make_button
+        # False runs a recorder only (record.py): no secrets are played
+        self.playback = playback
+        # Fixed-length takes: a press records this many seconds, release is ignored
+        self.record_seconds = record_seconds
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        # Silence before the very first secret; None = the usual random delay
+        self.first_delay = first_delay
+
+        # Separate single workers per station so a long recording never
+        # holds up playback; created on first use.
+        self._executors = {}          # (kind, station name) -> executor
+        self._buttons = []            # (station, button)
+        self._loop = None
+        self._stopping = None
+        self._button_events = None
+        self._catalog_events = None
+        self._recording = {}          # station name -> (task, stop threading.Event)
+        self.loop_lag_max = 0.0
+        self._metrics_server = None
+
+    # -- thread-safe entry points -----------------------------------------
+
+    def _from_thread(self, queue, item):
+        self._loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def on_button_edge(self, kind, t, station=None):
+        self._from_thread(self._button_events, (station, kind, t))
+
+    def on_catalog_event(self, event, name, entry):
+        self._from_thread(self._catalog_events, (event, name, entry))
+
+    def stop(self):
+        if self._loop and self._stopping:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    # -- main --------------------------------------------------------------
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._button_events = asyncio.Queue()
+        self._catalog_events = asyncio.Queue()
+
+        for sig, handler in ((signal.SIGINT, self._stopping.set),
+                             (signal.SIGTERM, self._stopping.set),
+                             (signal.SIGHUP, self._on_sighup)):
+            try:
+                self._loop.add_signal_handler(sig, handler)
+            except (NotImplementedError, RuntimeError, AttributeError):
+                pass
+
+        tasks = []
+        try:
+            # Inside the try: a busy GPIO pin or metrics port still closes
+            # the streams and process pools on the way out.
+            self.willow.catalog.add_listener(self.on_catalog_event)
+            self._start_buttons()
+            self._start_metrics()
+
+            if self.playback:
+                tasks += [
+                    asyncio.create_task(self._playback_task(st), name=f"playback-{st.name}")
+                    for st in self.willow.stations
+                ]
+            tasks += [
+                asyncio.create_task(self._button_task(), name="button"),
+                asyncio.create_task(self._catalog_task(), name="catalog"),
+                asyncio.create_task(self._housekeeping_task(), name="housekeeping"),
+            ]
+            if self.playback and self.willow.mixer is not None:
+                tasks.append(asyncio.create_task(self._voices_task(), name="voices"))
+            if self.playback:
+                print("[MAIN] Playback loop + press-and-hold recording ready. Ctrl+C to exit.")
+            else:
+                print("[MAIN] Waiting for button presses. Ctrl+C to exit.")
+            self._ready()
+            await self._stopping.wait()
+        finally:
+            print("\n[MAIN] Shutting down...")
+            self._shutting_down()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._finish_recording()
+            await self._shutdown()
+
+    # -- hooks (see daemon.py) ---------------------------------------------
+
+    def _ready(self):
+        """Everything is running: streams open, tasks started."""
+
+    def _shutting_down(self):
+        """Shutdown has begun; an in-flight recording is still being finished."""
+
+    def _reload(self):
+        """SIGHUP, on an executor thread: pick up files changed behind our back."""
+        self.willow.catalog.scan()
+
+    def _on_sighup(self):
+        asyncio.ensure_future(self._reload_task())
+
+    async def _reload_task(self):
+        print("[MAIN] Reloading")
+        try:
+            await self._loop.run_in_executor(None, self._reload)
+        except Exception as e:
+            print(f"[MAIN] Reload failed: {e}")
+
+    def _start_buttons(self):
+        w = self.willow
+        self._buttons = [(w.station, self.button)]
+        for st in w.stations[1:]:
+            if st.button is None and st.pin is not None and self.make_button is not None:
+                st.button = self.make_button(st.pin)
+            if st.button is not None:
+                self._buttons.append((st, st.button))
+        for st, btn in self._buttons:
+            btn.start(lambda kind, t, st=st: self.on_button_edge(kind, t, st))
+
+    def _executor(self, kind, station):
+        key = (kind, station.name)
+        executor = self._executors.get(key)
+        if executor is None:
+            executor = self._executors[key] = concurrent.futures.ThreadPoolExecutor(
+                1, thread_name_prefix=f"{kind}-{station.name}")
+        return executor
+
+    def _start_metrics(self):
+        import metrics
+        import willow
+        registry = self.willow.metrics
+        for st, btn in self._buttons:
+            labels = {"station": st.name} if st is not self.willow.station else {}
+            registry.add_stats("willow_button", btn.stats,
+                               counters=("presses", "releases", "holds", "glitches", "missed_edges"),
+                               help="Debounced button input", **labels)
+        registry.add_stats("willow_loop", lambda: {
+            "lag_max_ms": self.loop_lag_max * 1000.0,
+            "recording": len(self._recording)})
+        self._metrics_server = metrics.MetricsServer(registry, willow.METRICS_PORT)
+        self._metrics_server.start()
+
+    async def _shutdown(self):
+        for _st, btn in self._buttons:
+            try:
+                btn.stop()
+            except Exception:
+                pass
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+        # Stopping the engine releases any play() still blocked in the executor.
+        await self._loop.run_in_executor(None, self.willow.close)
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        print("[MAIN] Shutdown complete.")
+
+    # -- tasks -------------------------------------------------------------
+
+    async def _playback_task(self, station):
+        delay = self.first_delay
+        executor = self._executor("play", station)
+        while True:
+            if delay is None:
+                delay = random.randint(self.min_delay, self.max_delay)
+            try:
+                await self._loop.run_in_executor(
+                    executor, self.willow.play_random_secret, delay, station)
+            except asyncio.CancelledError:
+                raise
+            except IndexError:
+                # Empty catalog; wait for the first secret to arrive.
+                await asyncio.sleep(1.0)
+            except Exception as e:
+                print(f"[MAIN] Playback error: {e}")
+                await asyncio.sleep(1.0)
+            delay = None
+
+    async def _voices_task(self):
+        """Polyphonic mode: keep overlaying extra whispers at random gains."""
+        while True:
+            await asyncio.sleep(random.uniform(self.min_delay, self.max_delay))
+            try:
+                await self._loop.run_in_executor(
+                    None, self.willow.add_voice, random.uniform(0.3, 0.7))
+            except IndexError:
+                pass
+            except Exception as e:
+                print(f"[MAIN] Voice error: {e}")
+
+    async def _button_task(self):
+        while True:
+            station, kind, t = await self._button_events.get()
+            station = station or self.willow.station
+            recording = self._recording.get(station.name)
+            if kind == 'press' and recording is None:
+                stop = threading.Event()
+                task = asyncio.create_task(self._record(t, stop, station), name=f"record-{station.name}")
+                self._recording[station.name] = (task, stop)
+                if self.record_seconds:
+                    self._loop.call_later(self.record_seconds, stop.set)
+            elif kind == 'release' and recording is not None and not self.record_seconds:
+                recording[1].set()
+
+    async def _record(self, pressed_at, stop, station):
+        try:
+            await self._loop.run_in_executor(
+                self._executor("record", station), self.willow.start_recording_secret,
+                pressed_at, stop, station)
+        except Exception as e:
+            print(f"[REC] Recording error: {e}")
+        finally:
+            self._recording.pop(station.name, None)
+
+    async def _finish_recording(self):
+        """Let in-flight recordings stop and finalize before teardown."""
+        if not self._recording:
+            return
+        for _task, stop in self._recording.values():
+            stop.set()
+        tasks = [task for task, _stop in self._recording.values()]
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.gather(*tasks)), SHUTDOWN_GRACE_SECONDS)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            print("[REC] Recording did not finish in time")
+
+    async def _catalog_task(self):
+        while True:
+            event, name, entry = await self._catalog_events.get()
+            if entry is not None:
+                print(f"[CATALOG] {event}: {name} ({entry.duration:.1f}s)")
+            else:
+                print(f"[CATALOG] {event}: {name}")
+
+    async def _housekeeping_task(self):
+        import willow
+        while True:
+            t0 = time.monotonic()
+            await asyncio.sleep(HOUSEKEEPING_SECONDS)
+            lag = time.monotonic() - t0 - HOUSEKEEPING_SECONDS
+            self.loop_lag_max = max(self.loop_lag_max, lag)
+            free = shutil.disk_usage(willow.SECRETS_DIR).free
+            w = self.willow
+            w.metrics.gauge("willow_loop_lag_ms", "Event loop lag at the last check").set(lag * 1000.0)
+            await self._loop.run_in_executor(
+                None, w.metrics.write_file, os.path.join(willow.SECRETS_DIR, willow.STATS_NAME))
+            await self._loop.run_in_executor(None, w.catalog.save_snapshot)
+            print(f"[STATS] secrets={len(w.catalog)} play={w.player.stats()} "
+                  f"cache={w.cache.stats()} capture={w.capture.stats()} "
+                  f"mixer={w.mixer.stats() if w.mixer else None} button={self.button.stats()} "
+                  f"disk_free={free // (1024 * 1024)}MB loop_lag={lag * 1000.0:.1f}ms")
+            if len(w.stations) > 1:
+                for st in w.stations:
+                    print(f"[STATS] station {st.name}: {st.stats()}")
+
+
+def main(button, min_delay=MIN_SECRET_DELAY, max_delay=MAX_SECRET_DELAY, make_button=None,
+         playback=True, record_seconds=None):
+    import willow
+    runtime = WillowRuntime(willow.Willow(), button, min_delay, max_delay,
+                            make_button=make_button, playback=playback,
+                            record_seconds=record_seconds)
+    asyncio.run(runtime.run())
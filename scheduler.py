@@ -0,0 +1,356 @@
+"""
+Picks which secret plays next. Every policy keeps its own index in step
+with the catalog through a listener, so a pick never lists the directory
+and costs O(1) (shuffle bag) or O(log n) (weighted), even with 100k
+secrets. Play counts and the current shuffle round are saved to a small
+JSON file so fairness carries over a restart.
+
+    "random"    uniform pick, may repeat back-to-back (the old behaviour)
+    "shuffle"   shuffle bag: nothing repeats until everything has played
+    "weighted"  favours new and rarely played secrets (Fenwick tree)
+"""
+import json
+import os
+import random
+import threading
+import time
+
+HISTORY_NAME = ".play_history.json"
+SAVE_INTERVAL = 30.0          # seconds between history writes (SD card wear)
+FRESH_SECONDS = 7 * 86400     # secrets newer than this get boosted...
+FRESH_BOOST = 4.0             # ...by up to this factor, fading out with age
+FRESH_REFRESH_SECONDS = 3600  # how often the weighted policy re-fades fresh secrets
+
+
+class PlayHistory:
+    """Per-secret play counts and last-played times, persisted as JSON."""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, HISTORY_NAME)
+        self.plays = {}       # name -> count
+        self.last = {}        # name -> time.time() of the last play
+        self.round = set()    # names already drawn from the current shuffle bag
+        self._saved_at = 0.0
+        self._dirty = False
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[SCHED] Ignoring unreadable {self.path}: {e}")
+            return
+        self.plays = data.get("plays", {})
+        self.last = data.get("last", {})
+        self.round = set(data.get("round", []))
+
+    def record(self, name):
+        self.plays[name] = self.plays.get(name, 0) + 1
+        self.last[name] = time.time()
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+            self.save()
+
+    def forget(self, name):
+        self.plays.pop(name, None)
+        self.last.pop(name, None)
+        self.round.discard(name)
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        data = json.dumps({"plays": self.plays, "last": self.last, "round": sorted(self.round)})
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"[SCHED] Could not save {self.path}: {e}")
+        self._saved_at = time.monotonic()
+
+
+class Scheduler:
+    """
+    Base policy. Subclasses keep an index of names and implement _pick();
+    next() returns the chosen catalog entry and records the play. Raises
+    IndexError when the catalog is empty, like SecretsCatalog.choice().
+    A pick made ahead of time (prefetch.py) is taken with next(record=False)
+    and only counted through played() once it really plays, so one that is
+    dropped or still pending at shutdown doesn't count; unpick() hands such
+    a pick back.
+    """
+
+    def __init__(self, secrets, history):
+        self.catalog = secrets
+        self.history = history
+        self._lock = threading.Lock()
+        self._last_name = None
+
+    def start(self):
+        self.history.load()
+        self.catalog.add_listener(self.on_catalog_event)
+        for entry in self.catalog.entries():
+            self.on_catalog_event('added', entry.name, entry)
+
+    def stop(self):
+        with self._lock:
+            self.history.save()
+
+    def next(self, record=True):
+        with self._lock:
+            # Entries can vanish before the index hears about it; skip those.
+            while True:
+                name = self._pick()
+                entry = self.catalog.get(name)
+                if entry is not None:
+                    break
+                self._discard(name)
+            if record:
+                self._record(name, entry)
+            return entry
+
+    def played(self, entry):
+        """Record the play of an entry picked with next(record=False)."""
+        with self._lock:
+            if self.catalog.get(entry.name) is not None:
+                self._record(entry.name, entry)
+
+    def on_catalog_event(self, event, name, entry):
+        with self._lock:
+            if event == 'added':
+                self._add(name, entry)
+            elif event == 'removed':
+                self._discard(name)
+                self.history.forget(name)
+
+    def unpick(self, entry):
+        """Give back a pick from next(record=False) that won't be played after all."""
+        with self._lock:
+            if self.catalog.get(entry.name) is not None:
+                self._unpicked(entry.name, entry)
+
+    def _record(self, name, entry):
+        previous, self._last_name = self._last_name, name
+        self.history.record(name)
+        self._played(name, entry, previous)
+
+    def _add(self, name, entry):
+        pass
+
+    def _discard(self, name):
+        pass
+
+    def _played(self, name, entry, previous):
+        pass
+
+    def _unpicked(self, name, entry):
+        pass
+
+    def _pick(self):
+        raise NotImplementedError
+
+
+class RandomScheduler(Scheduler):
+
+    def _pick(self):
+        return self.catalog.choice().name
+
+
+class ShuffleBag(Scheduler):
+    """
+    Every secret plays once per round, in random order. New secrets go into
+    the rest of the current round at a random spot; the last secret of one
+    round never opens the next.
+    """
+
+    def __init__(self, secrets, history):
+        super().__init__(secrets, history)
+        self._bag = []        # remaining names; drawn from the end
+
+    def _add(self, name, entry):
+        if name in self.history.round:
+            return
+        self._bag.append(name)
+        j = random.randrange(len(self._bag))
+        self._bag[-1], self._bag[j] = self._bag[j], self._bag[-1]
+
+    def _discard(self, name):
+        # Lazily skipped by next() when it comes up.
+        pass
+
+    def _pick(self):
+        if not self._bag:
+            self._refill()
+        return self._bag.pop()
+
+    def _played(self, name, entry, previous):
+        self.history.round.add(name)
+
+    def _unpicked(self, name, entry):
+        # Popped from the bag but never played: it still owes this round a play.
+        if name not in self._bag:
+            self._add(name, entry)
+
+    def _refill(self):
+        self.history.round.clear()
+        self._bag = self.catalog.names()
+        if not self._bag:
+            raise IndexError("no secrets to play")
+        random.shuffle(self._bag)
+        if len(self._bag) > 1 and self._bag[-1] == self._last_name:
+            self._bag[0], self._bag[-1] = self._bag[-1], self._bag[0]
+
+
+class _FenwickTree:
+    """Prefix sums over slot weights, with O(log n) update and sampling."""
+
+    def __init__(self):
+        self.weights = []
+        self._tree = [0.0]
+
+    def __len__(self):
+        return len(self.weights)
+
+    @property
+    def total(self):
+        return self._prefix(len(self.weights))
+
+    def append(self, weight):
+        self.weights.append(0.0)
+        i = len(self.weights)
+        # The new node covers (i - lowbit(i), i]; seed it from its children.
+        self._tree.append(self._prefix(i - 1) - self._prefix(i - (i & -i)))
+        self.set(i - 1, weight)
+
+    def set(self, slot, weight):
+        delta = weight - self.weights[slot]
+        self.weights[slot] = weight
+        i = slot + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def find(self, target):
+        """The slot whose cumulative weight range contains target."""
+        pos = 0
+        step = 1 << (len(self.weights).bit_length())
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= target:
+                pos = nxt
+                target -= self._tree[nxt]
+            step >>= 1
+        return min(pos, len(self.weights) - 1)
+
+    def _prefix(self, i):
+        total = 0.0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+class WeightedScheduler(Scheduler):
+    """
+    Weight = freshness boost / (1 + plays), so new secrets and ones that
+    have rarely come up are favoured without starving the rest. Weights sit
+    in a Fenwick tree: a pick and the weight update after it are both
+    O(log n). Removed secrets leave a zero-weight slot that is reused.
+    Secrets still inside FRESH_SECONDS get their weight recomputed every
+    FRESH_REFRESH_SECONDS, so the boost fades even for one that never plays.
+    """
+
+    def __init__(self, secrets, history):
+        super().__init__(secrets, history)
+        self._tree = _FenwickTree()
+        self._slots = {}      # name -> slot
+        self._names = []      # slot -> name
+        self._free = []
+        self._fresh = set()   # names whose weight still carries a boost
+        self._refreshed_at = time.monotonic()
+
+    def weight(self, name, entry):
+        age = time.time() - entry.mtime
+        boost = 1.0 + (FRESH_BOOST - 1.0) * max(0.0, 1.0 - age / FRESH_SECONDS)
+        weight = boost / (1 + self.history.plays.get(name, 0))
+        # Never twice in a row unless it's the only one.
+        if name == self._last_name and len(self._slots) > 1:
+            return 0.0
+        return weight
+
+    def _add(self, name, entry):
+        slot = self._slots.get(name)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+                self._names[slot] = name
+            else:
+                slot = len(self._names)
+                self._names.append(name)
+                self._tree.append(0.0)
+            self._slots[name] = slot
+        self._tree.set(slot, self.weight(name, entry))
+        if time.time() - entry.mtime < FRESH_SECONDS:
+            self._fresh.add(name)
+
+    def _discard(self, name):
+        slot = self._slots.pop(name, None)
+        if slot is not None:
+            self._tree.set(slot, 0.0)
+            self._names[slot] = None
+            self._free.append(slot)
+        self._fresh.discard(name)
+
+    def _pick(self):
+        if time.monotonic() - self._refreshed_at >= FRESH_REFRESH_SECONDS:
+            self._refresh_fresh()
+        total = self._tree.total
+        if total <= 0.0:
+            if not self._slots:
+                raise IndexError("no secrets to play")
+            return next(iter(self._slots))
+        slot = self._tree.find(random.random() * total)
+        name = self._names[slot]
+        if name is None:
+            # Float drift landed on an empty slot; fall back to a uniform pick.
+            name = random.choice(list(self._slots))
+        return name
+
+    def _refresh_fresh(self):
+        self._refreshed_at = time.monotonic()
+        now = time.time()
+        for name in list(self._fresh):
+            entry = self.catalog.get(name)
+            if entry is None or name not in self._slots:
+                self._fresh.discard(name)
+                continue
+            self._tree.set(self._slots[name], self.weight(name, entry))
+            if now - entry.mtime >= FRESH_SECONDS:
+                self._fresh.discard(name)   # fully faded; its weight is final
+
+    def _played(self, name, entry, previous):
+        self._tree.set(self._slots[name], self.weight(name, entry))
+        # The previous pick was held at zero; give it its weight back.
+        prev_entry = self.catalog.get(previous) if previous in self._slots else None
+        if prev_entry is not None:
+            self._tree.set(self._slots[previous], self.weight(previous, prev_entry))
+
+
+POLICIES = {
+    "random": RandomScheduler,
+    "shuffle": ShuffleBag,
+    "weighted": WeightedScheduler,
+}
+
+
+def make_scheduler(policy, secrets, directory):
+    try:
+        cls = POLICIES[policy]
+    except KeyError:
+        raise ValueError(f"unknown scheduler policy {policy!r}; one of {', '.join(POLICIES)}")
+    return cls(secrets, PlayHistory(directory))
@@ -0,0 +1,375 @@
+"""
+Simulated hardware for running the engine headless: a PyAudio stand-in
+whose streams run on a clock that can go faster than real time, a mic fed
+from an array or WAV file, a sink that keeps everything played along with
+its stream time, and a button that replays a script of presses.
+Devices can be unplugged and plugged back in to exercise devices.py.
+
+    WILLOW_AUDIO=sim python art.py         # uses SimAudio instead of PyAudio
+    python sim.py [speed]                  # headless playback + recording run
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+
+import hal
+
+SPEED = float(os.environ.get("WILLOW_SIM_SPEED", "1.0"))   # 10.0 = ten times real time
+
+
+class ArrayMic:
+    """
+    Microphone input from int16 samples, raw PCM bytes or a WAV path. Once
+    the source runs out it returns silence, or starts over if loop is set.
+    feed() appends more audio while streams are running.
+    """
+
+    def __init__(self, source=None, loop=False):
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._pcm = _to_pcm(source)
+        self._pos = 0
+
+    def feed(self, source):
+        with self._lock:
+            self._pcm = self._pcm[self._pos:] + _to_pcm(source)
+            self._pos = 0
+
+    def read(self, nbytes):
+        out = b''
+        with self._lock:
+            while len(out) < nbytes:
+                piece = self._pcm[self._pos:self._pos + nbytes - len(out)]
+                out += piece
+                self._pos += len(piece)
+                if self._pos < len(self._pcm):
+                    continue
+                if not (self.loop and self._pcm):
+                    break
+                self._pos = 0
+        return out + b'\x00' * (nbytes - len(out))
+
+
+class RecordingSink:
+    """
+    Everything written to simulated outputs, as (stream_time, bytes) blocks.
+    With keep=False only the byte count is tracked, for long soak runs.
+    """
+
+    def __init__(self, keep=True):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self.blocks = []
+        self.bytes = 0
+
+    def write(self, t, data):
+        with self._lock:
+            self.bytes += len(data)
+            if self.keep:
+                self.blocks.append((t, bytes(data)))
+
+    def pcm(self):
+        with self._lock:
+            return b''.join(data for _, data in self.blocks)
+
+    def clear(self):
+        with self._lock:
+            self.blocks.clear()
+            self.bytes = 0
+
+    def spans(self, rate, threshold=0, min_gap=0.05):
+        """
+        (start, end) seconds of non-silent int16 mono output. Quiet stretches
+        shorter than min_gap (zero crossings, pauses) don't split a span.
+        """
+        samples = np.frombuffer(self.pcm(), dtype='<i2')
+        loud = np.flatnonzero(np.abs(samples.astype(np.int32)) > threshold)
+        if len(loud) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(loud) > min_gap * rate)
+        starts = np.concatenate(([loud[0]], loud[breaks + 1]))
+        ends = np.concatenate((loud[breaks], [loud[-1]])) + 1
+        return [(s / rate, e / rate) for s, e in zip(starts, ends)]
+
+
+class SimStream:
+    """One simulated PortAudio stream; callback or blocking mode like PyAudio."""
+
+    def __init__(self, audio, format=hal.paInt16, channels=1, rate=16000, input=False,
+                 output=False, frames_per_buffer=1024, stream_callback=None, start=True,
+                 input_device_index=None, output_device_index=None, **_device_args):
+        self.audio = audio
+        self.device = audio._device_name(
+            input_device_index if input else output_device_index, input)
+        self.channels = channels
+        self.rate = rate
+        self.input = input
+        self.output = output
+        self.frames_per_buffer = frames_per_buffer
+        self.frame_bytes = hal.get_sample_size(format) * channels
+        self.callback = stream_callback
+        self.frames = 0            # stream clock, in frames
+        self.status = 0            # flags handed to the next callback (see inject())
+        self.lost = False          # device unplugged under the stream
+        self._active = False
+        self._thread = None
+        self._next = None
+        if start:
+            self.start_stream()
+
+    @property
+    def time(self):
+        return self.frames / self.rate
+
+    def start_stream(self):
+        if self._active:
+            return
+        self._active = True
+        self._next = time.monotonic()
+        if self.callback is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop_stream(self):
+        self._active = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def close(self):
+        self.stop_stream()
+        self.audio._closed(self)
+
+    def is_active(self):
+        return self._active
+
+    def is_stopped(self):
+        return not self._active
+
+    def inject(self, flags):
+        """Report PortAudio status flags (e.g. hal.paOutputUnderflow) on the next callback."""
+        self.status |= flags
+
+    def read(self, num_frames, exception_on_overflow=True):
+        if self.lost:
+            raise OSError(f"device {self.device!r} unavailable")
+        data = self.audio.mic.read(num_frames * self.frame_bytes)
+        self._advance(num_frames)
+        return data
+
+    def write(self, data):
+        if self.lost:
+            raise OSError(f"device {self.device!r} unavailable")
+        self.audio.sink.write(self.time, data)
+        self._advance(len(data) // self.frame_bytes)
+
+    def _run(self):
+        n = self.frames_per_buffer
+        while self._active:
+            in_data = self.audio.mic.read(n * self.frame_bytes) if self.input else None
+            status, self.status = self.status, 0
+            t = self.time
+            info = {"input_buffer_adc_time": t, "current_time": t, "output_buffer_dac_time": t}
+            try:
+                out, flag = self.callback(in_data, n, info, status)
+            except Exception as e:
+                print(f"[SIM] Stream callback raised: {e}")
+                break
+            if self.output and out is not None:
+                self.audio.sink.write(t, out)
+            self._advance(n)
+            if flag != hal.paContinue:
+                break
+        self._active = False
+
+    def _advance(self, frames):
+        self.frames += frames
+        self._next += frames / self.rate / self.audio.speed
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class SimAudio:
+    """
+    Drop-in for pyaudio.PyAudio. Input streams read from mic, output streams
+    write to sink, and every stream's clock runs speed times real time.
+    """
+
+    def __init__(self, mic=None, sink=None, speed=SPEED):
+        self.mic = mic if mic is not None else ArrayMic()
+        self.sink = sink if sink is not None else RecordingSink()
+        self.speed = speed
+        self.streams = []
+        self._devices = [
+            {"index": 0, "name": "Simulated Mic", "maxInputChannels": 1,
+             "maxOutputChannels": 0, "defaultSampleRate": 16000.0},
+            {"index": 1, "name": "Simulated Speaker", "maxInputChannels": 0,
+             "maxOutputChannels": 2, "defaultSampleRate": 16000.0},
+        ]
+
+    def get_sample_size(self, format):
+        return hal.get_sample_size(format)
+
+    def get_format_from_width(self, width, unsigned=True):
+        return hal.get_format_from_width(width)
+
+    def get_device_count(self):
+        return len(self._devices)
+
+    def get_device_info_by_index(self, index):
+        return dict(self._devices[index])
+
+    def unplug(self, name):
+        """Remove a device; its streams stop and later devices shift down an index."""
+        self._devices = [d for d in self._devices if d["name"] != name]
+        for i, d in enumerate(self._devices):
+            d["index"] = i
+        for stream in list(self.streams):
+            if stream.device == name:
+                stream.lost = True
+                stream._active = False
+
+    def plug(self, name, inputs=0, outputs=0):
+        """Add a device at the end of the list, as a hot-plugged one would appear."""
+        self._devices.append({"index": len(self._devices), "name": name,
+                              "maxInputChannels": inputs, "maxOutputChannels": outputs,
+                              "defaultSampleRate": 16000.0})
+
+    def open(self, *args, **kwargs):
+        stream = SimStream(self, *args, **kwargs)
+        self.streams.append(stream)
+        return stream
+
+    def terminate(self):
+        for stream in list(self.streams):
+            stream.close()
+
+    def _device_name(self, index, input):
+        key = "maxInputChannels" if input else "maxOutputChannels"
+        if index is None:
+            index = next((d["index"] for d in self._devices if d[key] > 0), None)
+        if index is None or not 0 <= index < len(self._devices) or not self._devices[index][key]:
+            raise OSError(f"Invalid device index {index}")
+        return self._devices[index]["name"]
+
+    def _closed(self, stream):
+        if stream in self.streams:
+            self.streams.remove(stream)
+
+
+class ScriptedButton:
+    """
+    Replays (at_seconds, kind) events, timed from start() and scaled by
+    speed, to on_edge(kind, t) like button.GpioButton. With bounce_ms set
+    each transition is sent as a burst of raw edges through a real
+    button.Debouncer instead (those windows stay in real time).
+    """
+
+    def __init__(self, script, speed=SPEED, bounce_ms=0):
+        self.script = sorted(script)
+        self.speed = speed
+        self.bounce_ms = bounce_ms
+        self.debouncer = None
+        self.done = threading.Event()
+        self._stop_evt = threading.Event()
+        self.sent = 0
+
+    @staticmethod
+    def hold(at, seconds):
+        return [(at, 'press'), (at + seconds, 'release')]
+
+    def start(self, on_edge):
+        if self.bounce_ms:
+            import button
+            self.debouncer = button.Debouncer(on_edge)
+            self.debouncer.start()
+        threading.Thread(target=self._run, args=(on_edge,), daemon=True).start()
+
+    def stop(self):
+        self._stop_evt.set()
+        if self.debouncer is not None:
+            self.debouncer.stop()
+
+    def stats(self):
+        if self.debouncer is not None:
+            return self.debouncer.stats()
+        return {"sent": self.sent}
+
+    def _run(self, on_edge):
+        t0 = time.monotonic()
+        for at, kind in self.script:
+            if self._stop_evt.wait(max(0.0, t0 + at / self.speed - time.monotonic())):
+                return
+            self.sent += 1
+            if self.debouncer is None:
+                on_edge(kind, time.monotonic())
+                continue
+            level = kind == 'press'
+            for i in range(3):   # contact bounce: on, off, on
+                self.debouncer.edge(level if i % 2 == 0 else not level)
+                time.sleep(self.bounce_ms / 3000.0)
+        self.done.set()
+
+
+def _to_pcm(source):
+    if source is None:
+        return b''
+    if isinstance(source, str):
+        with wave.open(source, 'rb') as wf:
+            return wf.readframes(wf.getnframes())
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    return np.asarray(source, dtype='<i2').tobytes()
+
+
+def tone(seconds, freq=440.0, rate=16000, level=0.3):
+    """A sine burst as int16 samples, handy for mics and test secrets."""
+    t = np.arange(int(seconds * rate)) / rate
+    return (np.sin(2 * np.pi * freq * t) * level * 32767).astype('<i2')
+
+
+def _main(argv):
+    speed = float(argv[0]) if argv else 10.0
+    import willow
+
+    directory = tempfile.mkdtemp(prefix="willow_sim_")
+    for i, freq in enumerate((330, 440, 550)):
+        with wave.open(os.path.join(directory, f"tone_{i}.wav"), 'wb') as wf:
+            wf.setnchannels(willow.CHANNELS)
+            wf.setsampwidth(2)
+            wf.setframerate(willow.RATE)
+            wf.writeframes(tone(2.0, freq).tobytes())
+    willow.SECRETS_DIR = directory
+
+    audio = SimAudio(speed=speed)
+    w = willow.Willow(audio=audio)
+
+    t0 = time.monotonic()
+    for _ in range(3):
+        w.play_random_secret(silence_before=0.5)
+    # Someone holds the button for ~4 s and says something in the middle.
+    audio.mic.feed(np.concatenate([np.zeros(willow.RATE // 2, dtype='<i2'), tone(3.0, 220)]))
+    stop = threading.Event()
+    threading.Timer(4.0 / speed, stop.set).start()
+    saved = w.start_recording_secret(stop_event=stop)
+    elapsed = time.monotonic() - t0
+    output = len(audio.sink.pcm()) / w.player.frame_bytes / willow.RATE
+    played = audio.sink.spans(willow.RATE, threshold=100)
+    w.close()
+
+    print(f"[SIM] {len(played)} secrets played, {output:.1f}s of output "
+          f"in {elapsed:.2f}s wall time ({speed:g}x)")
+    print(f"[SIM] play={w.player.stats()}")
+    print(f"[SIM] capture={w.capture.stats()}")
+    print(f"[SIM] recorded {saved} into {directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
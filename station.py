@@ -0,0 +1,81 @@
+"""
+A listening station: one button, one mic and one speaker. Several can run
+from one process around the tree; they share the Willow's PyAudio
+instance, catalog, PCM cache and scheduler (so stations draw from one play
+order rather than each repeating its own), while each has its own
+always-open capture stream, its own output stream and feeder thread, and
+its own worker threads in runtime.py.
+
+Each station's audio threads (the PortAudio callbacks and the playback
+feeder) are pinned to their own core. Most of what they do happens in
+PortAudio/ALSA or NumPy outside the GIL, so stations don't queue behind
+one another on a single core.
+"""
+import os
+
+import capture
+import playback
+
+
+class Station:
+    def __init__(self, name, audio, devices, format, channels, rate, chunk,
+                 input_device=None, output_device=None, pin=None, cpus=None):
+        self.name = name
+        self.pin = pin                # BCM pin of this station's button, if any
+        self.button = None            # set by whoever wires up the GPIO
+        self.prefetch = None          # prefetch.Prefetcher, set by the Willow
+        self.input_name = input_device
+        self.output_name = output_device
+
+        # The mic stays open with a rolling pre-roll so a press never waits
+        # for a stream to open and never clips the first syllable.
+        self.capture = capture.CaptureService(
+            audio, format, channels, rate, chunk,
+            input_device=devices.find(input_device, 'input'), cpus=cpus)
+        devices.attach('input', input_device, self.capture)
+
+        # One long-lived output stream at the canonical format; opened on
+        # first playback so record-only scripts never touch the speaker.
+        self.player = playback.PlaybackEngine(
+            audio, format, channels, rate, chunk,
+            output_device=devices.find(output_device, 'output'), cpus=cpus)
+        devices.attach('output', output_device, self.player)
+        self._devices = devices
+
+    def start(self):
+        try:
+            self.capture.start()
+        except Exception as e:
+            print(f"[STATION] {self.name}: could not open input stream: {e}")
+            self._devices.lost(self.capture, e)
+
+    def stop(self):
+        self.capture.stop()
+        self.player.stop()
+
+    def stats(self):
+        """Latency, xrun and dropout figures for this station's streams."""
+        play = self.player.stats()
+        cap = self.capture.stats()
+        return {
+            "press_latency_last_ms": cap["latency_last_ms"],
+            "press_latency_max_ms": cap["latency_max_ms"],
+            "presses": cap["presses"],
+            "overflows": cap["overflows"],
+            "lost_chunks": cap["lost"],
+            "gap_max_ms": play["gap_max_ms"],
+            "gaps": play["gaps"],
+            "underruns": play["underruns"],
+            "xruns": play["xruns"],
+        }
+
+    def __repr__(self):
+        return f"Station({self.name!r}, in={self.input_name!r}, out={self.output_name!r})"
+
+
+def cpus_for(index):
+    """Core for the index-th station: spread over all but core 0 (main thread, asyncio)."""
+    count = os.cpu_count() or 1
+    if count < 2:
+        return None
+    return {1 + index % (count - 1)}
@@ -0,0 +1,416 @@
+"""
+Shares secrets between willows. Each installation serves its content
+hashes (dedup.py) and the secrets behind them over HTTP, and every
+INTERVAL pulls from its peers whatever hashes it doesn't have yet, so
+two trees exchange only what's missing on either side.
+
+Transfers are PCM in CHUNK_BYTES pieces, throttled to MAX_BYTES_PER_SECOND
+in each direction by a low-priority thread, so they never compete with
+playback for the card. A transfer that breaks off is kept as a hidden
+.sync_<hash>.part file and resumed with an HTTP Range request next time;
+the finished secret is verified against its hash before it is moved into
+the secrets directory.
+
+There is no authentication: serve on a private network only (HOST is
+local-only by default; set willow.SYNC_HOST to "0.0.0.0" for a second tree).
+
+    python sync.py serve DIR [PORT]           # share a directory
+    python sync.py pull DIR HOST:PORT         # fetch what DIR is missing
+    curl -s localhost:9109/hashes
+"""
+import http.client
+import json
+import os
+import re
+import sys
+import threading
+import time
+import wave
+
+import dedup
+
+PORT = 9109                         # 0 disables serving
+HOST = "127.0.0.1"                  # local only, like metrics.py
+INTERVAL = 300.0                    # seconds between pulls from each peer
+CHUNK_BYTES = 64 * 1024             # bytes per read/write step
+MAX_BYTES_PER_SECOND = 256 * 1024   # per direction, across all transfers
+TIMEOUT = 10.0                      # socket timeout for peers
+PART_PREFIX = ".sync_"              # in-progress transfers: .sync_<hash>.part
+PART_MAX_AGE = 7 * 86400            # unfinished parts older than this are dropped
+NICE = 10
+
+_DIGEST = re.compile(r"[0-9a-f]{64}")   # hex SHA-256, as dedup.py makes them
+
+
+class Throttle:
+    """Token bucket: wait(n) returns once n more bytes fit under rate."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self, n):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + n / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def _lower_priority():
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), NICE)
+    except (AttributeError, OSError):
+        pass
+
+
+def _pcm_blocks(entry, offset):
+    """An entry's PCM from byte offset on, in CHUNK_BYTES pieces."""
+    if entry.mapped:
+        pcm = entry.read_pcm()
+        for i in range(offset, len(pcm), CHUNK_BYTES):
+            yield bytes(pcm[i:i + CHUNK_BYTES])
+        return
+    frame_bytes = entry.channels * entry.sampwidth
+    frames = max(1, CHUNK_BYTES // frame_bytes)
+    with wave.open(entry.path, 'rb') as wf:
+        wf.setpos(offset // frame_bytes)
+        skip = offset % frame_bytes
+        data = wf.readframes(frames)
+        while data:
+            yield data[skip:]
+            skip = 0
+            data = wf.readframes(frames)
+
+
+class SyncService:
+    """
+    Serves this installation's secrets and pulls missing ones from peers
+    ("host:port" strings). With busy set, pulls wait while it returns True
+    (e.g. while a recording is running).
+    """
+
+    def __init__(self, secrets, index, directory, peers=(), port=PORT, host=HOST,
+                 rate=MAX_BYTES_PER_SECOND, interval=INTERVAL, busy=None):
+        self.catalog = secrets
+        self.index = index
+        self.directory = directory
+        self.peers = list(peers)
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self.busy = busy
+        self._send = Throttle(rate)
+        self._receive = Throttle(rate)
+        self._server = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._running = False
+        self._stopping = False
+
+        self.pulled = 0
+        self.pulled_bytes = 0
+        self.served = 0
+        self.served_bytes = 0
+        self.resumed = 0
+        self.failed = 0
+        self.missing = 0          # hashes the peers have and we don't, at the last pull
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._stopping = False
+        self._clean_parts()
+        self._serve()
+        if self.peers:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._stopping = True
+        self._wake.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def sync_now(self):
+        """Pull from the peers now instead of at the next interval."""
+        self._wake.set()
+
+    def stats(self):
+        return {
+            "pulled": self.pulled,
+            "pulled_bytes": self.pulled_bytes,
+            "served": self.served,
+            "served_bytes": self.served_bytes,
+            "resumed": self.resumed,
+            "failed": self.failed,
+            "missing": self.missing,
+        }
+
+    # -- pulling -----------------------------------------------------------
+
+    def pull(self, peer):
+        """Fetch every secret peer has that we neither have nor deleted. Returns the count."""
+        host, _, port = peer.rpartition(":")
+        status, body = self._get(host, int(port), "/hashes")
+        if status != 200:
+            raise OSError(f"{peer} answered {status}")
+        hashes = json.loads(body)["hashes"]
+        wanted = [h for h in hashes if isinstance(h, str) and _DIGEST.fullmatch(h)]
+        if len(wanted) < len(hashes):
+            print(f"[SYNC] Ignoring {len(hashes) - len(wanted)} malformed hashes from {peer}")
+        wanted = [h for h in wanted if not self.index.knows(h)]
+        self.missing = len(wanted)
+        fetched = 0
+        for digest in wanted:
+            if self._stopping:
+                break
+            while self.busy is not None and self.busy() and not self._stopping:
+                self._wake.wait(1.0)
+            try:
+                if self._fetch(host, int(port), digest):
+                    fetched += 1
+                    self.missing -= 1
+            except (OSError, http.client.HTTPException) as e:
+                self.failed += 1
+                print(f"[SYNC] {digest[:12]} from {peer} interrupted: {e}")
+                break   # the peer went away; resume next round
+        return fetched
+
+    def _get(self, host, port, path):
+        conn = http.client.HTTPConnection(host, port, timeout=TIMEOUT)
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            return resp.status, resp.read()
+        finally:
+            conn.close()
+
+    def _fetch(self, host, port, digest):
+        if not _DIGEST.fullmatch(digest):
+            # It ends up in a file name; never let a peer pick the path.
+            raise OSError(f"malformed hash {digest[:80]!r}")
+        part_path = os.path.join(self.directory, f"{PART_PREFIX}{digest}.part")
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        conn = http.client.HTTPConnection(host, port, timeout=TIMEOUT)
+        try:
+            conn.request("GET", f"/secrets/{digest}",
+                         headers={"Range": f"bytes={offset}-"} if offset else {})
+            resp = conn.getresponse()
+            if resp.status == 404:
+                resp.read()
+                return False
+            if resp.status == 416:
+                resp.read()   # we already have all of it
+            elif resp.status not in (200, 206):
+                raise OSError(f"HTTP {resp.status}")
+            elif resp.status == 200:
+                offset = 0
+            elif offset:
+                self.resumed += 1
+            meta = json.loads(resp.getheader("X-Willow-Secret"))
+            if resp.status != 416:
+                with open(part_path, 'r+b' if offset else 'wb') as f:
+                    f.seek(offset)
+                    f.truncate()
+                    while True:
+                        data = resp.read(CHUNK_BYTES)
+                        if not data:
+                            break
+                        self._receive.wait(len(data))
+                        f.write(data)
+                        self.pulled_bytes += len(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+        finally:
+            conn.close()
+
+        if os.path.getsize(part_path) < meta["length"]:
+            raise OSError(f"short transfer ({os.path.getsize(part_path)} of {meta['length']} bytes)")
+        path = self._finish(part_path, digest, meta)
+        if path is None:
+            return False
+        self.pulled += 1
+        print(f"[SYNC] Pulled {os.path.basename(path)} ({meta['length']} bytes)")
+        self.catalog.add(path)
+        return True
+
+    def _finish(self, part_path, digest, meta):
+        """Verify a complete part against its hash and move it in as a WAV."""
+        rate, channels, sampwidth = meta["rate"], meta["channels"], meta["sampwidth"]
+        tmp_path = os.path.join(self.directory, f"{PART_PREFIX}{digest}.wav")
+        check = dedup.new_hash(rate, channels, sampwidth)
+        try:
+            with open(part_path, 'rb') as src, wave.open(tmp_path, 'wb') as wf:
+                wf.setnchannels(channels)
+                wf.setsampwidth(sampwidth)
+                wf.setframerate(rate)
+                for data in iter(lambda: src.read(CHUNK_BYTES), b""):
+                    check.update(data)
+                    wf.writeframes(data)
+            if check.hexdigest() != digest:
+                self.failed += 1
+                print(f"[SYNC] {digest[:12]} failed verification; fetching it again next time")
+                os.remove(tmp_path)
+                os.remove(part_path)
+                return None
+            os.utime(tmp_path, (meta["mtime"], meta["mtime"]))
+            path = os.path.join(self.directory, self._local_name(meta["name"], digest))
+            os.replace(tmp_path, path)
+            os.remove(part_path)
+            return path
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _local_name(self, name, digest):
+        # The name comes from the peer: never let it leave the secrets
+        # directory or turn into something the catalog would ignore.
+        name = os.path.basename(str(name or ""))
+        if not name or name.startswith('.') or not self.catalog._wanted(name):
+            name = f"{digest}.wav"
+        if self.catalog.get(name) is None and not os.path.exists(os.path.join(self.directory, name)):
+            return name
+        stem, ext = os.path.splitext(name)
+        return f"{stem}_{digest[:8]}{ext}"
+
+    def _clean_parts(self):
+        cutoff = time.time() - PART_MAX_AGE
+        try:
+            for de in os.scandir(self.directory):
+                if de.name.startswith(PART_PREFIX) and de.stat().st_mtime < cutoff:
+                    os.remove(de.path)
+        except OSError as e:
+            print(f"[SYNC] Could not clean up old transfers: {e}")
+
+    def _run(self):
+        _lower_priority()
+        while self._running:
+            for peer in self.peers:
+                if not self._running:
+                    break
+                try:
+                    count = self.pull(peer)
+                    if count:
+                        print(f"[SYNC] {count} secrets from {peer}")
+                except (OSError, ValueError, KeyError, http.client.HTTPException) as e:
+                    print(f"[SYNC] Could not sync with {peer}: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    # -- serving -----------------------------------------------------------
+
+    def _serve(self):
+        if not self.port:
+            return
+        import http.server
+        service = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/hashes":
+                    body = json.dumps({"hashes": service.index.hashes()}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif self.path.startswith("/secrets/"):
+                    service._send_secret(self, self.path[len("/secrets/"):])
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            print(f"[SYNC] Could not listen on {self.host}:{self.port}: {e}")
+            return
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"[SYNC] Serving secrets on {self.host}:{self.port}")
+
+    def _send_secret(self, handler, digest):
+        entry = self.index.lookup(digest)
+        if entry is None:
+            handler.send_error(404)
+            return
+        _lower_priority()
+        length = entry.nframes * entry.channels * entry.sampwidth
+        offset = 0
+        requested = handler.headers.get("Range", "")
+        if requested.startswith("bytes=") and requested.endswith("-"):
+            try:
+                offset = int(requested[len("bytes="):-1])
+            except ValueError:
+                offset = 0
+        meta = json.dumps({"name": entry.name, "rate": entry.rate, "channels": entry.channels,
+                           "sampwidth": entry.sampwidth, "mtime": entry.mtime, "length": length})
+        if offset >= length > 0:
+            handler.send_response(416)
+            handler.send_header("X-Willow-Secret", meta)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+        handler.send_response(206 if offset else 200)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("Content-Length", str(length - offset))
+        if offset:
+            handler.send_header("Content-Range", f"bytes {offset}-{length - 1}/{length}")
+        handler.send_header("X-Willow-Secret", meta)
+        handler.end_headers()
+        try:
+            for data in _pcm_blocks(entry, offset):
+                self._send.wait(len(data))
+                handler.wfile.write(data)
+                self.served_bytes += len(data)
+        except (OSError, wave.Error) as e:
+            print(f"[SYNC] Sending {entry.name} stopped: {e}")
+            return
+        self.served += 1
+
+
+def _main(argv):
+    if len(argv) < 2 or argv[0] not in ("serve", "pull"):
+        print(__doc__)
+        return 1
+    import catalog
+    cmd, directory = argv[0], argv[1]
+    secrets = catalog.SecretsCatalog(directory, snapshot=False)
+    secrets.start()
+    index = dedup.ContentIndex(secrets, directory)
+    index.start()
+    while index.pending:
+        time.sleep(0.1)
+    if cmd == "serve":
+        service = SyncService(secrets, index, directory, port=int(argv[2]) if len(argv) > 2 else PORT)
+        service.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    else:
+        service = SyncService(secrets, index, directory, port=0)
+        print(f"[SYNC] {service.pull(argv[2])} secrets pulled, {service.missing} still missing")
+    service.stop()
+    index.stop()
+    secrets.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
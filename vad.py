@@ -0,0 +1,95 @@
+import os
+import time
+import wave
+
+import numpy as np
+
+FRAME_MS = 20               # analysis frame
+PAD_SECONDS = 0.25          # kept either side of the detected speech
+MIN_SPEECH_SECONDS = 0.3    # less speech than this and the recording is dropped
+ABS_FLOOR_DBFS = -55.0      # nothing quieter than this counts as speech
+NOISE_MARGIN_DB = 12.0      # speech must be this far above the noise floor
+
+
+def find_speech(samples, rate):
+    """
+    Locate speech in int16 mono samples with a frame energy + zero-crossing
+    detector. Returns (start, end) sample indices including padding, or
+    None if there isn't at least MIN_SPEECH_SECONDS of speech.
+    """
+    frame = int(rate * FRAME_MS / 1000)
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return None
+    frames = samples[:n_frames * frame].reshape(n_frames, frame)
+
+    f = frames.astype(np.float32)
+    energy = np.einsum('ij,ij->i', f, f) / frame
+    db = 10.0 * np.log10(energy / (32768.0 ** 2) + 1e-12)
+
+    noise_floor = np.percentile(db, 10)
+    threshold = max(noise_floor + NOISE_MARGIN_DB, ABS_FLOOR_DBFS)
+    speech = db > threshold
+
+    # Unvoiced consonants (s, sh, f) are quieter but cross zero a lot. Only
+    # the borderline frames need a zero-crossing rate, which keeps long
+    # silent recordings cheap.
+    borderline = np.flatnonzero(~speech & (db > threshold - 6.0))
+    if len(borderline):
+        signs = np.signbit(frames[borderline])
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame
+        speech[borderline[(zcr > 0.25) & (zcr < 0.75)]] = True
+
+    if np.count_nonzero(speech) * FRAME_MS / 1000 < MIN_SPEECH_SECONDS:
+        return None
+    idx = np.flatnonzero(speech)
+    pad = int(PAD_SECONDS * rate)
+    start = max(0, int(idx[0]) * frame - pad)
+    end = min(len(samples), (int(idx[-1]) + 1) * frame + pad)
+    return start, end
+
+
+def trim_file(path):
+    """
+    Trim leading/trailing silence from a 16-bit mono WAV in place. Returns
+    (kept_seconds, original_seconds, start_seconds), start being where the
+    kept audio began in the original, or None if it holds no speech (the
+    file is left alone; the caller decides whether to delete it).
+    """
+    with wave.open(path, 'rb') as wf:
+        params = wf.getparams()
+        raw = wf.readframes(params.nframes)
+    if params.sampwidth != 2 or params.nchannels != 1:
+        return params.nframes / params.framerate, params.nframes / params.framerate, 0.0
+    samples = np.frombuffer(raw, dtype='<i2')
+    original = len(samples) / params.framerate
+
+    span = find_speech(samples, params.framerate)
+    if span is None:
+        return None
+    start, end = span
+    if start == 0 and end == len(samples):
+        return original, original, 0.0
+
+    tmp_path = os.path.join(os.path.dirname(path), ".trim_" + os.path.basename(path))
+    with wave.open(tmp_path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(params.framerate)
+        wf.writeframes(samples[start:end].tobytes())
+    os.replace(tmp_path, path)
+    return (end - start) / params.framerate, original, start / params.framerate
+
+
+if __name__ == "__main__":
+    # Timing check: a 10-minute recording should take milliseconds.
+    rate = 16000
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal(rate * 600) * 30).astype(np.int16)
+    t = np.arange(rate * 5) / rate
+    samples[rate * 300:rate * 305] += (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16)
+    t0 = time.perf_counter()
+    span = find_speech(samples, rate)
+    elapsed = time.perf_counter() - t0
+    print(f"10 min @ {rate} Hz: speech {span[0] / rate:.2f}s-{span[1] / rate:.2f}s "
+          f"found in {elapsed * 1000:.1f} ms")
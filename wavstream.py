@@ -0,0 +1,165 @@
+import json
+import os
+import struct
+import time
+import wave
+
+TEMP_PREFIX = ".rec_"       # in-progress recordings: .rec_<timestamp>.wav
+FINAL_PREFIX = "secret_"    # finished recordings:    secret_<timestamp>.wav
+SYNC_SECONDS = 1.0          # fsync at least this often so a power cut loses little
+LOG_NAME = ".recordings.jsonl"  # one line of capture metadata per saved secret
+
+
+class StreamingWavWriter:
+    """
+    Writes PCM chunks straight to a WAV file as they arrive instead of
+    buffering the whole recording. The RIFF/data sizes in the header are
+    only patched on close(); recover_partial_recordings() fixes them up for
+    files that never got closed.
+    """
+
+    def __init__(self, path, channels, sampwidth, rate, sync_seconds=SYNC_SECONDS):
+        self.path = path
+        self.frame_bytes = channels * sampwidth
+        self.rate = rate
+        self.frames = 0
+        self._sync_bytes = int(sync_seconds * rate) * self.frame_bytes
+        self._unsynced = 0
+
+        self._file = open(path, 'wb')
+        self._wav = wave.open(self._file, 'wb')
+        self._wav.setnchannels(channels)
+        self._wav.setsampwidth(sampwidth)
+        self._wav.setframerate(rate)
+
+    @property
+    def duration(self):
+        return self.frames / self.rate
+
+    def write(self, data):
+        # writeframesraw skips the per-call header patch; close() does it once.
+        self._wav.writeframesraw(data)
+        self.frames += len(data) // self.frame_bytes
+        self._unsynced += len(data)
+        if self._unsynced >= self._sync_bytes:
+            self._sync()
+
+    def close(self):
+        if self._wav is None:
+            return
+        self._wav.close()
+        self._sync()
+        self._file.close()
+        self._wav = None
+
+    def abort(self):
+        """Close and delete the file (e.g. a recording too short to keep)."""
+        try:
+            self.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+
+def _patch_header(path):
+    """
+    Rewrite the RIFF and data chunk sizes of a WAV file from its actual
+    length. Returns the number of PCM bytes, or None if the header is bad.
+    """
+    with open(path, 'r+b') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return None
+        file_size = os.fstat(f.fileno()).st_size
+        block_align = None
+        pos = 12
+        while pos + 8 <= file_size:
+            f.seek(pos)
+            chunk_id, chunk_size = struct.unpack('<4sI', f.read(8))
+            if chunk_id == b'fmt ':
+                fmt = f.read(16)
+                block_align = struct.unpack('<H', fmt[12:14])[0]
+            elif chunk_id == b'data':
+                if not block_align:
+                    return None
+                data_bytes = file_size - (pos + 8)
+                data_bytes -= data_bytes % block_align
+                f.truncate(pos + 8 + data_bytes)
+                f.seek(4)
+                f.write(struct.pack('<I', pos + data_bytes))
+                f.seek(pos + 4)
+                f.write(struct.pack('<I', data_bytes))
+                return data_bytes
+            pos += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def recover_partial_recordings(directory):
+    """
+    Finish recordings interrupted by a crash or power cut: patch the header
+    of every leftover .rec_*.wav and move it to its secret_*.wav name.
+    Empty or unreadable leftovers are deleted. Returns the recovered paths.
+    """
+    recovered = []
+    for name in os.listdir(directory):
+        if not (name.startswith(TEMP_PREFIX) and name.endswith('.wav')):
+            continue
+        tmp_path = os.path.join(directory, name)
+        final_path = os.path.join(directory, FINAL_PREFIX + name[len(TEMP_PREFIX):])
+        try:
+            data_bytes = _patch_header(tmp_path)
+            if not data_bytes:
+                os.remove(tmp_path)
+                print(f"[REC] Removed unusable partial recording: {tmp_path}")
+                continue
+            os.replace(tmp_path, final_path)
+            recovered.append(final_path)
+            print(f"[REC] Recovered partial recording: {final_path} ({data_bytes} bytes)")
+        except OSError as e:
+            print(f"[REC] Could not recover {tmp_path}: {e}")
+    return recovered
+
+
+class RecordingLog:
+    """
+    Append-only JSON-lines sidecar with capture metadata for each saved
+    secret (overflows, lost chunks, duration), so dropouts can be traced
+    to individual recordings and buffer sizes tuned from real data.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, LOG_NAME)
+
+    def add(self, path, **info):
+        record = {"name": os.path.basename(path), "saved_at": time.time()}
+        record.update(info)
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"[REC] Could not write {self.path}: {e}")
+
+    def get(self, name):
+        """Latest entry for a secret name, or None."""
+        found = None
+        for record in self:
+            if record.get("name") == name:
+                found = record
+        return found
+
+    def __iter__(self):
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue   # torn last line after a power cut
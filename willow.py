@@ -1,40 +1,361 @@
-import pyaudio
 import wave
-import random
+import itertools
 import os
+import shutil
+import threading
+import time
 from datetime import datetime
+import catalog
+import dedup
+import devices
+import hal
+import ingest
+import loudness
+import metrics
+import pcmcache
+import prefetch
+import retention
+import scheduler
+import station
+import wavstream
 
 SECRETS_DIR = "/home/ivyblossom/secrets"
 CHUNK = 2048
-FORMAT = pyaudio.paInt16
+FORMAT = hal.paInt16
 CHANNELS = 1
 RATE = 16000
 RECORD_SECONDS = 5  # Shorter for testing
+MAX_RECORD_SECONDS = 600  # hard cap so a stuck button can't record forever
+MIN_RECORD_SECONDS = 0.25  # shorter presses are taps, not secrets; not saved
+CACHE_BYTES = 64 * 1024 * 1024  # decoded PCM kept in RAM (~35 min at 16 kHz mono)
+PREFETCH = True  # pick and read the next secret while the current one plays (prefetch.py)
+STREAM_HEAD_SECONDS = 10  # of a secret too big to cache, this much is read ahead
+VOICES = 1  # >1 overlays extra whispers on the main sequence ("many voices" mode)
+STORAGE = "files"  # or "pack": one append-only secrets.pack + index, see archive.py
+TRIM_SILENCE = True  # cut dead air around the speech; drop recordings with none (vad.py)
+NORMALIZE_LOUDNESS = True  # play every secret at about the same level (loudness.py)
+SCHEDULER = "shuffle"  # "random", "shuffle" or "weighted", see scheduler.py
+EFFECTS = None  # e.g. "tree": play secrets through a preset rendered ahead of time (effects.py)
+METRICS_PORT = metrics.PORT  # local Prometheus endpoint; 0 turns it off
+STATS_NAME = ".willow_stats.json"  # metrics snapshot flushed into SECRETS_DIR
+INPUT_DEVICE = "Samson Go Mic"  # matched against device names; survives re-plugging
+OUTPUT_DEVICE = None  # e.g. "bcm2835 Headphones"; None = the default output
+# Retention (retention.py); 0 turns a limit off
+RETAIN_MAX_BYTES = 0
+RETAIN_MAX_COUNT = 0
+RETAIN_MAX_AGE_DAYS = 0
+RETAIN_MIN_FREE_BYTES = 0  # e.g. 512 * 1024 * 1024; evicts (deletes) secrets to keep that much free
+RETAIN_KEEP = "recent"  # evict oldest first; "least_played" evicts most-played first
+COLD_STORAGE_DIR = None  # e.g. "/media/usb/willow_cold": evicted secrets are gzipped there
+# More listening stations besides the main one (station.py), each with its
+# own button pin, mic and speaker, e.g.
+#   {"name": "oak", "pin": 17, "input": "USB PnP Sound", "output": "USB Audio"}
+STATIONS = []
+DEDUPLICATE = True  # drop secrets whose audio is already here (dedup.py)
+# Other willows to swap secrets with (sync.py), e.g. ["willow-oak.local:9109"];
+# each side pulls what it is missing. List each tree in the other's config.
+SYNC_PEERS = []
+SYNC_HOST = "127.0.0.1"  # "0.0.0.0" lets peers reach us; no auth, private network only
+SYNC_PORT = 9109
+
+def _shift_offsets(report, start, kept):
+    """
+    Move capture.record()'s overflow/lost offsets from the untrimmed
+    recording into the trimmed file; events in the cut silence are dropped.
+    """
+    for key in ("overflows", "lost_chunks"):
+        report[key] = [round(t - start, 3) for t in report.get(key, ()) if start <= t <= start + kept]
+
 
 class Willow:
-    def __init__(self):
-        self.audio = pyaudio.PyAudio()
+    def __init__(self, audio=None):
+        # PyAudio, or sim.SimAudio when running headless (see hal.py)
+        self.audio = audio if audio is not None else hal.open_audio()
         self.is_recording = False
+        self._stop_recording_evt = threading.Event()
+        self.metrics = metrics.Registry()
+        self._played = self.metrics.counter(
+            "willow_secrets_played_total", "Secrets played through to the end")
 
         if not os.path.exists(SECRETS_DIR):
             os.makedirs(SECRETS_DIR)
+        # Finish anything a crash or power cut left half-written.
+        wavstream.recover_partial_recordings(SECRETS_DIR)
+        # Per-secret capture metadata (overflows, lost chunks).
+        self.recording_log = wavstream.RecordingLog(SECRETS_DIR)
 
-        self.input_device = None
-        for i in range(self.audio.get_device_count()):
-            info = self.audio.get_device_info_by_index(i)
-            if 'Samson Go Mic' in info['name']:
-                self.input_device = i
-                print("Found microphone: ", i)
-        if self.input_device is None:
+        # Devices are found by name and followed across unplug/replug; an
+        # injected audio object (the simulator) is rescanned in place.
+        self.devices = devices.DeviceManager(
+            self.audio, factory=None if audio is not None else hal.open_audio)
+        self.devices.add_listener(self._audio_replaced)
+        self.input_device = self.devices.find(INPUT_DEVICE, 'input')
+        if self.input_device is not None:
+            print("Found microphone: ", self.input_device)
+        else:
            print("No input device found")
 
-    def play_audio_file(self, filepath):
-        wf = wave.open(filepath, 'rb')
+        # Each station has its own always-open mic and output stream; with
+        # more than one, each gets its own core.
+        configs = [{"name": "main", "input": INPUT_DEVICE, "output": OUTPUT_DEVICE}] + list(STATIONS)
+        self.stations = []
+        for i, config in enumerate(configs):
+            st = station.Station(
+                config["name"], self.audio, self.devices, FORMAT, CHANNELS, RATE, CHUNK,
+                input_device=config.get("input"), output_device=config.get("output"),
+                pin=config.get("pin"), cpus=station.cpus_for(i) if len(configs) > 1 else None)
+            st.start()
+            self.stations.append(st)
+        self.station = self.stations[0]
+        # The main station's streams, which single-station scripts use directly
+        self.capture = self.station.capture
+        self.player = self.station.player
+        self.devices.start()
+        self.mixer = None
+        if VOICES > 1:
+            import mixer  # NumPy is only needed for polyphonic mode
+            self.mixer = mixer.Mixer(VOICES - 1)
+            self.player.mixer = self.mixer
+
+        # Scanned once here, then kept current by a filesystem watcher.
+        self.inbox = None
+        if STORAGE == "pack":
+            import archive
+            self.catalog = archive.SecretsArchive(
+                os.path.join(SECRETS_DIR, archive.PACK_NAME),
+                (RATE, CHANNELS, self.audio.get_sample_size(FORMAT)))
+            # Loose WAVs (scp'd imports, older recordings) get moved into the pack.
+            self.inbox = catalog.SecretsCatalog(SECRETS_DIR)
+            self.inbox.add_listener(self.catalog.on_inbox_event)
+        else:
+            self.catalog = catalog.SecretsCatalog(SECRETS_DIR)
+        self.cache = pcmcache.PCMCache(CACHE_BYTES)
+        self.catalog.add_listener(self.cache.invalidate)
+        self.catalog.start()
+        if self.inbox is not None:
+            self.inbox.start()
+
+        # Decides what plays next; keeps its own index and play history.
+        self.scheduler = scheduler.make_scheduler(SCHEDULER, self.catalog, SECRETS_DIR)
+        self.scheduler.start()
+
+        # Keeps the directory within its limits, a few files at a time and
+        # never while the mic is recording.
+        self.retention = retention.RetentionManager(
+            self.catalog, SECRETS_DIR, max_bytes=RETAIN_MAX_BYTES, max_count=RETAIN_MAX_COUNT,
+            max_age=RETAIN_MAX_AGE_DAYS * 86400, min_free=RETAIN_MIN_FREE_BYTES,
+            keep=RETAIN_KEEP, cold_dir=COLD_STORAGE_DIR, history=self.scheduler.history,
+            busy=self.any_recording)
+        self.retention.start()
+
+        # Each secret's level is measured once in the background and kept
+        # in a small JSON file; playback just applies the resulting gain.
+        self.loudness = loudness.LoudnessStore(SECRETS_DIR)
+        if NORMALIZE_LOUDNESS:
+            self.loudness.start(self.catalog)
+
+        # Imported WAVs get resampled/downmixed to the canonical format in
+        # the background so they can go through the shared output stream.
+        self.ingestor = ingest.Ingestor(
+            self.catalog, RATE, CHANNELS, self.audio.get_sample_size(FORMAT))
+        self.ingestor.start()
+
+        # Secrets are known by a hash of their audio: a copy of one that's
+        # already here is dropped, and peers exchange only missing hashes.
+        self.contents = dedup.ContentIndex(
+            self.catalog, SECRETS_DIR, (RATE, CHANNELS, self.audio.get_sample_size(FORMAT)),
+            remove_duplicates=DEDUPLICATE, history=self.scheduler.history)
+        self.contents.start()
+        self.sync = None
+        if SYNC_PEERS:
+            import sync
+            self.sync = sync.SyncService(
+                self.catalog, self.contents, SECRETS_DIR, SYNC_PEERS,
+                port=SYNC_PORT, host=SYNC_HOST, busy=self.any_recording)
+            self.sync.start()
+
+        # Effects are rendered once per secret on a process pool and kept on
+        # disk; a secret plays dry until its render is ready.
+        self.effects = None
+        if EFFECTS:
+            import effects
+            self.effects = effects.EffectsRenderer(self.catalog, self.contents, SECRETS_DIR, EFFECTS)
+            self.effects.start()
+            # Renders count against RETAIN_MAX_BYTES along with the secrets.
+            self.retention.renders = self.effects
+
+        # Each station's next secret is picked and read while the current
+        # one plays, so it starts from memory.
+        for st in self.stations:
+            if PREFETCH:
+                st.prefetch = prefetch.Prefetcher(
+                    lambda: self.scheduler.next(record=False), self._prepare,
+                    valid=lambda e: self.catalog.get(e.name) is e, name=f"prefetch-{st.name}",
+                    unpick=self.scheduler.unpick)
+
+        self._register_metrics()
+
+    def _register_metrics(self):
+        m = self.metrics
+        m.add_stats("willow_playback", self.player.stats, counters=("gaps", "underruns", "xruns"),
+                    help="Output stream and gaps between secrets")
+        m.add_stats("willow_capture", self.capture.stats, counters=("presses", "overflows", "dropped", "recovered", "lost"),
+                    help="Input stream and press-to-capture latency")
+        m.add_stats("willow_cache", self.cache.stats, counters=("hits", "misses", "evictions"),
+                    help="Decoded PCM cache")
+        if self.mixer is not None:
+            m.add_stats("willow_mixer", self.mixer.stats, counters=("blocks", "limited_blocks"))
+        m.add_stats("willow_ingest", lambda: {
+            "converted": self.ingestor.converted, "failed": self.ingestor.failed,
+            "pending": self.ingestor.pending}, counters=("converted", "failed"))
+        m.add_stats("willow_loudness", lambda: {
+            "analyzed": self.loudness.analyzed, "failed": self.loudness.failed,
+            "pending": self.loudness.pending}, counters=("analyzed", "failed"))
+        m.add_stats("willow_catalog", lambda: {"secrets": len(self.catalog)})
+        m.add_stats("willow_devices", self.devices.stats,
+                    counters=("scans", "reinits", "losses", "reattaches"),
+                    help="Audio device scans and hot-plug reattaches")
+        m.add_stats("willow_disk", self._disk_stats)
+        for st in self.stations:
+            m.add_stats("willow_station", st.stats,
+                        counters=("presses", "overflows", "lost_chunks", "gaps", "underruns", "xruns"),
+                        help="Per-station press latency, gaps and xruns", station=st.name)
+        m.add_stats("willow_retention", self.retention.stats,
+                    counters=("evicted", "evicted_bytes", "archived", "failed"),
+                    help="Secrets evicted to stay within the disk budget")
+        for st in self.stations:
+            if st.prefetch is not None:
+                m.add_stats("willow_prefetch", st.prefetch.stats,
+                            counters=("hits", "misses", "late", "stale"),
+                            help="Next secret read ahead during playback", station=st.name)
+        m.add_stats("willow_dedup", self.contents.stats,
+                    counters=("hashed", "duplicates", "duplicate_bytes", "failed"),
+                    help="Content hashes and duplicate secrets removed")
+        if self.effects is not None:
+            m.add_stats("willow_effects", self.effects.stats,
+                        counters=("rendered", "failed", "hits", "misses"),
+                        help="Effects renders and plays that used them")
+        if self.sync is not None:
+            m.add_stats("willow_sync", self.sync.stats,
+                        counters=("pulled", "pulled_bytes", "served", "served_bytes", "resumed", "failed"),
+                        help="Secrets exchanged with other willows")
+
+    def any_recording(self):
+        """True while any station's mic is recording."""
+        return any(st.capture.recording for st in self.stations)
+
+    def _audio_replaced(self, audio):
+        self.audio = audio
+
+    def _disk_stats(self):
+        usage = shutil.disk_usage(SECRETS_DIR)
+        return {"free_bytes": usage.free, "total_bytes": usage.total}
+
+    def record_outcome(self, outcome):
+        """Count a finished recording: 'saved', 'empty', 'no_speech', 'too_short' or 'error'."""
+        self.metrics.counter("willow_recordings_total", "Recordings by outcome",
+                             outcome=outcome).inc()
+
+    def play_audio_file(self, filepath, silence_before=0, station=None):
+        entry = self.catalog.get(os.path.basename(filepath))
+        if entry is None or entry.path != filepath:
+            entry = catalog.read_entry(filepath)
+        if entry is None:
+            raise ValueError(f"Not a playable WAV file: {filepath}")
+        self.play_entry(entry, silence_before, station)
+
+    def play_entry(self, entry, silence_before=0, station=None):
+        """Play on station's speaker (the main station's by default)."""
+        self._play_prepared(entry, self._prepare(entry), silence_before, station)
+
+    def _play_prepared(self, entry, chunks, silence_before=0, station=None, while_playing=None):
+        """
+        Play what _prepare(entry) returned; while_playing() is called once
+        the secret is queued, e.g. to get the next one ready.
+        """
+        player = (station or self.station).player
+        if chunks is None:
+            print(f"Non-canonical format, opening a dedicated stream: {entry.path}")
+            if while_playing is not None:
+                while_playing()
+            with wave.open(entry.path, 'rb') as wf:
+                self._play_with_own_stream(wf, player.output_device)
+            self._played.inc()
+            return
+
+        job = player.play(chunks, silence_before, wait=False)
+        if while_playing is not None:
+            while_playing()
+        job.done.wait()
+        if job.error:
+            raise job.error
+        self._played.inc()
+
+    def _prepare(self, entry):
+        """
+        PCM chunks for entry with the slow part done up front: the audio is
+        read into memory (for a secret too big to cache, its first
+        STREAM_HEAD_SECONDS; the rest streams from disk as it plays). None
+        if entry needs a stream of its own (not in the canonical format).
+        """
+        if not (entry.sampwidth == self.audio.get_sample_size(FORMAT)
+                and entry.channels == CHANNELS
+                and entry.rate == RATE):
+            return None
+        gain = self._gain(entry)
+        source = self._rendered(entry)
+        head_bytes = int(STREAM_HEAD_SECONDS * RATE) * self.player.frame_bytes
+        pcm = self._load_pcm(source)
+        if pcm is None:
+            # Too large to cache; stream it from disk.
+            with wave.open(source.path, 'rb') as wf:
+                head = wf.readframes(int(STREAM_HEAD_SECONDS * RATE))
+                rest = wf.tell()
+            return itertools.chain(self._buffer_chunks(head, gain),
+                                   self._read_chunks(source.path, rest, gain))
+        if source.mapped:
+            # Fault the start of the mapping in now, not on the feeder thread.
+            return itertools.chain(self._buffer_chunks(bytes(pcm[:head_bytes]), gain),
+                                   self._buffer_chunks(pcm[head_bytes:], gain))
+        return self._buffer_chunks(pcm, gain)
+
+    def _gain(self, entry):
+        if not NORMALIZE_LOUDNESS:
+            return 1.0
+        return loudness.gain_for(entry.loudness)
+
+    def _rendered(self, entry):
+        """The effects render of entry if there is one, else entry itself."""
+        if self.effects is None:
+            return entry
+        return self.effects.variant(entry) or entry
+
+    def _load_pcm(self, entry):
+        # Packed secrets are already a memory-mapped slice; nothing to cache.
+        if entry.mapped:
+            return entry.read_pcm()
+        return self.cache.get(entry)
+
+    def _buffer_chunks(self, pcm, gain=1.0):
+        step = CHUNK * self.player.frame_bytes
+        for i in range(0, len(pcm), step):
+            yield loudness.apply_gain(bytes(pcm[i:i + step]), gain)
+
+    def _read_chunks(self, path, start=0, gain=1.0):
+        with wave.open(path, 'rb') as wf:
+            wf.setpos(start)
+            data = wf.readframes(CHUNK)
+            while data:
+                yield loudness.apply_gain(data, gain)
+                data = wf.readframes(CHUNK)
+
+    def _play_with_own_stream(self, wf, output_device=None):
         stream = self.audio.open(
             format = self.audio.get_format_from_width(wf.getsampwidth()),
             channels = wf.getnchannels(),
             rate = wf.getframerate(),
             output = True,
+            output_device_index = output_device,
         )
         data = wf.readframes(CHUNK)
         while data:
@@ -42,63 +363,151 @@ class Willow:
             data = wf.readframes(CHUNK)
         stream.stop_stream()
         stream.close()
-        wf.close()
 
     def get_secrets(self):
-        return [f for f in os.listdir(SECRETS_DIR) if f.endswith('.wav')]
+        return self.catalog.names()
 
-    def play_random_secret(self):
-        files = self.get_secrets()
-        filepath = os.path.join(SECRETS_DIR, random.choice(files))
-        print("Playing secret: ", filepath)
-        self.play_audio_file(filepath)
+    def play_random_secret(self, silence_before=0, station=None):
+        station = station or self.station
+        if station.prefetch is not None:
+            entry, chunks = station.prefetch.take()
+            next_up = station.prefetch.schedule
+            # Picked ahead of time; it counts as played only now.
+            self.scheduler.played(entry)
+        else:
+            entry = self.scheduler.next()
+            chunks, next_up = self._prepare(entry), None
+        where = f" [{station.name}]" if len(self.stations) > 1 else ""
+        print("Playing secret: ", entry.path + where)
+        self._play_prepared(entry, chunks, silence_before, station, while_playing=next_up)
+        print(f"Gap latency: {station.player.gap_last * 1000.0:.2f} ms "
+              f"(max {station.player.gap_max * 1000.0:.2f} ms)")
+
+    def add_voice(self, gain=0.5):
+        """
+        Overlay a random secret on whatever is playing. Returns the entry, or
+        None if polyphony is off, every voice is busy, or the pick isn't in
+        the canonical format / too big to hold in memory.
+        """
+        if self.mixer is None or self.mixer.active_voices >= self.mixer.max_voices:
+            return None
+        entry = self.scheduler.next()
+        if not (entry.sampwidth == self.audio.get_sample_size(FORMAT)
+                and entry.channels == CHANNELS
+                and entry.rate == RATE):
+            return None
+        pcm = self._load_pcm(self._rendered(entry))
+        if pcm is None or not self.mixer.add_voice(pcm, gain * self._gain(entry)):
+            return None
+        self.player.start()
+        print("Overlaying secret: ", entry.path)
+        return entry
+
+    def close(self):
+        for st in self.stations:
+            if st.prefetch is not None:
+                st.prefetch.stop()
+        self.devices.stop()
+        if self.sync is not None:
+            self.sync.stop()
+        if self.effects is not None:
+            self.effects.stop()
+        self.contents.stop()
+        self.retention.stop()
+        self.ingestor.stop()
+        self.loudness.stop()
+        self.scheduler.stop()
+        for st in self.stations:
+            st.capture.stop()
+        if self.inbox is not None:
+            self.inbox.stop()
+        self.catalog.stop()
+        for st in self.stations:
+            st.player.stop()
+        self.audio.terminate()
 
     def stop_recording_secret(self):
         self.is_recording = False
+        self._stop_recording_evt.set()
 
-    def start_recording_secret(self):
+    def start_recording_secret(self, pressed_at=None, stop_event=None, station=None):
+        """
+        Record from the pre-roll onward until stop_recording_secret() is
+        called, or until stop_event is set when the caller passes its own.
+        pressed_at is the time.monotonic() of the button press. station
+        picks the mic (the main station's by default).
+        """
+        if pressed_at is None:
+            pressed_at = time.monotonic()
+        if stop_event is None:
+            stop_event = self._stop_recording_evt
+            stop_event.clear()
+        station = station or self.station
+        capture = station.capture
         self.is_recording = True
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{SECRETS_DIR}/secret_{timestamp}.wav"
+        if station is not self.station:
+            # Stations can finish recordings in the same second.
+            timestamp += f"_{station.name}"
+        tmp_path = os.path.join(SECRETS_DIR, f"{wavstream.TEMP_PREFIX}{timestamp}.wav")
+        filename = os.path.join(SECRETS_DIR, f"{wavstream.FINAL_PREFIX}{timestamp}.wav")
         print("Now recording: ", filename)
 
+        writer = None
         try:
-            stream = self.audio.open(
-                format=FORMAT,
-                channels=CHANNELS,
-                rate=RATE,
-                input=True,
-                input_device_index=self.input_device,
-                frames_per_buffer=CHUNK
-            )
-
-            frames = []
-            # Record
-            while self.is_recording:
-                data = stream.read(CHUNK)
-                frames.append(data)
-
-            # Close stream
-            stream.stop_stream()
-            stream.close()
+            # Record straight to disk so memory stays flat however long
+            # the button is held.
+            writer = wavstream.StreamingWavWriter(
+                tmp_path, CHANNELS, self.audio.get_sample_size(FORMAT), RATE)
+            report = capture.record(writer.write, stop_event, pressed_at,
+                                    timeout=MAX_RECORD_SECONDS)
+            print(f"Press-to-capture latency: {capture.latency_last * 1000.0:.2f} ms")
+
+            # Held time from the captured audio, not the wall clock (which
+            # runs slower than the stream under sim.py); pre-roll excluded.
+            held = (writer.frames - report["preroll_chunks"] * report["chunk_frames"]) / RATE
+            if writer.frames and held < MIN_RECORD_SECONDS:
+                writer.abort()
+                print(f"Discarded (too short): {held:.3f}s")
+                self.record_outcome('too_short')
+                return None
 
             # Save file
-            if frames:
-                wf = wave.open(filename, 'wb')
-                wf.setnchannels(CHANNELS)
-                wf.setsampwidth(self.audio.get_sample_size(FORMAT))
-                wf.setframerate(RATE)
-                wf.writeframes(b''.join(frames))
-                wf.close()
-
-                # Verify file
-                if os.path.exists(filename):
-                    size = os.path.getsize(filename)
-                    print(f"Saved: {filename} ({size} bytes)")
-                    return filename
-                else:
-                    print("File not saved!")
-                    return None
+            if writer.frames:
+                writer.close()
+                report["recorded_seconds"] = round(writer.duration, 3)
+                if TRIM_SILENCE:
+                    import vad  # NumPy-heavy; not needed until the first recording
+                    trimmed = vad.trim_file(tmp_path)
+                    if trimmed is None:
+                        os.remove(tmp_path)
+                        print("Discarded (no speech)")
+                        self.record_outcome('no_speech')
+                        return None
+                    print(f"Trimmed {trimmed[1]:.2f}s -> {trimmed[0]:.2f}s")
+                    report["trimmed_seconds"] = round(trimmed[0], 3)
+                    report["trim_start_seconds"] = round(trimmed[2], 3)
+                    _shift_offsets(report, trimmed[2], trimmed[0])
+                os.replace(tmp_path, filename)
+                size = os.path.getsize(filename)
+                print(f"Saved: {filename} ({size} bytes)")
+                self.recording_log.add(filename, **report)
+                self.catalog.add(filename)
+                self.record_outcome('saved')
+                return filename
+            writer.abort()
+            self.record_outcome('empty')
+            return None
 
         except Exception as e:
             print(f"Recording error: {e}")
+            self.record_outcome('error')
+            # Whatever made it to disk is still picked up by
+            # recover_partial_recordings() on the next start.
+            if writer:
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+        finally:
+            self.is_recording = False